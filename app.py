@@ -1,14 +1,31 @@
 from flask import Flask, request, jsonify, render_template, redirect, url_for
 from flask_cors import CORS
-from openai import OpenAI
 import os
 import json
+import re
 import time
+import random
+import uuid
+import atexit
+from dataclasses import asdict
 from datetime import datetime
 
 # Импорт модулей для работы с задачами и тестированием
-from coding_tasks import CodingTaskGenerator, CodingTask
-from code_runner import CodeRunner, CodeAnalyzer
+from coding_tasks import CodingTaskGenerator, CodingTask, TestCase
+from code_runner import CodeRunner, CodeAnalyzer, ResultCache
+import sandbox_pool
+from judge_queue import JudgeBusyError, JudgeQueue, SQLiteJobLog
+from complexity_estimator import ComplexityEstimator
+from task_pool import TaskPool, TaskPrefetcher
+from task_bank import TaskBank
+from task_validator import TaskValidator
+from llm_gateway import LLMGateway
+from circuit_breaker import CircuitBreaker
+from llm_cache import LLMCache, normalize_text
+from content_store import ContentStore
+from session_store import (MemorySessionStore, SQLiteSessionStore, SessionArchive, SessionRetention,
+                           SessionBusyError)
+from session_journal import SessionJournal
 
 app = Flask(__name__)
 CORS(app)
@@ -16,36 +33,194 @@ CORS(app)
 # Конфигурация
 class Config:
     # Настройки из документации SciBox
-    LLM_BASE_URL = "https://llm.t1v.scibox.tech/v1"
+    # LLM_BASE_URL=http://127.0.0.1:8001/v1 - локальная заглушка (mock_llm_server.py)
+    LLM_BASE_URL = os.environ.get('LLM_BASE_URL', "https://llm.t1v.scibox.tech/v1")
     LLM_MODEL = "qwen3-coder-30b-a3b-instruct-fp8"  # Специализированная модель для кода
-    LLM_TOKEN = "sk--hwyMZDmxjPMm50_5LXTiA"  # ⚠️ ЗАМЕНИТЕ НА ВАШ РЕАЛЬНЫЙ ТОКЕН ⚠️
+    LLM_TOKEN = os.environ.get('LLM_TOKEN', "sk--hwyMZDmxjPMm50_5LXTiA")  # ⚠️ ЗАМЕНИТЕ НА ВАШ РЕАЛЬНЫЙ ТОКЕН ⚠️
     
     # Параметры запроса (оптимизированы для скорости)
     TEMPERATURE = 0.7
     TOP_P = 0.9
     MAX_TOKENS = 500  # Уменьшено с 1000 для ускорения
     
+    # Шлюз к LLM: общий пул соединений и лимиты по назначению запроса
+    LLM_MAX_CONNECTIONS = 32  # Соединений в пуле на процесс
+    LLM_MAX_RETRIES = 1
+    LLM_QUEUE_TIMEOUT = 30  # Сколько секунд запрос ждет свободного слота
+    LLM_COALESCE = True  # Одинаковые одновременные запросы обслуживаются одним вызовом LLM
+    LLM_CONCURRENCY = {
+        'question': 8,
+        'evaluation': 8,
+        'task_generation': 6,
+        'summary': 4,
+        'diagnostics': 2
+    }
+    LLM_TIMEOUTS = {  # Срок ответа на вызов (ожидание слота, запрос, страховка), секунд
+        'question': 20,
+        'evaluation': 30,
+        'task_generation': 60,
+        'summary': 60,
+        'diagnostics': 20
+    }
+    LLM_LATENCY_SLO = {  # p95 задержки, при превышении которого цепь размыкается, секунд
+        'question': 8,
+        'evaluation': 12,
+        'task_generation': 40,
+        'summary': 30,
+        'diagnostics': 10
+    }
+    LLM_BREAKER_ERROR_RATE = 0.5  # Доля ошибок в окне, при которой цепь размыкается
+    LLM_BREAKER_WINDOW = 50  # Последних вызовов в окне
+    LLM_BREAKER_MIN_CALLS = 10  # Меньше вызовов в окне - цепь не размыкается
+    LLM_BREAKER_OPEN_SEC = 30  # Сколько секунд сразу отдавать резервные ответы
+    LLM_HEDGE_AFTER = {  # Через сколько секунд без ответа послать страхующий запрос
+        'question': 4,
+        'evaluation': 6
+    }
+    LLM_CACHE_MAX_BYTES = 8 * 1024 * 1024  # Кэш оценок и вопросов (0 - без кэша)
+    LLM_CACHE_TTL = 6 * 3600  # Секунд жизни записи кэша
+    QUESTION_BUCKET_SIZE = 20  # Вопросов на (должность, уровень), после которых LLM не спрашиваем
+    
     # Настройки приложения
     INTERVIEW_DURATION = 30
     MAX_QUESTIONS = 0  # Теоретических вопросов (отключены)
     MAX_CODING_TASKS = 10  # Задач по программированию
     TOTAL_QUESTIONS = 10  # Всего заданий
+    
+    # Песочница для запуска кода кандидатов
+    SANDBOX_POOL_SIZE = 4  # Процессов-песочниц (бюджет ядер) на один веб-воркер
+    SANDBOX_MAX_JOBS_PER_WORKER = 50  # После стольких заданий процесс перезапускается
+    SANDBOX_MAX_SHARDS_PER_JOB = 2  # Тесты одного решения выполняются максимум в стольких процессах
+    RESULT_CACHE_SIZE = 1024  # Результатов проверки в LRU кэше (0 - без кэша)
+    
+    # Оценка асимптотической сложности решений
+    COMPLEXITY_ESTIMATION_LEVELS = ["Middle", "Senior", "Team Lead"]
+    COMPLEXITY_TIME_BUDGET = 3.0  # Секунд на оценку одного решения
+    
+    # Фоновая проверка решений (/api/submit_code с "async": true)
+    JUDGE_WORKERS = 4  # Потоков проверки на один веб-воркер
+    JUDGE_JOB_TTL = 600  # Сколько секунд хранить результат завершенной проверки
+    
+    # Пул заранее сгенерированных задач
+    TASK_POOL_DEPTH = 2  # Готовых задач в каждой корзине (0 - генерировать только по запросу)
+    TASK_POOL_WORKERS = 2  # Фоновых потоков генерации
+    # При старте заказать первую задачу для всех должностей и уровней. Выполняет один воркер
+    # (захват через банк задач, не чаще раза в TASK_POOL_PREWARM_INTERVAL секунд) и только
+    # для корзин, которые банк еще не покрывает
+    TASK_POOL_PREWARM = False
+    TASK_POOL_PREWARM_INTERVAL = 3600
+    PREFETCH_WORKERS = 16  # Потоков упреждающей генерации задач (общие для всех сессий)
+    INTERVIEW_FAN_OUT = False  # Генерировать все задачи собеседования на старте ("fan_out" в запросе)
+    FAN_OUT_CONCURRENCY = 5  # Одновременных генераций на одну сессию при fan-out
+    
+    # Постоянный банк сгенерированных задач
+    TASK_BANK_PATH = "task_bank.db"  # Пустая строка - без банка
+    TASK_BANK_MIN_VARIETY = 5  # Пока в корзине меньше задач, банк пополняется через LLM
+    TASK_BANK_REFRESH_PROBABILITY = 0.05  # Доля новых задач через LLM и в заполненной корзине
+    # Отдельные процессы-песочницы для эталонных решений: проверка задач
+    # не занимает песочницы, в которых проверяются решения кандидатов
+    TASK_VALIDATION_SANDBOX_SIZE = 1
+    
+    # Хранилище сессий: 'memory' - в процессе, 'sqlite' - общее для воркеров gunicorn
+    SESSION_STORE = os.environ.get('SESSION_STORE', 'memory')
+    SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', 'sessions.db')
+    SESSION_LEASE_SEC = 150  # Срок аренды сессии запросом (больше таймаута gunicorn)
+    SESSION_LOCK_TIMEOUT = 130  # Сколько секунд запрос ждет сессию, занятую другим запросом
+    SESSION_IDLE_TTL = 2 * 3600  # Незавершенная сессия без изменений вытесняется через 2 часа
+    SESSION_FINISHED_TTL = 3600  # Завершенная - через час
+    SESSION_MAX_BYTES = 64 * 1024 * 1024  # Сверх лимита вытесняются давно не использованные завершенные
+    SESSION_SWEEP_INTERVAL = 60  # Как часто проверять сроки сессий
+    SESSION_ARCHIVE_DIR = os.environ.get('SESSION_ARCHIVE_DIR', 'session_archive')  # Пустая строка - без архива
+    # Журнал изменений сессий в памяти: восстановление после перезапуска воркера.
+    # Только Unix и один процесс: при нескольких воркерах журнал ведет первый из них
+    SESSION_JOURNAL_DIR = os.environ.get('SESSION_JOURNAL_DIR', 'session_journal')  # Пустая строка - без журнала
+    SESSION_JOURNAL_FSYNC_INTERVAL = 0.05  # fsync пачкой раз в 50 мс
+    SESSION_JOURNAL_SEGMENT_BYTES = 16 * 1024 * 1024  # После сегмента журнала - новый снимок
+    
+    # asgi.py: потоки для маршрутов Flask, не переведенных на asyncio (страницы, короткие API)
+    ASGI_WSGI_THREADS = 16
 
 app.config.from_object(Config)
 
-# Инициализация OpenAI клиента
-client = OpenAI(
-    api_key="sk--hwyMZDmxjPMm50_5LXTiA",
-    base_url=Config.LLM_BASE_URL
+# Инициализация шлюза к LLM (единственный OpenAI клиент приложения)
+llm = LLMGateway(
+    base_url=Config.LLM_BASE_URL,
+    api_key=Config.LLM_TOKEN,
+    model=Config.LLM_MODEL,
+    concurrency=Config.LLM_CONCURRENCY,
+    timeouts=Config.LLM_TIMEOUTS,
+    max_connections=Config.LLM_MAX_CONNECTIONS,
+    queue_timeout=Config.LLM_QUEUE_TIMEOUT,
+    max_retries=Config.LLM_MAX_RETRIES,
+    coalesce=Config.LLM_COALESCE,
+    breakers={
+        purpose: CircuitBreaker(
+            latency_slo=slo,
+            error_rate=Config.LLM_BREAKER_ERROR_RATE,
+            window=Config.LLM_BREAKER_WINDOW,
+            min_calls=Config.LLM_BREAKER_MIN_CALLS,
+            open_sec=Config.LLM_BREAKER_OPEN_SEC
+        )
+        for purpose, slo in Config.LLM_LATENCY_SLO.items()
+    },
+    hedge_after=Config.LLM_HEDGE_AFTER,
+    default_params={
+        'temperature': Config.TEMPERATURE,
+        'top_p': Config.TOP_P,
+        'max_tokens': Config.MAX_TOKENS
+    }
+)
+llm_cache = LLMCache(Config.LLM_CACHE_MAX_BYTES, Config.LLM_CACHE_TTL) if Config.LLM_CACHE_MAX_BYTES > 0 else None
+
+# Инициализация раннера кода и генератора задач
+sandbox = None
+if sandbox_pool.is_supported() and Config.SANDBOX_POOL_SIZE > 0:
+    sandbox = sandbox_pool.SandboxPool(
+        size=Config.SANDBOX_POOL_SIZE,
+        max_jobs_per_worker=Config.SANDBOX_MAX_JOBS_PER_WORKER,
+        max_shards_per_job=Config.SANDBOX_MAX_SHARDS_PER_JOB
+    )
+validation_sandbox = None
+if sandbox_pool.is_supported() and Config.TASK_VALIDATION_SANDBOX_SIZE > 0:
+    validation_sandbox = sandbox_pool.SandboxPool(
+        size=Config.TASK_VALIDATION_SANDBOX_SIZE,
+        max_jobs_per_worker=Config.SANDBOX_MAX_JOBS_PER_WORKER,
+        max_shards_per_job=1
+    )
+result_cache = ResultCache(Config.RESULT_CACHE_SIZE) if Config.RESULT_CACHE_SIZE > 0 else None
+code_runner = CodeRunner(sandbox_pool=sandbox, result_cache=result_cache)
+# Отдельный раннер без кэша: замеры времени не должны попадать в кэш результатов
+complexity_estimator = ComplexityEstimator(
+    CodeRunner(sandbox_pool=sandbox),
+    time_budget=Config.COMPLEXITY_TIME_BUDGET
 )
-
-# Инициализация генератора задач и раннера кода
-task_generator = CodingTaskGenerator(client)
-code_runner = CodeRunner()
 code_analyzer = CodeAnalyzer()
 
+# Генерация задач: потоки пула запускаются после пула песочниц (он использует fork)
+task_bank = TaskBank(Config.TASK_BANK_PATH) if Config.TASK_BANK_PATH else None
+task_validator = TaskValidator(CodeRunner(sandbox_pool=validation_sandbox))
+task_generator = CodingTaskGenerator(
+    llm,
+    task_bank=task_bank,
+    bank_min_variety=Config.TASK_BANK_MIN_VARIETY,
+    bank_refresh_probability=Config.TASK_BANK_REFRESH_PROBABILITY,
+    validator=task_validator
+)
+task_pool = TaskPool(
+    task_generator,
+    target_depth=Config.TASK_POOL_DEPTH,
+    workers=Config.TASK_POOL_WORKERS
+)
+task_prefetcher = TaskPrefetcher(task_pool, workers=Config.PREFETCH_WORKERS)
+
 # Модель данных
 class InterviewSession:
+    # Сессий много и они живут часами: без __dict__ на каждый объект
+    __slots__ = ('session_id', 'position', 'level', 'interview_type', 'company_type', 'questions_asked',
+                 'user_answers', 'current_question', 'start_time', 'is_active', 'question_count',
+                 'coding_task_count', 'coding_tasks', 'current_coding_task', 'coding_submissions',
+                 'interview_mode', 'blobs')
+    
     def __init__(self, session_id, position, level, interview_type, company_type):
         self.session_id = session_id
         self.position = position
@@ -53,6 +228,7 @@ class InterviewSession:
         self.interview_type = interview_type
         self.company_type = company_type
         self.questions_asked = []
+        # Ответы на вопросы; решения задач - ссылки {'type': 'coding', 'submission': номер}
         self.user_answers = []
         self.current_question = None
         self.start_time = datetime.now()
@@ -62,9 +238,166 @@ class InterviewSession:
         # Добавляем поля для задач программирования
         self.coding_tasks = []
         self.current_coding_task = None
+        # Компактные записи решений: код и результаты тестов - ссылки в blobs
         self.coding_submissions = []
+        self.blobs = ContentStore()
         # Режим собеседования: 'mixed' - чередование вопросов и задач
         self.interview_mode = 'mixed'
+    
+    @property
+    def task_prefetches(self):
+        """Генерация задач, запущенная заранее: номер задачи -> Prefetch.
+
+        Future живут только в процессе, который их запустил, поэтому хранятся
+        вне сессии и не сериализуются: запрос, попавший в другой воркер,
+        просто возьмет задачу из пула.
+        """
+        return session_prefetches.setdefault(self.session_id, {})
+    
+    def to_state(self):
+        """Полное состояние для хранилища сессий (JSON-совместимое)"""
+        return {
+            'session_id': self.session_id,
+            'position': self.position,
+            'level': self.level,
+            'interview_type': self.interview_type,
+            'company_type': self.company_type,
+            'questions_asked': self.questions_asked,
+            'user_answers': self.user_answers,
+            'current_question': self.current_question,
+            'start_time': self.start_time.isoformat(),
+            'is_active': self.is_active,
+            'question_count': self.question_count,
+            'coding_task_count': self.coding_task_count,
+            'coding_tasks': [asdict(task) for task in self.coding_tasks],
+            # Текущая задача - одна из coding_tasks, хранится ее номер
+            'current_coding_task': next(
+                (i for i, task in enumerate(self.coding_tasks) if task is self.current_coding_task), None
+            ) if self.current_coding_task else None,
+            'coding_submissions': self.coding_submissions,
+            'blobs': self.blobs.to_state(),
+            'interview_mode': self.interview_mode
+        }
+    
+    @classmethod
+    def from_state(cls, state):
+        session = cls(state['session_id'], state['position'], state['level'],
+                      state['interview_type'], state['company_type'])
+        for key in ('questions_asked', 'current_question', 'is_active', 'question_count',
+                    'coding_task_count', 'interview_mode'):
+            setattr(session, key, state[key])
+        session.start_time = datetime.fromisoformat(state['start_time'])
+        session.coding_tasks = [
+            CodingTask(**{**task, 'test_cases': [TestCase(**tc) for tc in task['test_cases']]})
+            for task in state['coding_tasks']
+        ]
+        if state['current_coding_task'] is not None:
+            session.current_coding_task = session.coding_tasks[state['current_coding_task']]
+        if 'blobs' in state:
+            session.user_answers = state['user_answers']
+            session.coding_submissions = state['coding_submissions']
+            session.blobs = ContentStore.from_state(state['blobs'])
+        else:
+            # Состояние до компактного хранения: решения лежали полными копиями в обоих списках
+            submissions = iter(state['coding_submissions'])
+            for answer in state['user_answers']:
+                if answer.get('type') != 'coding':
+                    session.user_answers.append(answer)
+                    continue
+                old = next(submissions)
+                session.add_submission(old['task_id'], old['code'], old['language'],
+                                       old['result'], old['code_quality'], old['evaluation'],
+                                       timestamp=old['timestamp'])
+        return session
+    
+    def add_submission(self, task_id, code, language, result, code_quality, evaluation, timestamp=None):
+        """Сохранение решения: код и результаты тестов - один раз, сжатыми, по ссылке"""
+        summary = {key: value for key, value in result.items() if key != 'test_results'}
+        self.coding_submissions.append({
+            'task_id': task_id,
+            'code': self.blobs.put(code),
+            'language': language,
+            'result': summary,
+            'test_results': self.blobs.put(result['test_results']),
+            'code_quality': code_quality,
+            'timestamp': timestamp or datetime.now().isoformat(),
+            'passed': result['success'],
+            'evaluation': evaluation
+        })
+        self.user_answers.append({'type': 'coding', 'submission': len(self.coding_submissions) - 1})
+    
+    def submission_view(self, index, details=False):
+        """Решение в прежнем формате ответа API; код и тесты только с details"""
+        record = self.coding_submissions[index]
+        task = next((t for t in self.coding_tasks if t.task_id == record['task_id']), None)
+        view = {
+            'task_id': record['task_id'],
+            'task_title': task.title if task else '',
+            'language': record['language'],
+            'result': dict(record['result']),
+            'code_quality': record['code_quality'],
+            'timestamp': record['timestamp'],
+            'passed': record['passed'],
+            'type': 'coding',
+            'evaluation': record['evaluation']
+        }
+        if details:
+            view['task'] = task.description if task else ''
+            view['code'] = self.blobs.get(record['code'])
+            view['result']['test_results'] = self.blobs.get(record['test_results'])
+        return view
+    
+    def answers(self, details=False):
+        """Все ответы по порядку, решения задач - развернутые из ссылок"""
+        return [
+            self.submission_view(answer['submission'], details) if answer.get('type') == 'coding' else answer
+            for answer in self.user_answers
+        ]
+    
+    def seen_task_ids(self):
+        return [task.task_id for task in self.coding_tasks]
+    
+    def prefetch_next_task(self):
+        """Начать генерацию задачи, которую кандидат получит после текущей"""
+        # При отправке решения coding_task_count увеличится на 1
+        total_after_submit = self.question_count + self.coding_task_count + 1
+        next_task_number = total_after_submit + 1
+        if not self.current_coding_task or total_after_submit >= Config.TOTAL_QUESTIONS:
+            return
+        if next_task_number in self.task_prefetches:
+            return  # Уже генерируется вместе со всеми задачами собеседования
+        self.task_prefetches[next_task_number] = task_prefetcher.start(
+            self.position, self.level, self.current_coding_task.language,
+            next_task_number, Config.TOTAL_QUESTIONS,
+            exclude_ids=self.seen_task_ids()
+        )
+    
+    def prefetch_all_tasks(self, language):
+        """Параллельная генерация всех задач собеседования до выдачи первой"""
+        first = self.question_count + self.coding_task_count + 1
+        # Номера следующих задач - как их посчитает prefetch_next_task после выдачи первой
+        task_numbers = [first] + list(range(first + 2, Config.TOTAL_QUESTIONS + 1))
+        specs = [
+            (self.position, self.level, language, task_number, Config.TOTAL_QUESTIONS)
+            for task_number in task_numbers
+        ]
+        prefetches = task_prefetcher.start_many(
+            specs, Config.FAN_OUT_CONCURRENCY, exclude_ids=self.seen_task_ids()
+        )
+        self.task_prefetches.update(zip(task_numbers, prefetches))
+    
+    def take_prefetched_task(self, language, task_number):
+        """Задача из упреждения или None, если она не подходит"""
+        # Упреждения для пропущенных номеров уже не понадобятся
+        for stale in [n for n in self.task_prefetches if n < task_number]:
+            task_prefetcher.cancel(self.task_prefetches.pop(stale))
+        return task_prefetcher.take(
+            self.task_prefetches.pop(task_number, None), self.position, self.level,
+            language, task_number, Config.TOTAL_QUESTIONS
+        )
+    
+    def cancel_prefetch(self):
+        cancel_session_prefetch(self.session_id)
         
     def to_dict(self):
         return {
@@ -74,17 +407,69 @@ class InterviewSession:
             'interview_type': self.interview_type,
             'company_type': self.company_type,
             'questions_asked': self.questions_asked,
-            'user_answers': self.user_answers,
+            'user_answers': self.answers(),
             'current_question': self.current_question,
             'start_time': self.start_time.isoformat(),
             'is_active': self.is_active,
             'question_count': self.question_count,
             'current_coding_task': self.current_coding_task.to_dict() if self.current_coding_task else None,
-            'coding_submissions': self.coding_submissions
+            'coding_submissions': [self.submission_view(i) for i in range(len(self.coding_submissions))]
         }
 
-# Хранилище сессий
-interview_sessions = {}
+# Упреждающая генерация задач сессий этого процесса: session_id -> {номер задачи: Prefetch}
+session_prefetches = {}
+
+def cancel_session_prefetch(session_id):
+    for prefetch in session_prefetches.pop(session_id, {}).values():
+        task_prefetcher.cancel(prefetch)
+
+def pending_task_prefetch(session_id):
+    """Ближайшая еще не выданная задача из упреждения: (номер, Prefetch) или None"""
+    # Копия: задачи забираются и отменяются из потоков проверки
+    prefetches = dict(session_prefetches.get(session_id, {}))
+    if not prefetches:
+        return None
+    task_number = min(prefetches)
+    return task_number, prefetches[task_number]
+
+# Хранилище сессий: в памяти процесса или общее для всех воркеров.
+# Вытесненные сессии архивируются на диск и остаются доступны для просмотра.
+session_retention = SessionRetention(
+    idle_ttl=Config.SESSION_IDLE_TTL,
+    finished_ttl=Config.SESSION_FINISHED_TTL,
+    max_bytes=Config.SESSION_MAX_BYTES,
+    sweep_interval=Config.SESSION_SWEEP_INTERVAL,
+    archive=SessionArchive(Config.SESSION_ARCHIVE_DIR) if Config.SESSION_ARCHIVE_DIR else None,
+    on_evict=cancel_session_prefetch
+)
+if Config.SESSION_STORE == 'sqlite':
+    session_store = SQLiteSessionStore(
+        Config.SESSION_DB_PATH,
+        load=InterviewSession.from_state,
+        lease_sec=Config.SESSION_LEASE_SEC,
+        lock_timeout=Config.SESSION_LOCK_TIMEOUT,
+        retention=session_retention
+    )
+else:
+    session_journal = None
+    if Config.SESSION_JOURNAL_DIR:
+        try:
+            session_journal = SessionJournal(
+                Config.SESSION_JOURNAL_DIR,
+                fsync_interval=Config.SESSION_JOURNAL_FSYNC_INTERVAL,
+                segment_bytes=Config.SESSION_JOURNAL_SEGMENT_BYTES
+            )
+            atexit.register(session_journal.close)
+        except RuntimeError as e:
+            # Нет fcntl или несколько воркеров с сессиями в памяти - нужен SESSION_STORE=sqlite
+            print(f"⚠️ {e}, сессии без журнала")
+    session_store = MemorySessionStore(
+        lock_timeout=Config.SESSION_LOCK_TIMEOUT,
+        load=InterviewSession.from_state,
+        retention=session_retention,
+        journal=session_journal
+    )
+    session_store.recover()
 
 # Доступные позиции и уровни
 AVAILABLE_POSITIONS = {
@@ -101,19 +486,33 @@ AVAILABLE_LEVELS = ["Junior", "Middle", "Senior", "Team Lead"]
 AVAILABLE_INTERVIEW_TYPES = ["Техническое", "Поведенческое", "Системное проектирование", "Смешанное"]
 AVAILABLE_COMPANY_TYPES = ["IT продуктовая", "Аутсорсинг", "Стартап", "Крупная корпорация", "Госучреждение"]
 
-# Функция для общения с LLM через OpenAI клиент
-def chat_with_model(messages, model=Config.LLM_MODEL):
+def prewarm_task_pool():
+    """Первые задачи собеседования заранее, чтобы старт не ждал LLM.
+
+    Каждый воркер импортирует приложение сам, поэтому прогрев захватывается
+    через общий банк задач: его выполняет один воркер, сгенерированные
+    задачи попадают в банк и доступны остальным.
+    """
+    if task_bank is not None and not task_bank.claim('task_pool_prewarm', Config.TASK_POOL_PREWARM_INTERVAL):
+        return
+    buckets = [
+        (position, level) for position in task_generator.position_topics for level in AVAILABLE_LEVELS
+        if not task_generator.bank_covers(position, level, 'python', 1, Config.TOTAL_QUESTIONS)
+    ]
+    for position, level in buckets:
+        task_pool.warm(position, level, 'python', Config.TOTAL_QUESTIONS, task_numbers=[1])
+    print(f"🔥 Прогрев пула задач: {len(buckets)} корзин")
+
+if Config.TASK_POOL_PREWARM:
+    prewarm_task_pool()
+
+# Функция для общения с LLM через общий шлюз
+def chat_with_model(messages, purpose='question', model=Config.LLM_MODEL):
     try:
-        print(f"🔧 Отправка запроса к LLM через OpenAI клиент")
+        print(f"🔧 Отправка запроса к LLM ({purpose})")
         print(f"   Model: {model}")
 
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=Config.TEMPERATURE,
-            top_p=Config.TOP_P,
-            max_tokens=Config.MAX_TOKENS
-        )
+        response = llm.chat(purpose, messages, model=model)
 
         print("✅ LLM ответ получен успешно")
         # Добавьте эту строку для отладки:
@@ -126,66 +525,114 @@ def chat_with_model(messages, model=Config.LLM_MODEL):
         raise e
 
 # Генерация вопросов через LLM
-def generate_interview_question(session, previous_answers=None):
-    try:
-        # Промпт с assistant примером для исключения рассуждений
-        messages = [
-            {
-                "role": "system",
-                "content": "Ты технический интервьюер. Задавай вопросы кратко."
-            },
-            {
-                "role": "user",
-                "content": f"Задай технический вопрос для {session.position} {session.level}"
-            },
-            {
-                "role": "assistant",
-                "content": "Что такое"
-            }
-        ]
+def cached_question(session):
+    """Вопрос из кэшированной корзины (должность, уровень) или None.
+
+    Пока в корзине меньше QUESTION_BUCKET_SIZE вопросов, каждый вызов
+    пополняет ее через LLM; потом вопросы выдаются из корзины без запроса,
+    если среди них остались не заданные этой сессии.
+    """
+    bucket_key = LLMCache.make_key('questions', session.position, session.level)
+    if llm_cache:
+        bucket = llm_cache.get(bucket_key, [])
+        unseen = [q for q in bucket if q not in session.questions_asked]
+        if len(bucket) >= Config.QUESTION_BUCKET_SIZE and unseen:
+            question = random.choice(unseen)
+            print(f"💾 Вопрос из кэша: {question}")
+            return question
+    return None
+
+def build_question_messages(session):
+    # Промпт с assistant примером для исключения рассуждений
+    return [
+        {
+            "role": "system",
+            "content": "Ты технический интервьюер. Задавай вопросы кратко."
+        },
+        {
+            "role": "user",
+            "content": f"Задай технический вопрос для {session.position} {session.level}"
+        },
+        {
+            "role": "assistant",
+            "content": "Что такое"
+        }
+    ]
 
-        print(f"🎯 Генерация вопроса для {session.position} {session.level}")
-        response = chat_with_model(messages)
-        question_part = response.choices[0].message.content.strip()
+def accept_question(session, question_part):
+    """Вопрос из ответа LLM или резервный, если ответ не похож на вопрос"""
+    bucket_key = LLMCache.make_key('questions', session.position, session.level)
 
-        # Собираем вопрос из префикса "Что такое" + ответ LLM
-        question = "Что такое " + question_part
-        
-        print(f"📨 Ответ LLM: '{question}'")
+    # Собираем вопрос из префикса "Что такое" + ответ LLM
+    question = "Что такое " + question_part
+    
+    print(f"📨 Ответ LLM: '{question}'")
 
-        # Улучшенная очистка ответа
-        question = clean_llm_response(question)
-        
-        # Если ответ слишком длинный (больше 200 символов) - рассуждения вслух
-        if len(question) > 200:
-            print("⚠️ LLM вернул слишком длинный ответ, используем fallback")
-            return get_fallback_question(session)
-        
-        # Если ответ начинается с "Хорошо" или похожих слов - отбрасываем
-        skip_words = ['хорошо', 'ок', 'okay', 'понял', 'мне нужно', 'давайте', 'я должен', 'i need', 'let me']
-        question_lower = question.lower()
-        for skip in skip_words:
-            if question_lower.startswith(skip):
-                print("⚠️ LLM начал рассуждать, используем fallback")
-                return get_fallback_question(session)
-
-        # Более строгая проверка пустого вопроса
-        if not question or len(question.strip()) < 15 or not any(char.isalpha() for char in question):
-            print("❌ LLM вернул пустой вопрос, используем fallback")
+    # Улучшенная очистка ответа
+    question = clean_llm_response(question)
+    
+    # Если ответ слишком длинный (больше 200 символов) - рассуждения вслух
+    if len(question) > 200:
+        print("⚠️ LLM вернул слишком длинный ответ, используем fallback")
+        return get_fallback_question(session)
+    
+    # Если ответ начинается с "Хорошо" или похожих слов - отбрасываем
+    skip_words = ['хорошо', 'ок', 'okay', 'понял', 'мне нужно', 'давайте', 'я должен', 'i need', 'let me']
+    question_lower = question.lower()
+    for skip in skip_words:
+        if question_lower.startswith(skip):
+            print("⚠️ LLM начал рассуждать, используем fallback")
             return get_fallback_question(session)
 
-        # Проверяем, что это действительно вопрос (содержит вопросительный знак или вопросное слово)
-        question_words = ['как', 'что', 'почему', 'расскажите', 'объясните', 'опишите', 'приведите']
-        has_question_mark = '?' in question
-        starts_with_question_word = any(question.lower().startswith(word) for word in question_words)
+    # Более строгая проверка пустого вопроса
+    if not question or len(question.strip()) < 15 or not any(char.isalpha() for char in question):
+        print("❌ LLM вернул пустой вопрос, используем fallback")
+        return get_fallback_question(session)
 
-        if not (has_question_mark or starts_with_question_word):
-            print("⚠️ Ответ не похож на вопрос, используем fallback")
-            return get_fallback_question(session)
+    # Проверяем, что это действительно вопрос (содержит вопросительный знак или вопросное слово)
+    question_words = ['как', 'что', 'почему', 'расскажите', 'объясните', 'опишите', 'приведите']
+    has_question_mark = '?' in question
+    starts_with_question_word = any(question.lower().startswith(word) for word in question_words)
+
+    if not (has_question_mark or starts_with_question_word):
+        print("⚠️ Ответ не похож на вопрос, используем fallback")
+        return get_fallback_question(session)
+
+    print(f"✅ Generated question: {question}")
+    if llm_cache:
+        # Резервные вопросы (ветки выше) в корзину не попадают
+        llm_cache.update(
+            bucket_key,
+            lambda bucket: (bucket if question in bucket else bucket + [question])[-2 * Config.QUESTION_BUCKET_SIZE:],
+            default=[]
+        )
+    return question
+
+def generate_interview_question(session, previous_answers=None):
+    """Вопрос из кэшированной корзины (см. cached_question) или новый от LLM"""
+    question = cached_question(session)
+    if question:
+        return question
+
+    try:
+        print(f"🎯 Генерация вопроса для {session.position} {session.level}")
+        response = chat_with_model(build_question_messages(session))
+        return accept_question(session, response.choices[0].message.content.strip())
+
+    except Exception as e:
+        print(f"❌ Error generating question with LLM: {e}")
+        return get_fallback_question(session)
 
-        print(f"✅ Generated question: {question}")
+async def agenerate_interview_question(session):
+    """Асинхронный вариант generate_interview_question (для asgi.py)"""
+    question = cached_question(session)
+    if question:
         return question
 
+    try:
+        response = await llm.achat('question', build_question_messages(session))
+        return accept_question(session, response.choices[0].message.content.strip())
+
     except Exception as e:
         print(f"❌ Error generating question with LLM: {e}")
         return get_fallback_question(session)
@@ -303,11 +750,19 @@ def get_fallback_question(session):
         return f"Расскажите о самом сложном проекте на позиции {session.position}, с которым вы сталкивались?"
 
 # Оценка ответов через LLM
-def evaluate_answer(question, answer, position, level, contains_code=False, language=None):
-    try:
-        # Упрощенный промпт для ускорения
-        if contains_code:
-            prompt = f"""Оцени код кандидата по 10-балльной шкале.
+def evaluation_cache_key(question, answer, level, contains_code):
+    # Ключ строится из того, что реально попадает в промпт: ответ обрезан
+    # так же, регистр и пробелы текстового ответа на оценку не влияют
+    if contains_code:
+        return LLMCache.make_key('evaluation', 'code', normalize_text(question),
+                                 normalize_text(answer, 500, fold_case=False))
+    return LLMCache.make_key('evaluation', 'text', normalize_text(question),
+                             normalize_text(answer, 300), level)
+
+def build_evaluation_messages(question, answer, level, contains_code):
+    # Упрощенный промпт для ускорения
+    if contains_code:
+        prompt = f"""Оцени код кандидата по 10-балльной шкале.
 
 Вопрос: {question}
 Код: {answer[:500]}
@@ -316,8 +771,8 @@ def evaluate_answer(question, answer, position, level, contains_code=False, lang
 ОЦЕНКА: X/10
 СИЛЬНЫЕ СТОРОНЫ: пункт1, пункт2
 РЕКОМЕНДАЦИИ: пункт1, пункт2"""
-        else:
-            prompt = f"""Оцени ответ кандидата по 10-балльной шкале.
+    else:
+        prompt = f"""Оцени ответ кандидата по 10-балльной шкале.
 
 Вопрос: {question}
 Ответ: {answer[:300]}
@@ -328,33 +783,139 @@ def evaluate_answer(question, answer, position, level, contains_code=False, lang
 СИЛЬНЫЕ СТОРОНЫ: пункт1, пункт2
 РЕКОМЕНДАЦИИ: пункт1, пункт2"""
 
-        messages = [
-            {
-                "role": "system",
-                "content": "Оценщик. Формат: ОЦЕНКА, СИЛЬНЫЕ СТОРОНЫ, РЕКОМЕНДАЦИИ."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
+    return [
+        {
+            "role": "system",
+            "content": "Оценщик. Формат: ОЦЕНКА, СИЛЬНЫЕ СТОРОНЫ, РЕКОМЕНДАЦИИ."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+def cached_evaluation(cache_key):
+    cached = llm_cache.get(cache_key) if llm_cache else None
+    if cached is not None:
+        print(f"💾 Оценка из кэша: {cached['score']}/10")
+    return cached
+
+def finish_evaluation(cache_key, evaluation_text, contains_code):
+    """Разбор текста оценки от LLM и сохранение в кэш"""
+    # Парсим текстовый ответ вместо JSON
+    evaluation = parse_text_evaluation(evaluation_text, contains_code)
+
+    print(f"✅ Оценка сформирована: {evaluation['score']}/10")
+    # Резервная оценка (ветка except у вызывающих) не кэшируется
+    if llm_cache:
+        llm_cache.put(cache_key, evaluation)
+    return evaluation
+
+def evaluate_answer(question, answer, position, level, contains_code=False, language=None):
+    cache_key = evaluation_cache_key(question, answer, level, contains_code)
+    cached = cached_evaluation(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        messages = build_evaluation_messages(question, answer, level, contains_code)
 
         print(f"📊 Отправка запроса на оценку ответа")
-        response = chat_with_model(messages)
+        response = chat_with_model(messages, purpose='evaluation')
         evaluation_text = response.choices[0].message.content.strip()
 
         print(f"📨 Получен ответ от LLM: {evaluation_text}")
+        return finish_evaluation(cache_key, evaluation_text, contains_code)
+
+    except Exception as e:
+        print(f"❌ Ошибка оценки ответа: {e}")
+        return get_fallback_evaluation(contains_code, 5)
 
-        # Парсим текстовый ответ вместо JSON
-        evaluation = parse_text_evaluation(evaluation_text, contains_code)
+async def aevaluate_answer(question, answer, position, level, contains_code=False, language=None):
+    """Асинхронный вариант evaluate_answer (для asgi.py)"""
+    cache_key = evaluation_cache_key(question, answer, level, contains_code)
+    cached = cached_evaluation(cache_key)
+    if cached is not None:
+        return cached
 
-        print(f"✅ Оценка сформирована: {evaluation['score']}/10")
-        return evaluation
+    try:
+        messages = build_evaluation_messages(question, answer, level, contains_code)
+        response = await llm.achat('evaluation', messages)
+        return finish_evaluation(cache_key, response.choices[0].message.content.strip(), contains_code)
 
     except Exception as e:
         print(f"❌ Ошибка оценки ответа: {e}")
         return get_fallback_evaluation(contains_code, 5)
 
+SCORE_LINE = re.compile(r'^\s*(?:ОЦЕНКА|SCORE):\D*(\d+)', re.MULTILINE)
+
+def score_event(evaluation_text, content):
+    """Балл, как только строка ОЦЕНКА получена целиком (иначе None)"""
+    if '\n' not in content:
+        return None
+    match = SCORE_LINE.search(evaluation_text[:evaluation_text.rfind('\n')])
+    return {'score': max(1, min(10, int(match.group(1))))} if match else None
+
+def stream_evaluation(question, answer, position, level, contains_code=False, language=None):
+    """Потоковый вариант evaluate_answer: генератор событий (имя, данные).
+
+    'token' - очередной фрагмент текста оценки, 'score' - балл, как только
+    строка ОЦЕНКА получена целиком, 'evaluation' - разобранная оценка
+    (как у evaluate_answer), всегда последнее событие.
+    """
+    cache_key = evaluation_cache_key(question, answer, level, contains_code)
+    cached = cached_evaluation(cache_key)
+    if cached is not None:
+        yield 'evaluation', cached
+        return
+
+    evaluation_text = ''
+    score = None
+    try:
+        print(f"📊 Потоковая оценка ответа")
+        messages = build_evaluation_messages(question, answer, level, contains_code)
+        for content in llm.stream('evaluation', messages):
+            evaluation_text += content
+            yield 'token', {'text': content}
+
+            if score is None:
+                score = score_event(evaluation_text, content)
+                if score:
+                    yield 'score', score
+    except Exception as e:
+        print(f"❌ Ошибка оценки ответа: {e}")
+        yield 'evaluation', get_fallback_evaluation(contains_code, 5)
+        return
+
+    yield 'evaluation', finish_evaluation(cache_key, evaluation_text.strip(), contains_code)
+
+async def astream_evaluation(question, answer, position, level, contains_code=False, language=None):
+    """Асинхронный вариант stream_evaluation (для asgi.py)"""
+    cache_key = evaluation_cache_key(question, answer, level, contains_code)
+    cached = cached_evaluation(cache_key)
+    if cached is not None:
+        yield 'evaluation', cached
+        return
+
+    evaluation_text = ''
+    score = None
+    try:
+        messages = build_evaluation_messages(question, answer, level, contains_code)
+        async for content in llm.astream('evaluation', messages):
+            evaluation_text += content
+            yield 'token', {'text': content}
+
+            if score is None:
+                score = score_event(evaluation_text, content)
+                if score:
+                    yield 'score', score
+    except Exception as e:
+        print(f"❌ Ошибка оценки ответа: {e}")
+        yield 'evaluation', get_fallback_evaluation(contains_code, 5)
+        return
+
+    yield 'evaluation', finish_evaluation(cache_key, evaluation_text.strip(), contains_code)
+
 
 def parse_text_evaluation(text, contains_code=False):
     """Парсит текстовый ответ от LLM в структурированную оценку"""
@@ -464,68 +1025,79 @@ def setup_interview():
 
 @app.route('/chat')
 def chat():
-    session_id = request.args.get('session_id')
-    if not session_id or session_id not in interview_sessions:
+    session = session_store.get(request.args.get('session_id'))
+    if not session:
         return redirect(url_for('setup_interview'))
-    
-    session = interview_sessions[session_id]
     return render_template('chat.html', session=session.to_dict())
 
 @app.route('/coding')
 def coding():
-    session_id = request.args.get('session_id')
-    if not session_id or session_id not in interview_sessions:
+    session = session_store.get(request.args.get('session_id'))
+    if not session:
         return redirect(url_for('setup_interview'))
-    
-    session = interview_sessions[session_id]
     return render_template('coding.html', session=session.to_dict())
 
 @app.route('/api/start_interview', methods=['POST'])
 def start_interview():
     try:
         data = request.json
-        position = data.get('position', 'Frontend разработчик')
-        level = data.get('level', 'Middle')
-        # Фиксированные значения
-        interview_type = 'Техническое'
-        company_type = 'IT продуктовая'
-        
-        # Генерация ID сессии
-        session_id = f"session_{int(time.time())}_{len(interview_sessions)}"
-        
-        # Создание новой сессии
-        session = InterviewSession(session_id, position, level, interview_type, company_type)
-        interview_sessions[session_id] = session
-        
-        # Генерация первой задачи по программированию
-        print(f"🎯 Генерация первой задачи для {position} {level}")
-        try:
-            coding_task = task_generator.generate_task(
-                position, level, 'python',
-                task_number=1, total_tasks=Config.TOTAL_QUESTIONS
-            )
-            session.current_coding_task = coding_task
-            session.coding_tasks.append(coding_task)
-            session.coding_task_count += 1
-            
-            response_data = {
-                'success': True,
-                'session_id': session_id,
-                'next_type': 'coding_task',
-                'task': coding_task.to_dict(),
-                'question_number': 1,
-                'total_questions': Config.TOTAL_QUESTIONS
-            }
-            print(f"✅ Отправка ответа: task_id={coding_task.task_id}, title={coding_task.title}")
-            return jsonify(response_data)
-        except Exception as e:
-            print(f"❌ Ошибка генерации задачи: {e}")
-            return jsonify({'success': False, 'error': f'Ошибка генерации задачи: {str(e)}'}), 500
+        response_data, status_code = create_interview(
+            data.get('position', 'Frontend разработчик'),
+            data.get('level', 'Middle'),
+            data.get('fan_out', Config.INTERVIEW_FAN_OUT)
+        )
+        return jsonify(response_data), status_code
         
     except Exception as e:
         print(f"❌ Ошибка запуска собеседования: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def create_interview(position, level, fan_out=Config.INTERVIEW_FAN_OUT):
+    """Новая сессия с первой задачей: (ответ, HTTP код), как у /api/start_interview"""
+    # Фиксированные значения
+    interview_type = 'Техническое'
+    company_type = 'IT продуктовая'
+    
+    # Генерация ID сессии (уникален между воркерами)
+    session_id = f"session_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    
+    # Создание новой сессии (в хранилище попадает вместе с первой задачей)
+    session = InterviewSession(session_id, position, level, interview_type, company_type)
+    
+    # Генерация первой задачи по программированию
+    print(f"🎯 Генерация первой задачи для {position} {level}")
+    try:
+        coding_task = None
+        if fan_out:
+            # Все задачи генерируются параллельно, первая выдается, как только готова
+            session.prefetch_all_tasks('python')
+            coding_task = session.take_prefetched_task('python', 1)
+        # Без fan_out следующая задача готовится в фоне (prefetch_next_task), пока кандидат решает текущую
+        coding_task = coding_task or task_pool.get_task(
+            position, level, 'python',
+            task_number=1, total_tasks=Config.TOTAL_QUESTIONS
+        )
+        session.current_coding_task = coding_task
+        session.coding_tasks.append(coding_task)
+        session.coding_task_count += 1
+        session.prefetch_next_task()
+        session_store.add(session)
+        
+        response_data = {
+            'success': True,
+            'session_id': session_id,
+            'next_type': 'coding_task',
+            'task': coding_task.to_dict(),
+            'question_number': 1,
+            'total_questions': Config.TOTAL_QUESTIONS
+        }
+        print(f"✅ Отправка ответа: task_id={coding_task.task_id}, title={coding_task.title}")
+        return response_data, 200
+    except Exception as e:
+        print(f"❌ Ошибка генерации задачи: {e}")
+        session.cancel_prefetch()
+        return {'success': False, 'error': f'Ошибка генерации задачи: {str(e)}'}, 500
+
 @app.route('/api/submit_answer', methods=['POST'])
 def submit_answer():
     try:
@@ -535,68 +1107,184 @@ def submit_answer():
         contains_code = data.get('contains_code', False)
         language = data.get('language', 'javascript')
         
-        if session_id not in interview_sessions:
-            return jsonify({'success': False, 'error': 'Session not found'}), 404
-        
-        session = interview_sessions[session_id]
-        
-        if not session.is_active:
-            return jsonify({'success': False, 'error': 'Interview completed'}), 400
-        
-        print(f"📝 Оценка ответа для вопроса: {session.current_question[:100]}...")
-        print(f"📋 Тип ответа: {'код' if contains_code else 'текст'}")
-        
-        # Оценка ответа через LLM
-        evaluation = evaluate_answer(
-            session.current_question, 
-            answer, 
-            session.position, 
-            session.level,
-            contains_code,
-            language
-        )
-        
-        # Сохранение ответа
-        session.user_answers.append({
-            'question': session.current_question,
-            'answer': answer,
-            'evaluation': evaluation,
-            'contains_code': contains_code,
-            'language': language if contains_code else None,
-            'timestamp': datetime.now().isoformat(),
-            'type': 'theory'
-        })
+        with session_store.session(session_id, event='answer_recorded') as session:
+            if not session:
+                return jsonify({'success': False, 'error': 'Session not found'}), 404
+            
+            if not session.is_active:
+                return jsonify({'success': False, 'error': 'Interview completed'}), 400
+            
+            print(f"📝 Оценка ответа для вопроса: {session.current_question[:100]}...")
+            print(f"📋 Тип ответа: {'код' if contains_code else 'текст'}")
+            
+            # Оценка ответа через LLM
+            evaluation = evaluate_answer(
+                session.current_question, 
+                answer, 
+                session.position, 
+                session.level,
+                contains_code,
+                language
+            )
+            
+            response_data = record_answer(session, answer, evaluation, contains_code, language)
+            if response_data['interview_complete']:
+                response_data['summary'] = generate_interview_summary(session)
+            return jsonify(response_data)
         
-        session.question_count += 1
-        total_items = session.question_count + session.coding_task_count
+    except SessionBusyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except Exception as e:
+        print(f"❌ Ошибка отправки ответа: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/submit_answer_stream', methods=['POST'])
+def submit_answer_stream():
+    """Потоковый вариант /api/submit_answer (SSE).
+
+    События: token и score - по мере генерации оценки, evaluation - разобранная
+    оценка; при завершении собеседования summary_token и summary; последним
+    приходит done с тем же ответом, что вернул бы /api/submit_answer.
+    """
+    data = request.json or {}
+    session_id = data.get('session_id')
+    answer = data.get('answer', '')
+    contains_code = data.get('contains_code', False)
+    language = data.get('language', 'javascript')
+    
+    session = session_store.get(session_id)
+    if not session:
+        return jsonify({'success': False, 'error': 'Session not found'}), 404
+    
+    if not session.is_active:
+        return jsonify({'success': False, 'error': 'Interview completed'}), 400
+    
+    print(f"📝 Потоковая оценка ответа для вопроса: {session.current_question[:100]}...")
+    
+    def event(name, payload):
+        return f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    def generate():
+        try:
+            # Сессия изменяется уже после возврата из обработчика - берем ее заново под блокировкой
+            with session_store.session(session_id, event='answer_recorded') as session:
+                if not session or not session.is_active:
+                    yield event('done', {'success': False, 'error': 'Interview completed'})
+                    return
+                
+                evaluation = None
+                for name, payload in stream_evaluation(session.current_question, answer, session.position,
+                                                       session.level, contains_code, language):
+                    if name == 'evaluation':
+                        evaluation = payload
+                    yield event(name, payload)
+                
+                response_data = record_answer(session, answer, evaluation, contains_code, language)
+                if response_data['interview_complete']:
+                    for name, payload in stream_interview_summary(session):
+                        if name == 'summary':
+                            response_data['summary'] = payload
+                        yield event(name, payload)
+            yield event('done', response_data)
+            
+        except Exception as e:
+            print(f"❌ Ошибка отправки ответа: {e}")
+            yield event('done', {'success': False, 'error': str(e)})
+    
+    return app.response_class(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def next_is_question(question_count, coding_task_count):
+    """Что выдать после ответа: True - вопрос, False - задачу или конец собеседования"""
+    # Чередуем: если вопросов < 5 и (задач >= вопросов), даем вопрос
+    # иначе даем задачу
+    return (
+        question_count + coding_task_count < Config.TOTAL_QUESTIONS and
+        question_count < Config.MAX_QUESTIONS and
+        coding_task_count >= question_count
+    )
+
+def record_answer(session, answer, evaluation, contains_code, language, next_question=None):
+    """Сохранение оцененного ответа и выдача следующего задания.
+
+    Возвращает ответ для клиента; при завершении собеседования итоги
+    (summary) формирует вызывающий код. next_question - следующий вопрос,
+    если вызывающий код уже получил его от LLM (асинхронный путь).
+    """
+    session.user_answers.append({
+        'question': session.current_question,
+        'answer': answer,
+        'evaluation': evaluation,
+        'contains_code': contains_code,
+        'language': language if contains_code else None,
+        'timestamp': datetime.now().isoformat(),
+        'type': 'theory'
+    })
+    
+    session.question_count += 1
+    total_items = session.question_count + session.coding_task_count
+    
+    # Проверка на завершение собеседования (5 вопросов + 5 задач = 10)
+    if total_items >= Config.TOTAL_QUESTIONS:
+        session.is_active = False
+        session.cancel_prefetch()
+        return {
+            'success': True,
+            'interview_complete': True,
+            'evaluation': evaluation
+        }
+    
+    # Определяем что давать дальше: вопрос или задачу
+    if next_is_question(session.question_count, session.coding_task_count):
+        # Генерация следующего вопроса через LLM
+        if not next_question:
+            print("🔄 Генерация следующего теоретического вопроса...")
+            next_question = generate_interview_question(session, session.user_answers)
+        session.current_question = next_question
+        session.questions_asked.append(next_question)
         
-        # Проверка на завершение собеседования (5 вопросов + 5 задач = 10)
-        if total_items >= Config.TOTAL_QUESTIONS:
-            session.is_active = False
-            summary = generate_interview_summary(session)
-            return jsonify({
+        return {
+            'success': True,
+            'interview_complete': False,
+            'next_type': 'question',
+            'question': next_question,
+            'question_number': total_items + 1,
+            'total_questions': Config.TOTAL_QUESTIONS,
+            'evaluation': evaluation
+        }
+    else:
+        # Генерация задачи по программированию
+        print("🔄 Генерация задачи по программированию...")
+        try:
+            coding_task = task_pool.get_task(
+                session.position, 
+                session.level, 
+                'python',
+                exclude_ids=session.seen_task_ids()
+            )
+            session.current_coding_task = coding_task
+            session.coding_tasks.append(coding_task)
+            
+            return {
                 'success': True,
-                'interview_complete': True,
-                'evaluation': evaluation,
-                'summary': summary
-            })
-        
-        # Определяем что давать дальше: вопрос или задачу
-        # Чередуем: если вопросов < 5 и (задач >= вопросов), даем вопрос
-        # иначе даем задачу
-        should_give_question = (
-            session.question_count < Config.MAX_QUESTIONS and 
-            session.coding_task_count >= session.question_count
-        )
-        
-        if should_give_question:
-            # Генерация следующего вопроса через LLM
-            print("🔄 Генерация следующего теоретического вопроса...")
+                'interview_complete': False,
+                'next_type': 'coding_task',
+                'task': coding_task.to_dict(),
+                'question_number': total_items + 1,
+                'total_questions': Config.TOTAL_QUESTIONS,
+                'evaluation': evaluation
+            }
+        except Exception as e:
+            print(f"❌ Ошибка генерации задачи: {e}")
+            # Если не удалось сгенерировать задачу, даем вопрос
             next_question = generate_interview_question(session, session.user_answers)
             session.current_question = next_question
             session.questions_asked.append(next_question)
             
-            return jsonify({
+            return {
                 'success': True,
                 'interview_complete': False,
                 'next_type': 'question',
@@ -604,48 +1292,20 @@ def submit_answer():
                 'question_number': total_items + 1,
                 'total_questions': Config.TOTAL_QUESTIONS,
                 'evaluation': evaluation
-            })
-        else:
-            # Генерация задачи по программированию
-            print("🔄 Генерация задачи по программированию...")
-            try:
-                coding_task = task_generator.generate_task(
-                    session.position, 
-                    session.level, 
-                    'python'
-                )
-                session.current_coding_task = coding_task
-                session.coding_tasks.append(coding_task)
-                
-                return jsonify({
-                    'success': True,
-                    'interview_complete': False,
-                    'next_type': 'coding_task',
-                    'task': coding_task.to_dict(),
-                    'question_number': total_items + 1,
-                    'total_questions': Config.TOTAL_QUESTIONS,
-                    'evaluation': evaluation
-                })
-            except Exception as e:
-                print(f"❌ Ошибка генерации задачи: {e}")
-                # Если не удалось сгенерировать задачу, даем вопрос
-                next_question = generate_interview_question(session, session.user_answers)
-                session.current_question = next_question
-                session.questions_asked.append(next_question)
-                
-                return jsonify({
-                    'success': True,
-                    'interview_complete': False,
-                    'next_type': 'question',
-                    'question': next_question,
-                    'question_number': total_items + 1,
-                    'total_questions': Config.TOTAL_QUESTIONS,
-                    'evaluation': evaluation
-                })
-        
-    except Exception as e:
-        print(f"❌ Ошибка отправки ответа: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
+            }
+
+def commit_answer(session_id, question, answer, evaluation, contains_code, language, next_question=None):
+    """record_answer под блокировкой сессии для ответа, оцененного без блокировки.
+
+    Возвращает (сессия, ответ, HTTP код). Если за время оценки текущий вопрос
+    сменился (ответ на него уже записан другим запросом), ответ отклоняется.
+    """
+    with session_store.session(session_id, event='answer_recorded') as session:
+        if not session:
+            return None, {'success': False, 'error': 'Session not found'}, 404
+        if not session.is_active or session.current_question != question:
+            return session, {'success': False, 'error': 'Answer already recorded'}, 409
+        return session, record_answer(session, answer, evaluation, contains_code, language, next_question), 200
 
 @app.route('/api/test_llm', methods=['POST'])
 def test_llm():
@@ -657,7 +1317,7 @@ def test_llm():
         messages = [{"role": "user", "content": message}]
         
         print(f"🧪 Тестирование LLM с сообщением: {message}")
-        response = chat_with_model(messages)
+        response = chat_with_model(messages, purpose='diagnostics')
         answer = response.choices[0].message.content
         
         return jsonify({
@@ -685,17 +1345,8 @@ def test_stream():
         
         def generate():
             try:
-                stream = client.chat.completions.create(
-                    model=Config.LLM_MODEL,
-                    messages=[{"role": "user", "content": message}],
-                    temperature=Config.TEMPERATURE,
-                    max_tokens=Config.MAX_TOKENS,
-                    stream=True
-                )
-                
-                for chunk in stream:
-                    if chunk.choices[0].delta.content is not None:
-                        yield f"data: {chunk.choices[0].delta.content}\n\n"
+                for content in llm.stream('diagnostics', [{"role": "user", "content": message}]):
+                    yield f"data: {content}\n\n"
                 
                 yield "data: [DONE]\n\n"
                 
@@ -711,75 +1362,122 @@ def test_stream():
 def test_llm_page():
     return render_template('test_llm.html')
 
+def build_summary_messages(session):
+    # Решения задач хранятся с полями task_title/code вместо question/answer
+    answers_text = "\n".join([
+        f"Вопрос {i+1}: {qa.get('question') or qa.get('task_title', '')}\n"
+        f"Ответ: {(qa.get('answer') or qa.get('code', ''))[:150]}...\nОценка: {qa['evaluation']['score']}/10"
+        for i, qa in enumerate(session.answers(details=True))
+    ])
+    
+    prompt = f"""
+    Проанализируй результаты технического собеседования и предоставь итоговую обратную связь.
+
+    ДОЛЖНОСТЬ: {session.position}
+    УРОВЕНЬ: {session.level}
+    ТИП КОМПАНИИ: {session.company_type}
+    ВСЕГО ВОПРОСОВ: {len(session.user_answers)}
+
+    ОТВЕТЫ КАНДИДАТА:
+    {answers_text}
+
+    Проанализируй общую картину и предоставь развернутую обратную связь в JSON формате:
+    {{
+        "final_score": "средний балл/10 с комментарием",
+        "summary": "общая оценка кандидата (2-3 предложения)",
+        "strengths": ["основные сильные стороны (3-4 пункта)", ...],
+        "improvements": ["ключевые области для улучшения (3-4 пункта)", ...], 
+        "recommendations": ["рекомендации по развитию (2-3 пункта)", ...],
+        "verdict": "рекомендация к найму (Рекомендуем к найму/Рассмотреть кандидата/Не рекомендовать)"
+    }}
+    """
+
+    return [
+        {
+            "role": "system",
+            "content": "HR аналитик. Верни ТОЛЬКО валидный JSON."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+def build_summary(session, summary_text):
+    """Итоги собеседования из JSON ответа LLM (ValueError, если JSON невалиден)"""
+    # clean_llm_response рассчитана на однострочные вопросы и портит JSON:
+    # берем объект от первой до последней фигурной скобки
+    summary_text = summary_text[summary_text.find('{'):summary_text.rfind('}') + 1]
+    llm_summary = json.loads(summary_text)
+    
+    # Объединяем с базовой информацией
+    final_score = calculate_final_score(session)
+    return {
+        'position': session.position,
+        'level': session.level,
+        'interview_type': session.interview_type,
+        'company_type': session.company_type,
+        'total_questions': session.question_count,
+        'final_score': final_score,
+        'duration_minutes': round((datetime.now() - session.start_time).total_seconds() / 60, 1),
+        'strengths': llm_summary.get('strengths', []),
+        'improvements': llm_summary.get('improvements', []),
+        'recommendations': llm_summary.get('recommendations', []),
+        'verdict': llm_summary.get('verdict', 'Рассмотреть кандидата'),
+        'summary_text': llm_summary.get('summary', f'Кандидат набрал {final_score}/10 баллов.')
+    }
+
 def generate_interview_summary(session):
     """Генерация итогов собеседования через LLM"""
     try:
-        answers_text = "\n".join([
-            f"Вопрос {i+1}: {qa['question']}\nОтвет: {qa['answer'][:150]}...\nОценка: {qa['evaluation']['score']}/10"
-            for i, qa in enumerate(session.user_answers)
-        ])
+        response = chat_with_model(build_summary_messages(session), purpose='summary')
+        return build_summary(session, response.choices[0].message.content)
         
-        prompt = f"""
-        Проанализируй результаты технического собеседования и предоставь итоговую обратную связь.
-
-        ДОЛЖНОСТЬ: {session.position}
-        УРОВЕНЬ: {session.level}
-        ТИП КОМПАНИИ: {session.company_type}
-        ВСЕГО ВОПРОСОВ: {len(session.user_answers)}
-
-        ОТВЕТЫ КАНДИДАТА:
-        {answers_text}
-
-        Проанализируй общую картину и предоставь развернутую обратную связь в JSON формате:
-        {{
-            "final_score": "средний балл/10 с комментарием",
-            "summary": "общая оценка кандидата (2-3 предложения)",
-            "strengths": ["основные сильные стороны (3-4 пункта)", ...],
-            "improvements": ["ключевые области для улучшения (3-4 пункта)", ...], 
-            "recommendations": ["рекомендации по развитию (2-3 пункта)", ...],
-            "verdict": "рекомендация к найму (Рекомендуем к найму/Рассмотреть кандидата/Не рекомендовать)"
-        }}
-        """
-
-        messages = [
-            {
-                "role": "system",
-                "content": "HR аналитик. Верни ТОЛЬКО валидный JSON."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
+    except Exception as e:
+        print(f"❌ Ошибка генерации summary с LLM: {e}")
+        return generate_basic_summary(session)
 
-        response = chat_with_model(messages)
-        summary_text = response.choices[0].message.content.strip()
-        summary_text = clean_llm_response(summary_text)
-        llm_summary = json.loads(summary_text)
-        
-        # Объединяем с базовой информацией
-        final_score = calculate_final_score(session)
-        summary = {
-            'position': session.position,
-            'level': session.level,
-            'interview_type': session.interview_type,
-            'company_type': session.company_type,
-            'total_questions': session.question_count,
-            'final_score': final_score,
-            'duration_minutes': round((datetime.now() - session.start_time).total_seconds() / 60, 1),
-            'strengths': llm_summary.get('strengths', []),
-            'improvements': llm_summary.get('improvements', []),
-            'recommendations': llm_summary.get('recommendations', []),
-            'verdict': llm_summary.get('verdict', 'Рассмотреть кандидата'),
-            'summary_text': llm_summary.get('summary', f'Кандидат набрал {final_score}/10 баллов.')
-        }
-        
-        return summary
+async def agenerate_interview_summary(session):
+    """Асинхронный вариант generate_interview_summary (для asgi.py)"""
+    try:
+        response = await llm.achat('summary', build_summary_messages(session))
+        return build_summary(session, response.choices[0].message.content)
         
     except Exception as e:
         print(f"❌ Ошибка генерации summary с LLM: {e}")
         return generate_basic_summary(session)
 
+async def astream_interview_summary(session):
+    """Асинхронный вариант stream_interview_summary (для asgi.py)"""
+    summary_text = ''
+    try:
+        async for content in llm.astream('summary', build_summary_messages(session)):
+            summary_text += content
+            yield 'summary_token', {'text': content}
+        summary = build_summary(session, summary_text)
+    except Exception as e:
+        print(f"❌ Ошибка генерации summary с LLM: {e}")
+        summary = generate_basic_summary(session)
+    yield 'summary', summary
+
+def stream_interview_summary(session):
+    """Потоковый вариант generate_interview_summary: генератор событий (имя, данные).
+
+    'summary_token' - фрагменты ответа LLM по мере генерации, 'summary' -
+    итоги (как у generate_interview_summary), всегда последнее событие.
+    JSON разбирается, когда ответ получен целиком.
+    """
+    summary_text = ''
+    try:
+        for content in llm.stream('summary', build_summary_messages(session)):
+            summary_text += content
+            yield 'summary_token', {'text': content}
+        summary = build_summary(session, summary_text)
+    except Exception as e:
+        print(f"❌ Ошибка генерации summary с LLM: {e}")
+        summary = generate_basic_summary(session)
+    yield 'summary', summary
+
 def generate_basic_summary(session):
     """Базовый summary если LLM недоступна"""
     total_score = calculate_final_score(session)
@@ -812,7 +1510,7 @@ def calculate_final_score(session):
     if not session.user_answers:
         return 0
     
-    total_score = sum(answer['evaluation'].get('score', 0) for answer in session.user_answers)
+    total_score = sum(answer['evaluation'].get('score', 0) for answer in session.answers())
     return round(total_score / len(session.user_answers), 1)
 
 # ========== API endpoints для задач программирования ==========
@@ -825,143 +1523,239 @@ def generate_coding_task():
         session_id = data.get('session_id')
         language = data.get('language', 'python')
         
-        if session_id not in interview_sessions:
-            return jsonify({'success': False, 'error': 'Session not found'}), 404
-        
-        session = interview_sessions[session_id]
-        
-        print(f"🎯 Генерация задачи для {session.position} {session.level} на {language}")
-        
-        # Генерируем задачу через LLM
-        task = task_generator.generate_task(session.position, session.level, language)
-        
-        # Сохраняем задачу в сессии
-        session.current_coding_task = task
-        session.coding_tasks.append(task)
+        with session_store.session(session_id, event='task_issued') as session:
+            if not session:
+                return jsonify({'success': False, 'error': 'Session not found'}), 404
+            
+            print(f"🎯 Генерация задачи для {session.position} {session.level} на {language}")
+            
+            # Берем готовую задачу из пула или генерируем через LLM
+            task = task_pool.get_task(session.position, session.level, language,
+                                      exclude_ids=session.seen_task_ids())
+            
+            # Сохраняем задачу в сессии
+            session.current_coding_task = task
+            session.coding_tasks.append(task)
         
         return jsonify({
             'success': True,
             'task': task.to_dict()
         })
         
+    except SessionBusyError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
     except Exception as e:
         print(f"❌ Ошибка генерации задачи: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/submit_code', methods=['POST'])
 def submit_code():
-    """Отправка кода на проверку и продолжение собеседования"""
+    """Отправка кода на проверку и продолжение собеседования.
+
+    С флагом "async": true сразу возвращает job_id, проверка идет в фоне
+    (см. /api/judge_status и /api/judge_events).
+    """
     try:
         data = request.json
         session_id = data.get('session_id')
         code = data.get('code', '')
         language = data.get('language', 'python')
         
-        if session_id not in interview_sessions:
+        session = session_store.get(session_id)
+        if not session:
             return jsonify({'success': False, 'error': 'Session not found'}), 404
         
-        session = interview_sessions[session_id]
-        
         if not session.current_coding_task:
             return jsonify({'success': False, 'error': 'No active coding task'}), 400
         
-        print(f"📝 Проверка кода для задачи: {session.current_coding_task.title}")
-        
-        # Получаем все тесты (включая скрытые)
-        all_tests = session.current_coding_task.get_all_tests()
-        
-        # Запускаем код с тестами
-        if language.lower() == 'python':
-            result = code_runner.run_python_code(
-                code, 
-                all_tests,
-                session.current_coding_task.time_limit,
-                session.current_coding_task.memory_limit
+        if data.get('async'):
+            job = judge_queue.submit(
+                session_id,
+                len(session.current_coding_task.test_cases),
+                session_id, code, language
             )
-        else:
-            result = code_runner.run_javascript_code(code, all_tests)
-        
-        # Анализ качества кода
-        code_quality = code_analyzer.analyze_code(code, language)
-        
-        # Сохраняем результат
-        submission = {
-            'task_id': session.current_coding_task.task_id,
-            'task_title': session.current_coding_task.title,
-            'task': session.current_coding_task.description,
-            'code': code,
-            'language': language,
-            'result': result.to_dict(),
-            'code_quality': code_quality,
-            'timestamp': datetime.now().isoformat(),
-            'passed': result.success,
-            'type': 'coding',
-            'evaluation': {
-                'score': calculate_code_score(result, code_quality),
-                'feedback': f"Тесты: {result.passed_tests}/{result.total_tests}, Качество: {code_quality['quality_score']}/100"
-            }
-        }
-        
-        session.coding_submissions.append(submission)
-        session.user_answers.append(submission)  # Добавляем в общий список
-        session.coding_task_count += 1
-        session.current_coding_task = None  # Очищаем текущую задачу
-        
-        total_items = session.question_count + session.coding_task_count
-        
-        print(f"✅ Тесты пройдено: {result.passed_tests}/{result.total_tests}")
-        print(f"📊 Качество кода: {code_quality['quality_score']}/100")
-        print(f"📈 Прогресс: {total_items}/{Config.TOTAL_QUESTIONS}")
-        
-        # Проверка на завершение (5+5=10)
-        if total_items >= Config.TOTAL_QUESTIONS:
-            session.is_active = False
-            summary = generate_interview_summary(session)
             return jsonify({
                 'success': True,
-                'test_results': result.to_dict(),
-                'code_quality': code_quality,
-                'interview_complete': True,
-                'summary': summary
-            })
+                'job_id': job.job_id,
+                'status': job.status,
+                'total_tests': job.total_tests,
+                'status_url': url_for('judge_status', job_id=job.job_id),
+                'events_url': url_for('judge_events', job_id=job.job_id)
+            }), 202
         
-        # Генерация следующей задачи (только задачи программирования)
-        next_task_number = total_items + 1
-        print(f"🔄 Генерация задачи #{next_task_number}/{Config.TOTAL_QUESTIONS}...")
-        try:
-            coding_task = task_generator.generate_task(
-                session.position, 
-                session.level, 
-                language,
-                task_number=next_task_number,
-                total_tasks=Config.TOTAL_QUESTIONS
-            )
-            session.current_coding_task = coding_task
-            session.coding_tasks.append(coding_task)
-            
-            return jsonify({
-                'success': True,
-                'test_results': result.to_dict(),
-                'code_quality': code_quality,
-                'interview_complete': False,
-                'next_type': 'coding_task',
-                'task': coding_task.to_dict(),
-                'question_number': total_items + 1,
-                'total_questions': Config.TOTAL_QUESTIONS
-            })
-        except Exception as e:
-            print(f"❌ Ошибка генерации задачи: {e}")
-            return jsonify({
-                'success': False,
-                'error': f'Ошибка генерации задачи: {str(e)}'
-            }), 500
+        response_data, status_code = judge_session(session_id, code, language)
+        return jsonify(response_data), status_code
         
+    except (SessionBusyError, JudgeBusyError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
     except Exception as e:
         print(f"❌ Ошибка проверки кода: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def judge_session(session_id, code, language, on_test_result=None, on_event=None):
+    """judge_submission под блокировкой сессии (обработчик очереди проверки)"""
+    with session_store.session(session_id, event='code_judged') as session:
+        if not session:
+            return {'success': False, 'error': 'Session not found'}, 404
+        return judge_submission(session, code, language, on_test_result, on_event)
+
+def judge_submission(session, code, language, on_test_result=None, on_event=None):
+    """Проверка решения, сохранение результата и выдача следующей задачи.
+
+    Возвращает (ответ, HTTP код). on_test_result(index, result) вызывается
+    по мере готовности каждого теста. Если передан on_event(имя, данные),
+    результат проверки публикуется событием judged сразу после тестов,
+    а итоги собеседования генерируются потоково с событиями summary_token.
+    """
+    task = session.current_coding_task
+    if not task:
+        return {'success': False, 'error': 'No active coding task'}, 400
+    
+    print(f"📝 Проверка кода для задачи: {task.title}")
+    
+    # Получаем все тесты (включая скрытые)
+    all_tests = task.get_all_tests()
+    
+    # Запускаем код с тестами (решение разбирается один раз для запуска и анализа)
+    parsed = None
+    if language.lower() == 'python':
+        parsed = code_runner.parse(code)
+        result = code_runner.run_python_code(
+            code, 
+            all_tests,
+            task.time_limit,
+            task.memory_limit,
+            on_result=on_test_result,
+            parsed=parsed
+        )
+    else:
+        result = code_runner.run_javascript_code(code, all_tests)
+    
+    # Анализ качества кода
+    code_quality = code_analyzer.analyze_code(code, language, parsed=parsed)
+    
+    # Для Middle+ важна эффективность: оцениваем сложность правильного решения
+    if parsed is not None and result.success and session.level in Config.COMPLEXITY_ESTIMATION_LEVELS:
+        estimate = complexity_estimator.estimate(parsed, all_tests)
+        code_analyzer.apply_complexity_estimate(code_quality, estimate)
+    
+    # Сохраняем результат (в coding_submissions, в user_answers - ссылка на него)
+    session.add_submission(task.task_id, code, language, result.to_dict(), code_quality, {
+        'score': calculate_code_score(result, code_quality),
+        'feedback': f"Тесты: {result.passed_tests}/{result.total_tests}, Качество: {code_quality['quality_score']}/100"
+    })
+    session.coding_task_count += 1
+    session.current_coding_task = None  # Очищаем текущую задачу
+    
+    total_items = session.question_count + session.coding_task_count
+    if on_event:
+        # Результат проверки не ждет итогов или следующей задачи
+        on_event('judged', {'test_results': result.to_dict(), 'code_quality': code_quality})
+    
+    print(f"✅ Тесты пройдено: {result.passed_tests}/{result.total_tests}")
+    print(f"📊 Качество кода: {code_quality['quality_score']}/100")
+    print(f"📈 Прогресс: {total_items}/{Config.TOTAL_QUESTIONS}")
+    
+    # Проверка на завершение (5+5=10)
+    if total_items >= Config.TOTAL_QUESTIONS:
+        session.is_active = False
+        session.cancel_prefetch()
+        if on_event:
+            for name, payload in stream_interview_summary(session):
+                if name == 'summary':
+                    summary = payload
+                else:
+                    on_event(name, payload)
+        else:
+            summary = generate_interview_summary(session)
+        return {
+            'success': True,
+            'test_results': result.to_dict(),
+            'code_quality': code_quality,
+            'interview_complete': True,
+            'summary': summary
+        }, 200
+    
+    # Генерация следующей задачи (только задачи программирования)
+    next_task_number = total_items + 1
+    print(f"🔄 Генерация задачи #{next_task_number}/{Config.TOTAL_QUESTIONS}...")
+    try:
+        # Обычно задача уже сгенерирована в фоне, пока кандидат решал текущую
+        coding_task = session.take_prefetched_task(language, next_task_number) or task_pool.get_task(
+            session.position, 
+            session.level, 
+            language,
+            task_number=next_task_number,
+            total_tasks=Config.TOTAL_QUESTIONS,
+            exclude_ids=session.seen_task_ids()
+        )
+        session.current_coding_task = coding_task
+        session.coding_tasks.append(coding_task)
+        session.prefetch_next_task()
+        
+        return {
+            'success': True,
+            'test_results': result.to_dict(),
+            'code_quality': code_quality,
+            'interview_complete': False,
+            'next_type': 'coding_task',
+            'task': coding_task.to_dict(),
+            'question_number': total_items + 1,
+            'total_questions': Config.TOTAL_QUESTIONS
+        }, 200
+    except Exception as e:
+        print(f"❌ Ошибка генерации задачи: {e}")
+        return {
+            'success': False,
+            'error': f'Ошибка генерации задачи: {str(e)}'
+        }, 500
+
+# С общим хранилищем сессий задания проверки тоже общие: опрос статуса
+# и поток событий могут прийти в любой воркер
+judge_queue = JudgeQueue(
+    judge_session,
+    workers=Config.JUDGE_WORKERS,
+    job_ttl=Config.JUDGE_JOB_TTL,
+    log=SQLiteJobLog(Config.SESSION_DB_PATH, Config.JUDGE_JOB_TTL) if Config.SESSION_STORE == 'sqlite' else None
+)
+
+@app.route('/api/judge_status/<job_id>', methods=['GET'])
+def judge_status(job_id):
+    """Состояние фоновой проверки решения"""
+    job = judge_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    return jsonify({'success': True, **job.to_dict()})
+
+@app.route('/api/judge_events/<job_id>', methods=['GET'])
+def judge_events(job_id):
+    """Поток SSE: результат каждого теста по мере готовности, затем итог"""
+    job = judge_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    def generate():
+        cursor = 0
+        while True:
+            events, finished = job.wait_events(cursor, timeout=15)
+            if not events and not finished:
+                yield ": ping\n\n"  # keep-alive для прокси
+                continue
+            for event, payload in events:
+                yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            cursor += len(events)
+            if finished and cursor >= len(job.events):
+                break
+    
+    return app.response_class(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 def calculate_code_score(result, code_quality):
     """Расчет оценки за задачу по программированию"""
     # 60% за прохождение тестов, 40% за качество кода
@@ -975,11 +1769,10 @@ def get_coding_task():
     try:
         session_id = request.args.get('session_id')
         
-        if session_id not in interview_sessions:
+        session = session_store.get(session_id)
+        if not session:
             return jsonify({'success': False, 'error': 'Session not found'}), 404
         
-        session = interview_sessions[session_id]
-        
         if not session.current_coding_task:
             return jsonify({'success': False, 'error': 'No active task'}), 404
         
@@ -993,24 +1786,45 @@ def get_coding_task():
 
 @app.route('/api/get_submissions', methods=['GET'])
 def get_submissions():
-    """Получение всех попыток решения"""
+    """Получение всех попыток решения.
+
+    По умолчанию без кода и результатов отдельных тестов; с details=1 -
+    полностью, включая условие задачи.
+    """
     try:
         session_id = request.args.get('session_id')
+        details = request.args.get('details') in ('1', 'true')
         
-        if session_id not in interview_sessions:
+        session = session_store.get(session_id)
+        if not session:
             return jsonify({'success': False, 'error': 'Session not found'}), 404
         
-        session = interview_sessions[session_id]
-        
         return jsonify({
             'success': True,
-            'submissions': session.coding_submissions,
+            'submissions': [session.submission_view(i, details) for i in range(len(session.coding_submissions))],
             'total_submissions': len(session.coding_submissions)
         })
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Счетчики подсистем проверки кода, генерации задач и хранилища сессий"""
+    return jsonify({
+        'success': True,
+        'sandbox_pool': dict(sandbox.stats) if sandbox else None,
+        'validation_sandbox_pool': dict(validation_sandbox.stats) if validation_sandbox else None,
+        'result_cache': result_cache.stats() if result_cache else None,
+        'task_pool': task_pool.stats(),
+        'task_prefetch': task_prefetcher.stats(),
+        'task_bank': task_bank.stats() if task_bank else None,
+        'task_validation': task_validator.stats(),
+        'llm': llm.stats(),
+        'llm_cache': llm_cache.stats() if llm_cache else None,
+        'sessions': session_store.stats()
+    })
+
 @app.route('/api/validate_code', methods=['POST'])
 def validate_code():
     """Валидация кода без запуска"""
@@ -1019,11 +1833,12 @@ def validate_code():
         code = data.get('code', '')
         language = data.get('language', 'python')
         
-        is_valid, message = code_runner.validate_code(code, language)
+        parsed = code_runner.parse(code) if language.lower() == 'python' else None
+        is_valid, message = code_runner.validate_code(code, language, parsed=parsed)
         
         if is_valid:
             # Дополнительный анализ
-            analysis = code_analyzer.analyze_code(code, language)
+            analysis = code_analyzer.analyze_code(code, language, parsed=parsed)
             
             return jsonify({
                 'success': True,
@@ -1042,7 +1857,7 @@ def validate_code():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 if __name__ == '__main__':
-    print("🚀 Запуск Interview AI с OpenAI клиентом")
+    print("🚀 Запуск Interview AI через шлюз LLM")
     print(f"🔧 Конфигурация:")
     print(f"   Base URL: {Config.LLM_BASE_URL}")
     print(f"   Model: {Config.LLM_MODEL}")
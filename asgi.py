@@ -0,0 +1,341 @@
+# asgi.py - Асинхронный вход приложения (ASGI): ожидание LLM и проверки кода без занятых потоков
+
+import json
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+import app as interview
+from app import Config, JudgeBusyError, SessionBusyError, judge_queue, session_store
+
+# Маршруты, которые большую часть времени ждут LLM или песочницу, обслуживаются
+# здесь корутинами: ожидание не занимает поток. Остальные (страницы, короткие
+# API) идут в Flask приложение через пул из Config.ASGI_WSGI_THREADS потоков.
+# JSON ответы совпадают с Flask-версиями маршрутов.
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def sse(name, payload):
+    return f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+def error(message, status_code):
+    return JSONResponse({'success': False, 'error': message}, status_code)
+
+def read_answer(data):
+    return (
+        data.get('answer', ''),
+        data.get('contains_code', False),
+        data.get('language', 'javascript')
+    )
+
+async def answer_session(session_id):
+    """Сессия для ответа: (session, None) или (None, (ошибка, HTTP код))"""
+    session = await asyncio.to_thread(session_store.get, session_id)
+    if not session:
+        return None, ('Session not found', 404)
+    if not session.is_active:
+        return None, ('Interview completed', 400)
+    return session, None
+
+async def code_session(session_id):
+    """Сессия для решения: (session, None) или (None, (ошибка, HTTP код))"""
+    session = await asyncio.to_thread(session_store.get, session_id)
+    if not session:
+        return None, ('Session not found', 404)
+    if not session.current_coding_task:
+        return None, ('No active coding task', 400)
+    return session, None
+
+async def prepare_next_question(session):
+    """Следующий вопрос заранее, без блокировки сессии (если после ответа будет вопрос)"""
+    if interview.next_is_question(session.question_count + 1, session.coding_task_count):
+        return await interview.agenerate_interview_question(session)
+    return None
+
+async def answer_events(session, answer, contains_code, language):
+    """События потоковой оценки ответа: (имя, данные), последним - done с ответом API"""
+    try:
+        question = session.current_question
+        evaluation = None
+        async for name, payload in interview.astream_evaluation(
+            question, answer, session.position, session.level, contains_code, language
+        ):
+            if name == 'evaluation':
+                evaluation = payload
+            yield name, payload
+
+        next_question = await prepare_next_question(session)
+        committed, response_data, status_code = await asyncio.to_thread(
+            interview.commit_answer, session.session_id, question, answer, evaluation,
+            contains_code, language, next_question
+        )
+        if status_code == 200 and response_data['interview_complete']:
+            async for name, payload in interview.astream_interview_summary(committed):
+                if name == 'summary':
+                    response_data['summary'] = payload
+                yield name, payload
+        yield 'done', response_data
+
+    except Exception as e:
+        print(f"❌ Ошибка отправки ответа: {e}")
+        yield 'done', {'success': False, 'error': str(e)}
+
+async def submit_job(session, data):
+    """Задание проверки; очередь пишет в журнал заданий (SQLite) - в потоке, не в loop"""
+    return await asyncio.to_thread(
+        judge_queue.submit,
+        session.session_id,
+        len(session.current_coding_task.test_cases),
+        session.session_id, data.get('code', ''), data.get('language', 'python')
+    )
+
+async def job_events(job, timeout=15):
+    """События задания проверки по мере публикации; (None, None) - ничего за timeout"""
+    cursor = 0
+    while True:
+        events, finished = await job.await_events(cursor, timeout)
+        if not events and not finished:
+            yield None, None
+            continue
+        for event, payload in events:
+            yield event, payload
+        cursor += len(events)
+        if finished and cursor >= len(job.events):
+            break
+
+async def submit_answer(request):
+    """Асинхронный /api/submit_answer.
+
+    Оценка и следующий вопрос получаются от LLM без блокировки сессии,
+    под блокировкой (в потоке) только записывается ответ - см. commit_answer.
+    """
+    try:
+        data = await request.json()
+        answer, contains_code, language = read_answer(data)
+        session, failure = await answer_session(data.get('session_id'))
+        if failure:
+            return error(*failure)
+
+        question = session.current_question
+        evaluation = await interview.aevaluate_answer(
+            question, answer, session.position, session.level, contains_code, language
+        )
+        next_question = await prepare_next_question(session)
+
+        session, response_data, status_code = await asyncio.to_thread(
+            interview.commit_answer, session.session_id, question, answer, evaluation,
+            contains_code, language, next_question
+        )
+        if status_code == 200 and response_data['interview_complete']:
+            response_data['summary'] = await interview.agenerate_interview_summary(session)
+        return JSONResponse(response_data, status_code)
+
+    except SessionBusyError as e:
+        return error(str(e), 409)
+    except Exception as e:
+        print(f"❌ Ошибка отправки ответа: {e}")
+        return error(str(e), 500)
+
+async def submit_answer_stream(request):
+    """Асинхронный /api/submit_answer_stream (SSE), события как у Flask-версии"""
+    data = await request.json()
+    session, failure = await answer_session(data.get('session_id'))
+    if failure:
+        return error(*failure)
+
+    async def generate():
+        async for name, payload in answer_events(session, *read_answer(data)):
+            yield sse(name, payload)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+async def submit_code(request):
+    """Асинхронный /api/submit_code: проверка идет в очереди проверки, запрос ее только ждет"""
+    try:
+        data = await request.json()
+        session, failure = await code_session(data.get('session_id'))
+        if failure:
+            return error(*failure)
+
+        job = await submit_job(session, data)
+        if data.get('async'):
+            return JSONResponse({
+                'success': True,
+                'job_id': job.job_id,
+                'status': job.status,
+                'total_tests': job.total_tests,
+                'status_url': f"/api/judge_status/{job.job_id}",
+                'events_url': f"/api/judge_events/{job.job_id}"
+            }, 202)
+
+        async for _ in job_events(job):
+            pass
+        return JSONResponse(job.result, job.status_code)
+
+    except JudgeBusyError as e:
+        return error(str(e), 409)
+    except Exception as e:
+        print(f"❌ Ошибка проверки кода: {e}")
+        return error(str(e), 500)
+
+async def judge_events(request):
+    """Асинхронный /api/judge_events/<job_id> (SSE)"""
+    job = await asyncio.to_thread(judge_queue.get, request.path_params['job_id'])
+    if not job:
+        return error('Job not found', 404)
+
+    async def generate():
+        async for event, payload in job_events(job):
+            yield ": ping\n\n" if event is None else sse(event, payload)  # ping - keep-alive для прокси
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+class InterviewChannel:
+    """Канал собеседования поверх WebSocket: /ws/interview[?session_id=...].
+
+    Клиент отправляет JSON сообщения {"type": ...}:
+      start  - новое собеседование (position, level), ответ как у /api/start_interview;
+      answer - ответ на вопрос (answer, contains_code, language);
+      code   - решение задачи (code, language);
+      ping   - проверка связи (ответ pong).
+    Сервер отвечает сообщениями {"event": имя, "data": данные} с теми же
+    событиями, что и потоки SSE (token, score, evaluation, test, judged,
+    summary_token, summary), и последним done с ответом API. Без запроса
+    сервер присылает task_ready, когда следующая задача сессии
+    сгенерирована в фоне. Сообщения обрабатываются по очереди.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.session_id = websocket.query_params.get('session_id')
+        self.loop = asyncio.get_running_loop()
+        self.outbox = asyncio.Queue()
+        self.watched = set()  # Упреждения, о готовности которых уже сообщаем
+        self.closed = False
+
+    def send(self, name, payload):
+        if not self.closed:
+            self.outbox.put_nowait((name, payload))
+
+    async def sender(self):
+        # Единственный писатель в сокет: ответы и push-события не перемешиваются
+        while True:
+            name, payload = await self.outbox.get()
+            await self.websocket.send_text(
+                json.dumps({'event': name, 'data': payload}, ensure_ascii=False, separators=(',', ':'))
+            )
+
+    def watch_next_task(self):
+        """task_ready, как только упреждающая генерация следующей задачи завершится.
+
+        Упреждения живут в процессе, который их запустил: если сессию
+        обслуживает другой воркер, уведомления просто не будет.
+        """
+        pending = interview.pending_task_prefetch(self.session_id) if self.session_id else None
+        if not pending or pending[1] in self.watched:
+            return
+        task_number, prefetch = pending
+        self.watched.add(prefetch)
+
+        def ready(future):
+            if future.cancelled() or future.exception() or prefetch.cancelled:
+                return
+            task = future.result()
+            payload = {'task_number': task_number, 'title': task.title, 'difficulty': task.difficulty}
+            try:
+                self.loop.call_soon_threadsafe(self.send, 'task_ready', payload)
+            except RuntimeError:
+                pass  # Event loop уже закрыт
+
+        prefetch.future.add_done_callback(ready)
+
+    async def start(self, message):
+        response_data, _ = await asyncio.to_thread(
+            interview.create_interview,
+            message.get('position', 'Frontend разработчик'),
+            message.get('level', 'Middle'),
+            message.get('fan_out', Config.INTERVIEW_FAN_OUT)
+        )
+        if response_data['success']:
+            self.session_id = response_data['session_id']
+            self.watched.clear()
+        self.send('done', response_data)
+
+    async def answer(self, message):
+        session, failure = await answer_session(self.session_id)
+        if failure:
+            self.send('done', {'success': False, 'error': failure[0]})
+            return
+        async for name, payload in answer_events(session, *read_answer(message)):
+            self.send(name, payload)
+
+    async def code(self, message):
+        session, failure = await code_session(self.session_id)
+        if failure:
+            self.send('done', {'success': False, 'error': failure[0]})
+            return
+        job = await submit_job(session, message)
+        async for event, payload in job_events(job):
+            if event == 'done':
+                self.send('done', payload['result'])
+            elif event is not None:
+                self.send(event, payload)
+
+    async def handle(self, message):
+        kind = message.get('type')
+        if kind == 'ping':
+            self.send('pong', {})
+        elif kind in ('start', 'answer', 'code'):
+            await getattr(self, kind)(message)
+        else:
+            self.send('done', {'success': False, 'error': f'Unknown message type: {kind}'})
+        self.watch_next_task()
+
+    async def run(self):
+        await self.websocket.accept()
+        sender = asyncio.create_task(self.sender())
+        self.watch_next_task()
+        try:
+            while True:
+                try:
+                    message = json.loads(await self.websocket.receive_text())
+                except ValueError:
+                    self.send('done', {'success': False, 'error': 'Invalid JSON'})
+                    continue
+                try:
+                    await self.handle(message)
+                except Exception as e:
+                    print(f"❌ Ошибка канала собеседования: {e}")
+                    self.send('done', {'success': False, 'error': str(e)})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.closed = True
+            sender.cancel()
+
+async def interview_socket(websocket):
+    await InterviewChannel(websocket).run()
+
+application = Starlette(
+    routes=[
+        Route('/api/submit_answer', submit_answer, methods=['POST']),
+        Route('/api/submit_answer_stream', submit_answer_stream, methods=['POST']),
+        Route('/api/submit_code', submit_code, methods=['POST']),
+        Route('/api/judge_events/{job_id}', judge_events),
+        WebSocketRoute('/ws/interview', interview_socket),
+        Mount('/', app=WSGIMiddleware(interview.app, workers=Config.ASGI_WSGI_THREADS))
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])]
+)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("🚀 Запуск Interview AI (ASGI)")
+    uvicorn.run(application, host='0.0.0.0', port=5000)
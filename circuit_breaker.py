@@ -0,0 +1,93 @@
+# circuit_breaker.py - Размыкатель цепи по задержке и доле ошибок
+
+import time
+import threading
+from collections import deque
+from typing import Dict
+
+class CircuitBreaker:
+    """Размыкатель цепи для внешнего сервиса.
+
+    Хранит скользящее окно последних window вызовов (задержка, успех).
+    Цепь размыкается, когда в окне не меньше min_calls вызовов и p95
+    задержки превышает latency_slo или доля ошибок достигает error_rate.
+    Разомкнутая цепь сразу отказывает в вызовах open_sec секунд, после
+    чего пропускает один пробный вызов (half_open): его успех замыкает
+    цепь, ошибка - снова размыкает.
+    """
+
+    def __init__(self, latency_slo: float, error_rate: float = 0.5,
+                 window: int = 50, min_calls: int = 10, open_sec: float = 30.0):
+        self.latency_slo = latency_slo
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.open_sec = open_sec
+        self.state = 'closed'  # closed, open, half_open
+        self._calls = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Можно ли выполнять вызов сейчас"""
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.open_sec:
+                self.state = 'half_open'
+                self._probe_in_flight = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            if self.state == 'half_open':
+                if ok and latency <= self.latency_slo:
+                    self.state = 'closed'
+                    self._calls.clear()
+                else:
+                    self._open()
+                return
+            self._calls.append((latency, ok))
+            if self.state == 'closed' and self._should_trip():
+                self._open()
+
+    def cancel(self):
+        """Разрешенный вызов не состоялся (например, не дождался слота)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _should_trip(self) -> bool:
+        if len(self._calls) < self.min_calls:
+            return False
+        errors = sum(1 for _, ok in self._calls if not ok)
+        return errors / len(self._calls) >= self.error_rate or self._p95() > self.latency_slo
+
+    def _p95(self) -> float:
+        latencies = sorted(latency for latency, _ in self._calls)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+
+    def _open(self):
+        self.state = 'open'
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self.trips += 1
+        print(f"🔌 Цепь разомкнута на {self.open_sec}с (p95 {self._p95():.2f}с, SLO {self.latency_slo}с)")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls = len(self._calls)
+            errors = sum(1 for _, ok in self._calls if not ok)
+            return {
+                'state': self.state,
+                'p95_sec': round(self._p95(), 3),
+                'latency_slo_sec': self.latency_slo,
+                'error_rate': round(errors / calls, 3) if calls else 0.0,
+                'trips': self.trips,
+                'rejected': self.rejected
+            }
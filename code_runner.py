@@ -6,8 +6,13 @@ import time
 import traceback
 import json
 import signal
+import threading
+import copy
+import types
+import hashlib
+from collections import OrderedDict
 from contextlib import contextmanager
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Optional
 import ast
 import re
 
@@ -32,8 +37,9 @@ class CodeExecutionResult:
         self.success = False
         self.output = ""
         self.error = ""
-        self.execution_time = 0
-        self.memory_used = 0
+        self.execution_time = 0  # Суммарное время тестов, с
+        self.cpu_time = 0  # Суммарное процессорное время тестов, с
+        self.memory_used = 0  # Максимальный пик памяти среди тестов, КБ
         self.test_results = []
         self.passed_tests = 0
         self.total_tests = 0
@@ -44,20 +50,44 @@ class CodeExecutionResult:
             'output': self.output,
             'error': self.error,
             'execution_time': round(self.execution_time, 3),
+            'cpu_time': round(self.cpu_time, 3),
+            'max_test_time': round(max((tr.get('execution_time', 0) for tr in self.test_results), default=0), 6),
             'memory_used': self.memory_used,
             'test_results': self.test_results,
             'passed_tests': self.passed_tests,
             'total_tests': self.total_tests,
             'pass_rate': round(self.passed_tests / self.total_tests * 100, 1) if self.total_tests > 0 else 0
         }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CodeExecutionResult':
+        """Восстановление результата из to_dict() (например, из кэша)"""
+        result = cls()
+        result.success = data['success']
+        result.output = data['output']
+        result.error = data['error']
+        result.execution_time = data['execution_time']
+        result.cpu_time = data.get('cpu_time', 0)
+        result.memory_used = data['memory_used']
+        result.test_results = [dict(tr) for tr in data['test_results']]
+        result.passed_tests = data['passed_tests']
+        result.total_tests = data['total_tests']
+        return result
+    
+    def aggregate_metrics(self):
+        """Сводные метрики по замерам отдельных тестов"""
+        self.execution_time = sum(tr.get('execution_time', 0) for tr in self.test_results)
+        self.cpu_time = sum(tr.get('cpu_time', 0) for tr in self.test_results)
+        self.memory_used = max((tr.get('memory_used', 0) for tr in self.test_results), default=0)
 
 class TestResult:
     """Результат одного теста"""
-    def __init__(self, test_case, passed, actual_output=None, error=None):
+    def __init__(self, test_case, passed, actual_output=None, error=None, meter=None):
         self.test_case = test_case
         self.passed = passed
         self.actual_output = actual_output
         self.error = error
+        self.meter = meter  # ResourceMeter с замерами теста (если тест запускался)
         
     def to_dict(self):
         result = {
@@ -71,23 +101,98 @@ class TestResult:
             result['actual'] = str(self.actual_output)
         if self.error:
             result['error'] = self.error
+        if self.meter is not None:
+            result['execution_time'] = round(self.meter.wall_time, 6)
+            result['cpu_time'] = round(self.meter.cpu_time, 6)
+            result['memory_used'] = self.meter.peak_memory_kb
             
         return result
 
+def _read_proc_status_kb(field: str) -> int:
+    """Значение поля /proc/self/status в КБ (Linux), 0 если недоступно"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+def _reset_peak_rss() -> bool:
+    """Сброс пика RSS процесса (VmHWM), Linux >= 4.0"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _max_rss_kb() -> int:
+    """Пиковый RSS процесса по getrusage (на macOS ru_maxrss в байтах)"""
+    if not HAS_RESOURCE:
+        return 0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss // 1024 if sys.platform == 'darwin' else max_rss
+
+def _cpu_time():
+    """Процессорное время процесса (user + sys) в секундах.
+
+    Учитывает и потоки, запущенные решением. Без resource - process_time().
+    """
+    if not HAS_RESOURCE:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+class ResourceMeter:
+    """Замер одного теста: время, процессорное время (user + sys) и пик памяти.
+
+    Пик памяти - прирост RSS над уровнем до теста. На Linux счетчик пика
+    сбрасывается перед каждым тестом, иначе используется ru_maxrss
+    (учитывает только превышение прежнего пика процесса).
+    """
+
+    def __init__(self):
+        self.wall_time = 0
+        self.cpu_time = 0
+        self.peak_memory_kb = 0
+
+    def __enter__(self):
+        self._proc_peak = _reset_peak_rss()
+        if self._proc_peak:
+            self._rss_before = _read_proc_status_kb('VmRSS:')
+        else:
+            self._rss_before = _max_rss_kb()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = _cpu_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cpu_time = _cpu_time() - self._cpu_start
+        self.wall_time = time.perf_counter() - self._wall_start
+        if self._proc_peak:
+            peak = _read_proc_status_kb('VmHWM:')
+        else:
+            peak = _max_rss_kb()
+        self.peak_memory_kb = max(0, peak - self._rss_before)
+        return False
+
 @contextmanager
 def time_limit(seconds):
-    """Контекстный менеджер для ограничения времени выполнения"""
+    """Контекстный менеджер для ограничения времени выполнения (секунды, можно дробные)"""
     def signal_handler(signum, frame):
-        raise TimeoutException(f"Превышено время выполнения ({seconds}с)")
+        raise TimeoutException(f"Превышено время выполнения ({round(seconds, 2):g}с)")
     
     # Устанавливаем обработчик только на Unix-подобных системах
-    if hasattr(signal, 'SIGALRM'):
+    # и только в главном потоке (иначе signal.signal бросает ValueError)
+    if hasattr(signal, 'SIGALRM') and threading.current_thread() is threading.main_thread():
         signal.signal(signal.SIGALRM, signal_handler)
-        signal.alarm(seconds)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
         try:
             yield
         finally:
-            signal.alarm(0)
+            signal.setitimer(signal.ITIMER_REAL, 0)
     else:
         # На Windows используем простой таймаут без сигналов
         yield
@@ -106,162 +211,456 @@ def memory_limit(max_memory_mb):
         # На Windows просто пропускаем ограничение памяти
         yield
 
+# Разрешенные встроенные функции для кода кандидата
+SAFE_BUILTINS = {
+    'range': range,
+    'len': len,
+    'str': str,
+    'int': int,
+    'float': float,
+    'list': list,
+    'dict': dict,
+    'set': set,
+    'tuple': tuple,
+    'bool': bool,
+    'abs': abs,
+    'max': max,
+    'min': min,
+    'sum': sum,
+    'sorted': sorted,
+    'enumerate': enumerate,
+    'zip': zip,
+    'map': map,
+    'filter': filter,
+    'print': print,
+    'True': True,
+    'False': False,
+    'None': None,
+}
+
+# Имена, использование которых в коде кандидата запрещено
+FORBIDDEN_NAMES = [
+    'os', 'sys', 'subprocess', 'eval', 'exec', 
+    '__import__', 'open', 'file', 'input',
+    'compile', 'execfile', 'reload'
+]
+
+# Встроенные функции, дающие доступ к пространствам имен интерпретатора
+DANGEROUS_CALLS = ['globals', 'locals', 'vars']
+
+class _SubmissionVisitor(ast.NodeVisitor):
+    """Один проход по AST: безопасность, точка входа, сложность, имена"""
+
+    def __init__(self, forbidden_names):
+        self.forbidden_names = set(forbidden_names)
+        self.violation = None
+        self.first_function = None
+        self.top_level_functions = []
+        self.function_names = []
+        self.complexity = 1  # Базовая сложность
+        self._depth = 0
+
+    def _forbid(self, message: str):
+        if self.violation is None:
+            self.violation = message
+
+    def _check_name(self, name: str):
+        if name in self.forbidden_names:
+            self._forbid(f"Запрещено использование '{name}'")
+        elif name in DANGEROUS_CALLS:
+            self._forbid(f"Обнаружен потенциально опасный код: {name}()")
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self._check_name(alias.name.split('.')[0])
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node):
+        if node.module:
+            self._check_name(node.module.split('.')[0])
+        for alias in node.names:
+            self._check_name(alias.name)
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id in self.forbidden_names or node.id in DANGEROUS_CALLS:
+            self._check_name(node.id)
+        elif node.id.startswith('__') and node.id.endswith('__'):
+            self._forbid(f"Обнаружен потенциально опасный код: {node.id}")
+
+    def visit_Attribute(self, node):
+        # Доступ к служебным атрибутам (__class__, __globals__ ...) - путь выхода из песочницы
+        if node.attr.startswith('__') and node.attr.endswith('__') and node.attr != '__init__':
+            self._forbid(f"Обнаружен потенциально опасный код: .{node.attr}")
+        self.generic_visit(node)
+
+    def _visit_function(self, node):
+        if self.first_function is None:
+            self.first_function = node.name
+        if self._depth == 0:
+            self.top_level_functions.append(node.name)
+        self.function_names.append(node.name)
+        self._depth += 1
+        self.generic_visit(node)
+        self._depth -= 1
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_ClassDef(self, node):
+        self._depth += 1
+        self.generic_visit(node)
+        self._depth -= 1
+
+    def _visit_branch(self, node):
+        self.complexity += 1
+        self.generic_visit(node)
+
+    visit_If = _visit_branch
+    visit_While = _visit_branch
+    visit_For = _visit_branch
+    visit_ExceptHandler = _visit_branch
+
+    def visit_BoolOp(self, node):
+        self.complexity += len(node.values) - 1
+        self.generic_visit(node)
+
+class ParsedSubmission:
+    """Решение кандидата, разобранное один раз.
+
+    Результаты единственного прохода по AST используются и для проверки
+    безопасности, и для поиска тестируемой функции, и для анализа качества.
+    Проверки работают по дереву, поэтому слова в строках и комментариях
+    не считаются нарушениями.
+    """
+
+    def __init__(self, code: str, forbidden_names=None):
+        self.code = code
+        self.tree = None
+        self.is_valid = True
+        self.message = "OK"
+        self.function_name = None
+        self.function_names = []
+        self.complexity = 1
+
+        lines = code.split('\n')
+        self.total_lines = len(lines)
+        self.comment_lines = sum(1 for line in lines if line.strip().startswith('#'))
+        self.lines_of_code = sum(
+            1 for line in lines if line.strip() and not line.strip().startswith('#')
+        )
+        self.long_lines = sum(1 for line in lines if len(line) > 100)
+
+        try:
+            self.tree = ast.parse(code)
+        except SyntaxError as e:
+            self.is_valid = False
+            self.message = f"Синтаксическая ошибка: {str(e)}"
+            return
+
+        visitor = _SubmissionVisitor(forbidden_names or FORBIDDEN_NAMES)
+        visitor.visit(self.tree)
+
+        if visitor.violation:
+            self.is_valid = False
+            self.message = visitor.violation
+
+        # Тестируется первая функция верхнего уровня
+        if visitor.top_level_functions:
+            self.function_name = visitor.top_level_functions[0]
+        else:
+            self.function_name = visitor.first_function
+        self.function_names = visitor.function_names
+        self.complexity = visitor.complexity
+
+class SubmissionState:
+    """Пространство имен решения, выполненного один раз.
+
+    Снимок глобальных переменных и значений аргументов по умолчанию
+    позволяет дешево сбрасывать состояние между тестами вместо
+    повторного exec всего решения.
+    """
+
+    def __init__(self, code_obj, function_name: str):
+        self.code_obj = code_obj
+        self.function_name = function_name
+        self.namespace = {}
+        self._snapshot = None
+        self._defaults = None
+        self._load()
+
+    def _load(self):
+        self.namespace.clear()
+        self.namespace['__builtins__'] = dict(SAFE_BUILTINS)
+        exec(self.code_obj, self.namespace)
+
+        try:
+            user_state = {k: v for k, v in self.namespace.items() if k != '__builtins__'}
+            self._snapshot = copy.deepcopy(user_state)
+            self._defaults = {
+                name: copy.deepcopy((fn.__defaults__, fn.__kwdefaults__))
+                for name, fn in user_state.items()
+                if isinstance(fn, types.FunctionType)
+            }
+        except Exception:
+            # Состояние не копируется - сбрасываем повторным exec (без перекомпиляции)
+            self._snapshot = None
+
+    @property
+    def function(self):
+        return self.namespace.get(self.function_name)
+
+    def reset(self):
+        """Восстановление состояния модуля перед очередным тестом"""
+        if self._snapshot is None:
+            self._load()
+            return
+
+        # Словарь очищается на месте: __globals__ функций ссылается именно на него
+        self.namespace.clear()
+        self.namespace['__builtins__'] = dict(SAFE_BUILTINS)
+        self.namespace.update(copy.deepcopy(self._snapshot))
+        for name, (defaults, kwdefaults) in self._defaults.items():
+            fn = self.namespace.get(name)
+            if isinstance(fn, types.FunctionType):
+                fn.__defaults__ = copy.deepcopy(defaults)
+                fn.__kwdefaults__ = copy.deepcopy(kwdefaults)
+
+# Ошибки, зависящие от нагрузки на сервер, а не от решения - такие результаты не кэшируются
+TRANSIENT_ERRORS = ("Превышено время", "Превышен лимит", "Процесс-песочница")
+
+class ResultCache:
+    """LRU кэш результатов проверки.
+
+    Ключ - хэш нормализованного кода, полного списка тестов и лимитов,
+    поэтому повторная отправка того же решения не запускает песочницу.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_code(code: str) -> str:
+        """Стиль переводов строк и пустые строки по краям не влияют на ключ.
+
+        Пробелы внутри строк не трогаем: они могут быть частью строковых литералов.
+        """
+        return code.replace('\r\n', '\n').replace('\r', '\n').lstrip('\n').rstrip()
+
+    def make_key(self, code: str, test_cases: List[Dict],
+                 time_limit_sec: float, memory_limit_mb: int) -> str:
+        payload = json.dumps({
+            'code': self.normalize_code(code),
+            'tests': test_cases,
+            'time_limit': time_limit_sec,
+            'memory_limit': memory_limit_mb
+        }, sort_keys=True, ensure_ascii=False, default=repr)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, result: 'CodeExecutionResult'):
+        if any(tr.get('error', '').startswith(TRANSIENT_ERRORS) for tr in result.test_results):
+            return
+        data = result.to_dict()
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
 class CodeRunner:
     """Безопасный запуск кода с проверкой тестов"""
     
-    def __init__(self):
-        self.forbidden_imports = [
-            'os', 'sys', 'subprocess', 'eval', 'exec', 
-            '__import__', 'open', 'file', 'input',
-            'compile', 'execfile', 'reload'
-        ]
+    def __init__(self, sandbox_pool=None, result_cache: Optional[ResultCache] = None):
+        # Пул процессов-песочниц (sandbox_pool.SandboxPool).
+        # Если не задан - тесты выполняются в текущем процессе
+        self.sandbox_pool = sandbox_pool
+        # Кэш результатов проверки (ResultCache), необязателен
+        self.result_cache = result_cache
+        self.forbidden_imports = list(FORBIDDEN_NAMES)
         
-    def validate_code(self, code: str, language: str) -> tuple[bool, str]:
+    def parse(self, code: str) -> ParsedSubmission:
+        """Единственный разбор решения для проверки, запуска и анализа"""
+        return ParsedSubmission(code, self.forbidden_imports)
+        
+    def validate_code(self, code: str, language: str,
+                      parsed: Optional[ParsedSubmission] = None) -> tuple[bool, str]:
         """Проверка кода на безопасность"""
         
         if language.lower() == 'python':
-            # Проверка на запрещенные импорты
-            for forbidden in self.forbidden_imports:
-                if re.search(r'\b' + forbidden + r'\b', code):
-                    return False, f"Запрещено использование '{forbidden}'"
-            
-            # Проверка на опасные операции
-            dangerous_patterns = [
-                r'__.*__',  # dunder методы (кроме основных)
-                r'eval\s*\(',
-                r'exec\s*\(',
-                r'compile\s*\(',
-                r'globals\s*\(',
-                r'locals\s*\(',
-                r'vars\s*\(',
-            ]
-            
-            for pattern in dangerous_patterns:
-                if re.search(pattern, code):
-                    return False, f"Обнаружен потенциально опасный код: {pattern}"
-            
-            # Проверка синтаксиса Python
-            try:
-                ast.parse(code)
-            except SyntaxError as e:
-                return False, f"Синтаксическая ошибка: {str(e)}"
+            parsed = parsed or self.parse(code)
+            return parsed.is_valid, parsed.message
                 
         return True, "OK"
     
     def run_python_code(self, code: str, test_cases: List[Dict], 
-                       time_limit_sec: int = 5, 
-                       memory_limit_mb: int = 128) -> CodeExecutionResult:
-        """Выполнение Python кода с тестами"""
+                       time_limit_sec: float = 5, 
+                       memory_limit_mb: int = 128,
+                       on_result: Optional[Callable[[int, Dict], None]] = None,
+                       parsed: Optional[ParsedSubmission] = None) -> CodeExecutionResult:
+        """Выполнение Python кода с тестами.
+
+        on_result(index, test_result) вызывается по мере готовности каждого теста.
+        parsed - уже разобранное решение (чтобы не разбирать код повторно).
+        """
+        
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.make_key(code, test_cases, time_limit_sec, memory_limit_mb)
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                result = CodeExecutionResult.from_dict(cached)
+                if on_result:
+                    for index, test_result in enumerate(result.test_results):
+                        on_result(index, test_result)
+                return result
+        
+        result = self._execute_python_code(
+            parsed or self.parse(code), test_cases, time_limit_sec, memory_limit_mb, on_result
+        )
+        
+        if cache_key is not None:
+            self.result_cache.put(cache_key, result)
+        
+        return result
+    
+    def _execute_python_code(self, parsed: ParsedSubmission, test_cases: List[Dict],
+                             time_limit_sec: float, memory_limit_mb: int,
+                             on_result: Optional[Callable[[int, Dict], None]] = None) -> CodeExecutionResult:
+        """Валидация, компиляция и запуск тестов (без кэша)"""
         
         result = CodeExecutionResult()
         result.total_tests = len(test_cases)
         
         # Валидация кода
-        is_valid, validation_error = self.validate_code(code, 'python')
-        if not is_valid:
-            result.error = validation_error
+        if not parsed.is_valid:
+            result.error = parsed.message
             return result
         
-        # Извлечение имени функции из кода
-        function_name = self._extract_function_name(code)
+        # Имя функции найдено при разборе
+        function_name = parsed.function_name
         if not function_name:
             result.error = "Не найдена функция для тестирования"
             return result
         
-        # Выполнение тестов
-        for test_case in test_cases:
+        # Компиляция один раз на все тесты
+        try:
+            code_obj = compile(parsed.tree, '<solution>', 'exec')
+        except (SyntaxError, ValueError) as e:
+            result.error = f"Ошибка компиляции: {str(e)}"
+            return result
+        
+        # Выполнение тестов: в процессе-песочнице из пула или в текущем процессе
+        if self.sandbox_pool is not None:
+            test_results = self.sandbox_pool.run_tests(
+                code_obj, function_name, test_cases, time_limit_sec, memory_limit_mb,
+                on_result=on_result
+            )
+        else:
+            test_results = self._run_tests(
+                code_obj, function_name, test_cases, time_limit_sec, memory_limit_mb,
+                on_result=on_result
+            )
+        
+        result.test_results = test_results
+        result.passed_tests = sum(1 for tr in test_results if tr['passed'])
+        result.aggregate_metrics()
+        
+        result.success = result.passed_tests == result.total_tests
+        
+        return result
+    
+    def _run_tests(self, code_obj, function_name: str, test_cases: List[Dict],
+                   time_limit_sec: float, memory_limit_mb: int,
+                   on_result: Optional[Callable[[int, Dict], None]] = None) -> List[Dict]:
+        """Последовательный запуск тестов в текущем процессе.
+
+        Решение выполняется один раз, перед каждым тестом состояние
+        модуля сбрасывается к снимку.
+        """
+        try:
+            with time_limit(time_limit_sec):
+                state = SubmissionState(code_obj, function_name)
+        except Exception as e:
+            error = str(e) if isinstance(e, TimeoutException) else f"Ошибка выполнения: {str(e)}"
+            return self._fail_all(test_cases, error, on_result)
+        
+        if not state.function:
+            return self._fail_all(test_cases, f"Функция '{function_name}' не найдена", on_result)
+        
+        test_results = []
+        for index, test_case in enumerate(test_cases):
             try:
+                if index > 0:
+                    state.reset()
                 test_result = self._run_single_test(
-                    code, 
-                    function_name, 
+                    state.function,
                     test_case,
-                    time_limit_sec,
-                    memory_limit_mb
+                    time_limit_sec
                 )
-                
-                result.test_results.append(test_result.to_dict())
-                if test_result.passed:
-                    result.passed_tests += 1
-                    
             except Exception as e:
                 test_result = TestResult(
                     test_case,
                     False,
                     error=f"Ошибка выполнения теста: {str(e)}"
                 )
-                result.test_results.append(test_result.to_dict())
-        
-        result.success = result.passed_tests == result.total_tests
-        
-        return result
+            test_results.append(test_result.to_dict())
+            if on_result:
+                on_result(index, test_results[-1])
+        return test_results
+    
+    def _fail_all(self, test_cases: List[Dict], error: str,
+                  on_result: Optional[Callable[[int, Dict], None]] = None) -> List[Dict]:
+        """Все тесты провалены с одной и той же ошибкой"""
+        test_results = []
+        for index, test_case in enumerate(test_cases):
+            test_results.append(TestResult(test_case, False, error=error).to_dict())
+            if on_result:
+                on_result(index, test_results[-1])
+        return test_results
     
     def _extract_function_name(self, code: str) -> str:
         """Извлечение имени функции из кода"""
-        try:
-            tree = ast.parse(code)
-            for node in ast.walk(tree):
-                if isinstance(node, ast.FunctionDef):
-                    return node.name
-        except:
-            pass
-        return None
+        return self.parse(code).function_name
     
-    def _run_single_test(self, code: str, function_name: str, 
-                        test_case: Dict, time_limit_sec: int,
-                        memory_limit_mb: int) -> TestResult:
-        """Выполнение одного теста"""
+    def _run_single_test(self, user_function, test_case: Dict,
+                        time_limit_sec: float) -> TestResult:
+        """Выполнение одного теста с замером времени, CPU и памяти"""
         
-        start_time = time.time()
+        meter = ResourceMeter()
         
         try:
-            # Создаем безопасное окружение для выполнения
-            safe_globals = {
-                '__builtins__': {
-                    'range': range,
-                    'len': len,
-                    'str': str,
-                    'int': int,
-                    'float': float,
-                    'list': list,
-                    'dict': dict,
-                    'set': set,
-                    'tuple': tuple,
-                    'bool': bool,
-                    'abs': abs,
-                    'max': max,
-                    'min': min,
-                    'sum': sum,
-                    'sorted': sorted,
-                    'enumerate': enumerate,
-                    'zip': zip,
-                    'map': map,
-                    'filter': filter,
-                    'print': print,
-                    'True': True,
-                    'False': False,
-                    'None': None,
-                }
-            }
-            
-            # Выполняем код пользователя
-            exec(code, safe_globals)
-            
-            # Получаем функцию
-            user_function = safe_globals.get(function_name)
-            if not user_function:
-                return TestResult(
-                    test_case,
-                    False,
-                    error=f"Функция '{function_name}' не найдена"
-                )
-            
             # Подготавливаем входные данные
             test_input = test_case['input']
             expected_output = test_case['expected']
             
             # Запускаем с ограничениями
             try:
-                with time_limit(time_limit_sec):
+                with time_limit(time_limit_sec), meter:
                     # Вызываем функцию с тестовыми данными
                     # Если input - это список с одним элементом (аргументы функции), распаковываем
                     if isinstance(test_input, list) and len(test_input) == 1:
@@ -270,34 +669,45 @@ class CodeRunner:
                         actual_output = user_function(*test_input)
                     else:
                         actual_output = user_function(test_input)
-                    
-                    # Сравниваем результат
-                    passed = self._compare_outputs(actual_output, expected_output)
-                    
-                    return TestResult(
-                        test_case,
-                        passed,
-                        actual_output=actual_output
-                    )
+                
+                # Сравниваем результат
+                passed = self._compare_outputs(actual_output, expected_output)
+                
+                return TestResult(
+                    test_case,
+                    passed,
+                    actual_output=actual_output,
+                    meter=meter
+                )
                     
             except TimeoutException as e:
                 return TestResult(
                     test_case,
                     False,
-                    error=str(e)
+                    error=str(e),
+                    meter=meter
                 )
             except RecursionError:
                 return TestResult(
                     test_case,
                     False,
-                    error="Превышена максимальная глубина рекурсии"
+                    error="Превышена максимальная глубина рекурсии",
+                    meter=meter
+                )
+            except MemoryError:
+                return TestResult(
+                    test_case,
+                    False,
+                    error="Превышен лимит памяти",
+                    meter=meter
                 )
                 
         except Exception as e:
             return TestResult(
                 test_case,
                 False,
-                error=f"Ошибка выполнения: {str(e)}"
+                error=f"Ошибка выполнения: {str(e)}",
+                meter=meter
             )
     
     def _compare_outputs(self, actual, expected) -> bool:
@@ -330,10 +740,16 @@ class CodeRunner:
         result.total_tests = len(test_cases)
         return result
 
+# Штраф к quality_score за неэффективный рост времени работы
+SLOW_GROWTH_CLASSES = {
+    'O(n²)': 15,
+}
+
 class CodeAnalyzer:
     """Анализатор качества кода"""
     
-    def analyze_code(self, code: str, language: str) -> Dict[str, Any]:
+    def analyze_code(self, code: str, language: str,
+                     parsed: Optional[ParsedSubmission] = None) -> Dict[str, Any]:
         """Комплексный анализ кода"""
         
         analysis = {
@@ -346,21 +762,18 @@ class CodeAnalyzer:
         }
         
         if language.lower() == 'python':
-            analysis = self._analyze_python_code(code)
+            analysis = self._analyze_python_code(parsed or ParsedSubmission(code))
         
         return analysis
     
-    def _analyze_python_code(self, code: str) -> Dict[str, Any]:
-        """Анализ Python кода"""
-        
-        lines = code.split('\n')
-        non_empty_lines = [line for line in lines if line.strip() and not line.strip().startswith('#')]
+    def _analyze_python_code(self, parsed: ParsedSubmission) -> Dict[str, Any]:
+        """Анализ Python кода по результатам единственного разбора"""
         
         analysis = {
-            'lines_of_code': len(non_empty_lines),
-            'total_lines': len(lines),
-            'comment_lines': len([l for l in lines if l.strip().startswith('#')]),
-            'complexity': self._calculate_cyclomatic_complexity(code),
+            'lines_of_code': parsed.lines_of_code,
+            'total_lines': parsed.total_lines,
+            'comment_lines': parsed.comment_lines,
+            'complexity': parsed.complexity,
             'code_smells': [],
             'quality_score': 70,  # Базовый скор
             'readability_score': 70,
@@ -380,9 +793,8 @@ class CodeAnalyzer:
             analysis['readability_score'] -= 10
         
         # Проверка длины строк
-        long_lines = [i for i, line in enumerate(lines, 1) if len(line) > 100]
-        if long_lines:
-            analysis['code_smells'].append(f"Слишком длинные строки: {len(long_lines)}")
+        if parsed.long_lines:
+            analysis['code_smells'].append(f"Слишком длинные строки: {parsed.long_lines}")
             analysis['readability_score'] -= 5
         
         # Проверка сложности
@@ -394,16 +806,9 @@ class CodeAnalyzer:
             analysis['quality_score'] -= 5
         
         # Проверка именования
-        try:
-            tree = ast.parse(code)
-            for node in ast.walk(tree):
-                if isinstance(node, ast.FunctionDef):
-                    if len(node.name) < 3:
-                        analysis['suggestions'].append(f"Используйте более описательные имена функций")
-                        analysis['readability_score'] -= 5
-                        break
-        except:
-            pass
+        if any(len(name) < 3 for name in parsed.function_names):
+            analysis['suggestions'].append("Используйте более описательные имена функций")
+            analysis['readability_score'] -= 5
         
         # Итоговый скор
         analysis['quality_score'] = max(0, min(100, analysis['quality_score']))
@@ -411,19 +816,23 @@ class CodeAnalyzer:
         
         return analysis
     
+    def apply_complexity_estimate(self, analysis: Dict[str, Any], estimate: Dict[str, Any]) -> Dict[str, Any]:
+        """Учет оценки асимптотической сложности (complexity_estimator) в анализе"""
+        analysis['complexity_estimate'] = estimate
+        
+        estimated = estimate.get('estimated')
+        timed_out_at = estimate.get('timed_out_at')
+        if estimated in SLOW_GROWTH_CLASSES:
+            analysis['code_smells'].append(f"Асимптотическая сложность решения: {estimated}")
+            analysis['suggestions'].append("Попробуйте снизить сложность: хэш-таблицы, сортировка, два указателя")
+            analysis['quality_score'] -= SLOW_GROWTH_CLASSES[estimated]
+        elif estimated is None and timed_out_at and timed_out_at <= 10000:
+            analysis['code_smells'].append(f"Решение не укладывается во время уже при n={timed_out_at}")
+            analysis['quality_score'] -= SLOW_GROWTH_CLASSES['O(n²)']
+        
+        analysis['quality_score'] = max(0, min(100, analysis['quality_score']))
+        return analysis
+    
     def _calculate_cyclomatic_complexity(self, code: str) -> int:
         """Упрощенный расчет цикломатической сложности"""
-        try:
-            tree = ast.parse(code)
-            complexity = 1  # Базовая сложность
-            
-            for node in ast.walk(tree):
-                # Увеличиваем сложность за условия и циклы
-                if isinstance(node, (ast.If, ast.While, ast.For, ast.ExceptHandler)):
-                    complexity += 1
-                elif isinstance(node, ast.BoolOp):
-                    complexity += len(node.values) - 1
-                    
-            return complexity
-        except:
-            return 1
+        return ParsedSubmission(code).complexity
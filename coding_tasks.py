@@ -1,7 +1,7 @@
 # coding_tasks.py - Модуль для генерации и проверки программных задач
 
 import json
-from openai import OpenAI
+import random
 from dataclasses import dataclass
 from typing import List, Dict, Any
 import re
@@ -36,6 +36,8 @@ class CodingTask:
     memory_limit: int  # МБ
     hints: List[str]
     tags: List[str]
+    # Эталонное решение от генератора: проверяется на тестах, кандидату не показывается
+    reference_solution: str = ''
     
     def to_dict(self):
         return {
@@ -60,8 +62,19 @@ class CodingTask:
 class CodingTaskGenerator:
     """Генератор программных задач через LLM"""
     
-    def __init__(self, client: OpenAI):
-        self.client = client
+    def __init__(self, llm, task_bank=None, bank_min_variety: int = 5,
+                 validator=None, bank_refresh_probability: float = 0.0):
+        # Шлюз к LLM (LLMGateway)
+        self.llm = llm
+        # Проверка задач эталонным решением в песочнице (TaskValidator)
+        self.validator = validator
+        # Банк задач (TaskBank): пока в корзине меньше bank_min_variety задач,
+        # новые задачи генерируются через LLM и пополняют банк
+        self.task_bank = task_bank
+        self.bank_min_variety = bank_min_variety
+        # Доля задач, которые генерируются через LLM и при заполненной корзине,
+        # чтобы корзины продолжали расти после bank_min_variety
+        self.bank_refresh_probability = bank_refresh_probability
         self.position_topics = {
             'Frontend разработчик': [
                 'работа с DOM элементами', 'обработка событий click/submit', 'валидация email/форм', 
@@ -140,6 +153,14 @@ class CodingTaskGenerator:
         # Циклически перебираем темы, чтобы они не повторялись подряд
         return topics[task_number % len(topics)]
     
+    def resolve_language(self, position: str, language: str) -> str:
+        """Язык задачи: некоторые должности требуют конкретный язык"""
+        if position == 'Frontend разработчик':
+            return 'javascript'
+        if position in ['Backend разработчик', 'Data Scientist', 'QA Engineer']:
+            return 'python'
+        return language
+    
     def get_position_specific_context(self, position: str, language: str) -> dict:
         """Возвращает специфичный контекст для каждой должности"""
         contexts = {
@@ -178,8 +199,19 @@ class CodingTaskGenerator:
         return contexts.get(position, contexts['Backend разработчик'])
         
     def generate_task(self, position: str, level: str, language: str = "python", 
-                     task_number: int = 1, total_tasks: int = 10) -> CodingTask:
-        """Генерирует задачу через LLM"""
+                     task_number: int = 1, total_tasks: int = 10, exclude_ids=()) -> CodingTask:
+        """Генерирует задачу через LLM (или берет из банка задач).
+
+        exclude_ids - task_id задач, которые сессия уже видела.
+        """
+        banked = None
+        if random.random() >= self.bank_refresh_probability:
+            banked = self._pick_from_bank(position, level, language, task_number, total_tasks,
+                                          exclude_ids, min_variety=self.bank_min_variety)
+        if banked:
+            print(f"🏦 Задача из банка: {banked.title}")
+            return banked
+        
         try:
             # Определяем сложность на основе прогресса И уровня кандидата
             difficulty = self.get_difficulty_for_task_number(task_number, total_tasks, level)
@@ -189,10 +221,7 @@ class CodingTaskGenerator:
             context = self.get_position_specific_context(position, language)
             
             # Переопределяем язык если должность требует конкретный
-            if position == 'Frontend разработчик':
-                language = 'javascript'
-            elif position in ['Backend разработчик', 'Data Scientist', 'QA Engineer']:
-                language = 'python'
+            language = self.resolve_language(position, language)
             
             difficulty_ru = {'easy': 'легкая', 'medium': 'средняя', 'hard': 'сложная'}[difficulty]
             
@@ -218,13 +247,15 @@ class CodingTaskGenerator:
         {{"input": "test3", "expected": "result3", "description": "тест 3", "is_hidden": true}}
     ],
     "solution_template": "{context['template'].replace(chr(10), '\\n')}",
+    "reference_solution": "Эталонное решение на {language}, проходящее ВСЕ тесты",
     "time_limit": 5,
     "memory_limit": 128,
     "hints": ["подсказка по {topic}"],
     "tags": ["{topic}"]
 }}
 
-ВАЖНО: Используй ТОЛЬКО двойные кавычки, без одинарных!"""
+ВАЖНО: Используй ТОЛЬКО двойные кавычки, без одинарных!
+ВАЖНО: "input" - аргументы функции (список аргументов), "expected" - точный результат эталонного решения на этих аргументах."""
             
             messages = [
                 {
@@ -237,11 +268,12 @@ class CodingTaskGenerator:
                 }
             ]
             
-            response = self.client.chat.completions.create(
+            response = self.llm.chat(
+                'task_generation',
+                messages,
                 model="qwen3-coder-30b-a3b-instruct-fp8",  # Модель для кода
-                messages=messages,
                 temperature=0.7,
-                max_tokens=800
+                max_tokens=1200  # Ответ включает эталонное решение
             )
             
             task_json = response.choices[0].message.content.strip()
@@ -274,16 +306,61 @@ class CodingTaskGenerator:
                 time_limit=task_data.get('time_limit', 5),
                 memory_limit=task_data.get('memory_limit', 128),
                 hints=task_data.get('hints', []),
-                tags=task_data.get('tags', [])
+                tags=task_data.get('tags', []),
+                reference_solution=task_data.get('reference_solution', '')
             )
             
+            # В выдачу и в банк попадают только задачи, решаемые эталонным решением
+            if self.validator is not None:
+                admitted, reason = self.validator.validate(task, position)
+                if not admitted:
+                    raise ValueError(f"Задача отклонена при проверке: {reason}")
+            
+            if self.task_bank is not None:
+                try:
+                    self.task_bank.add(task, position, level, topic)
+                except Exception as e:
+                    print(f"❌ Ошибка сохранения задачи в банк: {e}")
+            
             return task
             
         except Exception as e:
             print(f"❌ Ошибка генерации задачи: {e}")
+            banked = self._pick_from_bank(position, level, language, task_number, total_tasks, exclude_ids)
+            if banked:
+                print(f"🏦 Используем задачу из банка: {banked.title}")
+                return banked
             print("🔄 Используем fallback задачу")
             return self._get_fallback_task(position, level, language)
     
+    def bank_covers(self, position: str, level: str, language: str = "python",
+                    task_number: int = 1, total_tasks: int = 10) -> bool:
+        """Задачи этой корзины выдаются из банка, без обращения к LLM"""
+        if self.task_bank is None:
+            return False
+        difficulty = self.get_difficulty_for_task_number(task_number, total_tasks, level)
+        topic = self.get_topic_for_task(position, task_number)
+        language = self.resolve_language(position, language)
+        min_variety = self.bank_min_variety
+        return self.task_bank.count(position, level, language, difficulty, topic, limit=min_variety) >= min_variety
+    
+    def _pick_from_bank(self, position: str, level: str, language: str, task_number: int,
+                        total_tasks: int, exclude_ids=(), min_variety: int = 1):
+        """Случайная задача той же корзины из банка, если в ней не меньше min_variety задач"""
+        if self.task_bank is None:
+            return None
+        try:
+            difficulty = self.get_difficulty_for_task_number(task_number, total_tasks, level)
+            topic = self.get_topic_for_task(position, task_number)
+            language = self.resolve_language(position, language)
+            if self.task_bank.count(position, level, language, difficulty, topic, limit=min_variety) < min_variety:
+                return None
+            return self.task_bank.pick(position, level, language, difficulty, topic,
+                                       exclude_ids=exclude_ids)
+        except Exception as e:
+            print(f"❌ Ошибка банка задач: {e}")
+            return None
+    
     def _map_level_to_difficulty(self, level: str) -> str:
         """Маппинг уровня на сложность"""
         mapping = {
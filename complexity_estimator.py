@@ -0,0 +1,188 @@
+# complexity_estimator.py - Оценка асимптотической сложности решения по замерам времени
+
+import math
+import time
+import random
+from typing import Any, Dict, List, Optional
+
+# Модели роста: название -> f(n)
+GROWTH_MODELS = [
+    ('O(1)', lambda n: 1.0),
+    ('O(log n)', lambda n: math.log2(n)),
+    ('O(n)', lambda n: float(n)),
+    ('O(n log n)', lambda n: n * math.log2(n)),
+    ('O(n²)', lambda n: float(n) * n),
+]
+
+# Ниже этого порога время считается шумом таймера и накладными расходами вызова
+MIN_RELIABLE_SEC = 2e-5
+
+class ComplexityEstimator:
+    """Оценка сложности: запуск функции кандидата на растущих входах.
+
+    Входы строятся масштабированием самого крупного тестового входа задачи
+    (n = 10², 10³, 10⁴, 10⁵), каждый размер запускается в песочнице через
+    CodeRunner, затем время аппроксимируется моделями O(1)..O(n²).
+    Общее время ограничено time_budget: следующий размер не запускается,
+    если по прогнозу не успеет, а лимит на каждый запуск - остаток бюджета,
+    поделенный между повторами. Превысить бюджет может только процесс,
+    не реагирующий на таймер: песочница убивает его с небольшим запасом.
+    """
+
+    def __init__(self, runner, time_budget: float = 3.0,
+                 sizes=(100, 1000, 10000, 100000), repeats: int = 3,
+                 memory_limit_mb: int = 256):
+        self.runner = runner
+        self.time_budget = time_budget
+        self.sizes = sizes
+        self.repeats = repeats
+        self.memory_limit_mb = memory_limit_mb
+
+    def estimate(self, parsed, test_cases: List[Dict]) -> Dict[str, Any]:
+        """Оценка сложности для разобранного решения (ParsedSubmission)"""
+        started = time.monotonic()
+        estimate = {
+            'estimated': None,
+            'sizes': [],
+            'times': [],
+            'timed_out_at': None,
+            'elapsed_sec': 0,
+            'budget_sec': self.time_budget
+        }
+
+        template = self._pick_template(test_cases)
+        if template is None:
+            estimate['reason'] = "Нет масштабируемых входных данных"
+            return estimate
+
+        last_n, last_time = None, None
+        for n in self.sizes:
+            remaining = self.time_budget - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+
+            # Прогноз по квадратичному росту: не запускаем заведомо неуспевающий размер
+            if last_time is not None:
+                predicted = last_time * (n / last_n) ** 2 * self.repeats
+                if predicted > remaining:
+                    break
+
+            scaled_input = self._scale_input(template, n)
+            repeats = self.repeats if last_time is None or last_time < 0.1 else 1
+            tests = [
+                {'input': scaled_input, 'expected': None, 'description': f'n={n}'}
+                for _ in range(repeats)
+            ]
+            result = self.runner.run_python_code(
+                parsed.code, tests,
+                remaining / len(tests),
+                self.memory_limit_mb,
+                parsed=parsed
+            )
+            over_budget = time.monotonic() - started >= self.time_budget
+
+            if result.error:
+                estimate['reason'] = result.error
+                break
+            errors = [tr.get('error', '') for tr in result.test_results if tr.get('error')]
+            if errors or any('execution_time' not in tr for tr in result.test_results):
+                # Ошибка на сгенерированных данных - замер недостоверен
+                if not errors or errors[0].startswith(("Превышено время", "Превышен лимит")):
+                    estimate['timed_out_at'] = n
+                else:
+                    estimate['reason'] = errors[0]
+                break
+
+            measured = min(tr.get('cpu_time') or tr['execution_time'] for tr in result.test_results)
+            estimate['sizes'].append(n)
+            estimate['times'].append(round(measured, 6))
+            last_n, last_time = n, max(measured, MIN_RELIABLE_SEC)
+            if over_budget:
+                break
+
+        estimate['elapsed_sec'] = round(time.monotonic() - started, 3)
+
+        reliable = [(n, t) for n, t in zip(estimate['sizes'], estimate['times']) if t >= MIN_RELIABLE_SEC]
+        if len(reliable) >= 2:
+            estimate['estimated'], estimate['fit_error'] = self._fit(
+                [n for n, _ in reliable], [t for _, t in reliable]
+            )
+        elif len(estimate['sizes']) == len(self.sizes):
+            # Даже на максимальном размере время неотличимо от нуля
+            estimate['estimated'] = 'O(1)'
+        elif 'reason' not in estimate:
+            estimate['reason'] = "Недостаточно замеров в пределах бюджета времени"
+
+        print(f"📐 Оценка сложности: {estimate['estimated']} ({estimate['elapsed_sec']}с)")
+        return estimate
+
+    def _fit(self, sizes: List[int], times: List[float]):
+        """Выбор модели по разбросу остатков в логарифмической шкале.
+
+        Для модели t = c * f(n) величина log t - log f(n) должна быть
+        постоянной; выигрывает модель с наименьшей дисперсией остатков.
+        """
+        best_name, best_error = None, None
+        for name, model in GROWTH_MODELS:
+            residuals = [math.log(t) - math.log(model(n)) for n, t in zip(sizes, times)]
+            mean = sum(residuals) / len(residuals)
+            error = sum((r - mean) ** 2 for r in residuals) / len(residuals)
+
+            # Более сложная модель выбирается только при заметно лучшей точности
+            if best_error is None or error < best_error * 0.9:
+                best_name, best_error = name, error
+
+        return best_name, round(best_error, 4)
+
+    def _pick_template(self, test_cases: List[Dict]) -> Optional[Dict]:
+        """Тест с самым крупным масштабируемым аргументом"""
+        best, best_size = None, -1
+        for test_case in test_cases:
+            args, style = self._split_args(test_case.get('input'))
+            index = self._scalable_arg(args)
+            if index is None:
+                continue
+            value = args[index]
+            size = value if isinstance(value, int) else len(value)
+            if size > best_size:
+                best, best_size = {'args': args, 'style': style, 'index': index}, size
+        return best
+
+    def _split_args(self, test_input):
+        """Аргументы вызова - так же, как их передает CodeRunner._run_single_test"""
+        if isinstance(test_input, list) and len(test_input) == 1:
+            return [test_input[0]], 'wrapped'
+        if isinstance(test_input, list) and len(test_input) > 1:
+            return list(test_input), 'spread'
+        return [test_input], 'plain'
+
+    def _scalable_arg(self, args: List) -> Optional[int]:
+        """Индекс аргумента, задающего размер входа"""
+        collections = [i for i, a in enumerate(args) if isinstance(a, (list, str))]
+        if collections:
+            return max(collections, key=lambda i: len(args[i]))
+        ints = [i for i, a in enumerate(args) if isinstance(a, int) and not isinstance(a, bool)]
+        if len(args) == 1 and ints:
+            return 0
+        return None
+
+    def _scale_input(self, template: Dict, n: int):
+        args = list(template['args'])
+        args[template['index']] = self._scale_value(args[template['index']], n)
+
+        if template['style'] == 'wrapped':
+            return [args[0]]
+        if template['style'] == 'spread':
+            return args
+        return args[0]
+
+    def _scale_value(self, value: Any, n: int):
+        rng = random.Random(n)  # Детерминированные входы для воспроизводимости
+        if isinstance(value, str):
+            pattern = value or 'a'
+            return (pattern * (n // len(pattern) + 1))[:n]
+        if isinstance(value, list):
+            if not value or all(isinstance(v, int) and not isinstance(v, bool) for v in value):
+                return [rng.randrange(n) for _ in range(n)]
+            return [value[i % len(value)] for i in range(n)]
+        return n
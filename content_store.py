@@ -0,0 +1,48 @@
+# content_store.py - Сжатое хранилище неизменяемых данных по хешу содержимого
+
+import json
+import zlib
+import base64
+import hashlib
+from typing import Any, Dict
+
+class ContentStore:
+    """Данные (код решений, результаты тестов) по ссылке-хешу.
+
+    Каждое значение хранится один раз, сжатым zlib; повторное put того же
+    содержимого возвращает ту же ссылку. Записи ссылаются на данные, а не
+    копируют их.
+    """
+
+    __slots__ = ('_blobs',)
+
+    def __init__(self):
+        self._blobs = {}
+
+    def put(self, value: Any) -> str:
+        data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        ref = hashlib.sha256(data).hexdigest()[:32]
+        if ref not in self._blobs:
+            self._blobs[ref] = zlib.compress(data, 6)
+        return ref
+
+    def get(self, ref: str) -> Any:
+        return json.loads(zlib.decompress(self._blobs[ref]).decode('utf-8'))
+
+    def __contains__(self, ref: str) -> bool:
+        return ref in self._blobs
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def nbytes(self) -> int:
+        return sum(len(blob) for blob in self._blobs.values())
+
+    def to_state(self) -> Dict[str, str]:
+        return {ref: base64.b64encode(blob).decode('ascii') for ref, blob in self._blobs.items()}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, str]) -> 'ContentStore':
+        store = cls()
+        store._blobs = {ref: base64.b64decode(blob) for ref, blob in state.items()}
+        return store
@@ -0,0 +1,360 @@
+# judge_queue.py - Фоновая очередь проверки решений с отслеживанием прогресса
+
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+class JudgeBusyError(Exception):
+    """У сессии уже идет проверка другого решения"""
+
+def args_key(args) -> str:
+    """Отпечаток аргументов проверки (код, язык): повтор той же отправки узнается по нему"""
+    payload = json.dumps(list(args), ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class JudgeJob:
+    """Задание на проверку одного решения"""
+
+    def __init__(self, job_id: str, session_id: str, total_tests: int, log=None,
+                 args_key: Optional[str] = None):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.total_tests = total_tests
+        self.args_key = args_key
+        self.status = 'queued'  # queued, running, done, error
+        self.test_results = {}  # index -> результат теста
+        self.events = []  # (event, data) для SSE
+        self.result = None  # Итоговый ответ, как у синхронного /api/submit_code
+        self.status_code = 200
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cond = threading.Condition()
+        self._listeners = []  # Ожидающие в asyncio: будятся из потока проверки
+        self.log = log  # Общий журнал заданий (SQLiteJobLog) для других воркеров
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'error')
+
+    def publish(self, event: str, data: Dict):
+        with self._cond:
+            self.events.append((event, data))
+            self._write_log(event, data)
+            self._cond.notify_all()
+            self._notify_listeners()
+
+    def _write_log(self, event: str, data: Dict):
+        if self.log is None:
+            return
+        try:
+            self.log.append(self, len(self.events) - 1, event, data)
+        except sqlite3.Error as e:
+            print(f"⚠️ Ошибка записи события проверки {self.job_id}: {e}")
+
+    def _notify_listeners(self):
+        for notify in self._listeners:
+            try:
+                notify()
+            except RuntimeError:
+                pass  # Event loop ожидающего уже закрыт
+
+    def set_status(self, status: str):
+        self.status = status
+        self.publish('status', {'status': status})
+
+    def add_test_result(self, index: int, test_result: Dict):
+        """Колбэк для CodeRunner: тест готов"""
+        self.test_results[index] = test_result
+        self.publish('test', {
+            'index': index,
+            'completed_tests': len(self.test_results),
+            'total_tests': self.total_tests,
+            'result': test_result
+        })
+
+    def finish(self, result: Dict, status_code: int = 200):
+        self.result = result
+        self.status_code = status_code
+        self.finished_at = time.time()
+        with self._cond:
+            self.status = 'done' if status_code < 400 else 'error'
+            self.events.append(('done', {'status': self.status, 'status_code': status_code, 'result': result}))
+            self._write_log(*self.events[-1])
+            self._cond.notify_all()
+            self._notify_listeners()
+
+    def wait_events(self, cursor: int, timeout: float):
+        """Новые события начиная с cursor (ждет до timeout секунд)"""
+        with self._cond:
+            if cursor >= len(self.events) and not self.finished:
+                self._cond.wait(timeout)
+            return self.events[cursor:], self.finished
+
+    async def await_events(self, cursor: int, timeout: float):
+        """Асинхронный вариант wait_events: ожидание не занимает поток"""
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        notify = lambda: loop.call_soon_threadsafe(ready.set)
+        with self._cond:
+            if cursor < len(self.events) or self.finished:
+                return self.events[cursor:], self.finished
+            self._listeners.append(notify)
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._listeners.remove(notify)
+        with self._cond:
+            return self.events[cursor:], self.finished
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'total_tests': self.total_tests,
+            'completed_tests': len(self.test_results),
+            'test_results': [self.test_results[i] for i in sorted(self.test_results)],
+            'result': self.result,
+            'status_code': self.status_code if self.finished else None
+        }
+
+class SharedJudgeJob(JudgeJob):
+    """Задание, которое выполняет другой воркер: состояние читается из общего журнала.
+
+    Опрос статуса и поток событий могут прийти в любой воркер, поэтому
+    события заданий пишутся в SQLiteJobLog, а здесь воспроизводятся
+    тем же интерфейсом, что у JudgeJob.
+    """
+
+    POLL_SEC = 0.1
+
+    def __init__(self, log, row):
+        job_id, session_id, total_tests, created_at, args_key = row
+        super().__init__(job_id, session_id, total_tests, args_key=args_key)
+        self.created_at = created_at
+        self._source = log
+        self.refresh()
+
+    def refresh(self):
+        """Новые события из журнала (и состояние задания по ним)"""
+        for event, data in self._source.events(self.job_id, len(self.events)):
+            self.events.append((event, data))
+            if event == 'status':
+                self.status = data['status']
+            elif event == 'test':
+                self.test_results[data['index']] = data['result']
+            elif event == 'done':
+                self.status = data['status']
+                self.status_code = data['status_code']
+                self.result = data['result']
+                self.finished_at = time.time()
+        if not self.finished and time.time() - self.created_at > self._source.job_ttl:
+            # Воркер, выполнявший проверку, упал: задание не завершится
+            self.status = 'error'
+            self.status_code = 500
+            self.result = {'success': False, 'error': 'Проверка прервана, отправьте решение повторно'}
+            self.events.append(('done', {'status': self.status, 'status_code': 500, 'result': self.result}))
+
+    def wait_events(self, cursor: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            self.refresh()
+            if cursor < len(self.events) or self.finished or time.monotonic() >= deadline:
+                return self.events[cursor:], self.finished
+            time.sleep(self.POLL_SEC)
+
+    async def await_events(self, cursor: int, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            await asyncio.to_thread(self.refresh)  # Запрос к SQLite не занимает event loop
+            if cursor < len(self.events) or self.finished or time.monotonic() >= deadline:
+                return self.events[cursor:], self.finished
+            await asyncio.sleep(self.POLL_SEC)
+
+class SQLiteJobLog:
+    """Журнал заданий проверки в SQLite, общий для всех воркеров.
+
+    Воркер, выполняющий задание, записывает его и каждое событие; любой
+    другой воркер по job_id получает SharedJudgeJob. Нужен, когда воркеров
+    несколько (SESSION_STORE=sqlite): иначе опрос статуса, попавший не в
+    тот воркер, получил бы 404.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS judge_jobs (
+        job_id TEXT PRIMARY KEY,
+        session_id TEXT NOT NULL,
+        total_tests INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        finished_at REAL,
+        args_key TEXT
+    );
+    CREATE INDEX IF NOT EXISTS judge_jobs_session ON judge_jobs (session_id, finished_at);
+    CREATE TABLE IF NOT EXISTS judge_events (
+        job_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (job_id, seq)
+    );
+    """
+
+    def __init__(self, path: str, job_ttl: int = 600):
+        self.path = path
+        self.job_ttl = job_ttl
+        self._local = threading.local()
+        conn = self._conn()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(judge_jobs)")}
+        if columns and 'args_key' not in columns:
+            conn.execute("ALTER TABLE judge_jobs ADD COLUMN args_key TEXT")
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """Отдельное соединение на поток, без неявных транзакций"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def create(self, job: JudgeJob):
+        self._conn().execute(
+            "INSERT INTO judge_jobs (job_id, session_id, total_tests, created_at, args_key) VALUES (?, ?, ?, ?, ?)",
+            (job.job_id, job.session_id, job.total_tests, job.created_at, job.args_key)
+        )
+
+    def append(self, job: JudgeJob, seq: int, event: str, data: Dict):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO judge_events (job_id, seq, event, data) VALUES (?, ?, ?, ?)",
+            (job.job_id, seq, event, json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        )
+        if event == 'done':
+            conn.execute("UPDATE judge_jobs SET finished_at = ? WHERE job_id = ?", (time.time(), job.job_id))
+
+    def events(self, job_id: str, cursor: int):
+        rows = self._conn().execute(
+            "SELECT event, data FROM judge_events WHERE job_id = ? AND seq >= ? ORDER BY seq",
+            (job_id, cursor)
+        ).fetchall()
+        return [(event, json.loads(data)) for event, data in rows]
+
+    def load(self, job_id: str) -> Optional[SharedJudgeJob]:
+        row = self._conn().execute(
+            "SELECT job_id, session_id, total_tests, created_at, args_key FROM judge_jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return SharedJudgeJob(self, row) if row else None
+
+    def active(self, session_id: str) -> Optional[SharedJudgeJob]:
+        """Незавершенное задание сессии в любом воркере"""
+        row = self._conn().execute(
+            "SELECT job_id, session_id, total_tests, created_at, args_key FROM judge_jobs "
+            "WHERE session_id = ? AND finished_at IS NULL AND created_at > ? "
+            "ORDER BY created_at DESC LIMIT 1",
+            (session_id, time.time() - self.job_ttl)
+        ).fetchone()
+        return SharedJudgeJob(self, row) if row else None
+
+    def cleanup(self):
+        """Удаление заданий, завершенных больше job_ttl назад (и брошенных упавшим воркером)"""
+        conn = self._conn()
+        now = time.time()
+        where = "finished_at < ? OR created_at < ?"
+        params = (now - self.job_ttl, now - 2 * self.job_ttl)
+        conn.execute(f"DELETE FROM judge_events WHERE job_id IN (SELECT job_id FROM judge_jobs WHERE {where})", params)
+        conn.execute(f"DELETE FROM judge_jobs WHERE {where}", params)
+
+class JudgeQueue:
+    """Очередь проверки решений на пуле фоновых потоков.
+
+    handler(*args, on_test_result=callback, on_event=publish) должен вернуть
+    (ответ, HTTP код); on_event(имя, данные) публикует произвольное событие SSE.
+    Для одной сессии одновременно выполняется не более одного задания:
+    повторная отправка того же решения возвращает уже идущее задание,
+    другое решение отклоняется с JudgeBusyError (HTTP 409). С общим журналом
+    (log=SQLiteJobLog) задания видны всем воркерам: get() находит задание
+    другого воркера, а идущее задание сессии не дублируется.
+    """
+
+    def __init__(self, handler: Callable, workers: int = 4, job_ttl: int = 600,
+                 log: Optional[SQLiteJobLog] = None):
+        self.handler = handler
+        self.job_ttl = job_ttl
+        self.log = log
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='judge')
+        self._jobs = {}
+        self._active_by_session = {}
+        self._lock = threading.Lock()
+        self._next_cleanup = 0.0
+
+    def submit(self, session_id: str, total_tests: int, *args) -> JudgeJob:
+        key = args_key(args)
+        with self._lock:
+            self._cleanup()
+
+            active = self._jobs.get(self._active_by_session.get(session_id))
+            if (active is None or active.finished) and self.log is not None:
+                active = self.log.active(session_id)
+            if active and not active.finished:
+                if active.args_key != key:
+                    raise JudgeBusyError("Предыдущее решение еще проверяется, отправьте новое после результата")
+                return active
+
+            job = JudgeJob(uuid.uuid4().hex, session_id, total_tests, log=self.log, args_key=key)
+            if self.log is not None:
+                self.log.create(job)
+            self._jobs[job.job_id] = job
+            self._active_by_session[session_id] = job.job_id
+
+        self._executor.submit(self._run, job, args)
+        print(f"📥 Решение поставлено в очередь проверки: {job.job_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[JudgeJob]:
+        job = self._jobs.get(job_id)
+        if job is None and self.log is not None and job_id:
+            job = self.log.load(job_id)  # Задание другого воркера
+        return job
+
+    def _run(self, job: JudgeJob, args):
+        job.set_status('running')
+        try:
+            result, status_code = self.handler(*args, on_test_result=job.add_test_result, on_event=job.publish)
+        except Exception as e:
+            print(f"❌ Ошибка фоновой проверки {job.job_id}: {e}")
+            result, status_code = {'success': False, 'error': str(e)}, 500
+        job.finish(result, status_code)
+
+    def _cleanup(self):
+        """Удаление давно завершенных заданий (не чаще раза в job_ttl / 10 секунд)"""
+        now = time.time()
+        if now < self._next_cleanup:
+            return
+        self._next_cleanup = now + self.job_ttl / 10
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.job_ttl
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._active_by_session.get(job.session_id) == job_id:
+                del self._active_by_session[job.session_id]
+        if self.log is not None:
+            # Удаление из общего журнала - запись в SQLite, выполняется в пуле проверки, не в запросе
+            self._executor.submit(self._cleanup_log)
+
+    def _cleanup_log(self):
+        try:
+            self.log.cleanup()
+        except sqlite3.Error as e:
+            print(f"⚠️ Ошибка очистки журнала заданий: {e}")
@@ -0,0 +1,113 @@
+# llm_cache.py - TTL + LRU кэш ответов LLM с ограничением по размеру
+
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+def normalize_text(text: str, limit: Optional[int] = None, fold_case: bool = True) -> str:
+    """Нормализация текста для ключа кэша.
+
+    Текст обрезается до limit символов так же, как его обрезает промпт
+    (все, что дальше, LLM все равно не видит), затем схлопываются пробелы
+    и при fold_case регистр приводится к нижнему.
+    """
+    text = (text or '')[:limit]
+    if fold_case:
+        return re.sub(r'\s+', ' ', text).strip().casefold()
+    # Для кода регистр и отступы значимы: убираем только хвостовые пробелы и пустые строки
+    lines = [line.rstrip() for line in text.strip().splitlines()]
+    return '\n'.join(line for line in lines if line)
+
+class LLMCache:
+    """TTL + LRU кэш для ответов LLM.
+
+    Значения хранятся сериализованными в JSON: размер записи известен
+    точно, а вызывающий код получает свежую копию и не может испортить
+    кэш. Записи вытесняются по LRU, когда суммарный размер превышает
+    max_bytes, и считаются отсутствующими после ttl секунд.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024, ttl: float = 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # ключ -> (истекает, JSON)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            payload = self._lookup(key)
+            if payload is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return json.loads(payload)
+
+    def put(self, key: str, value: Any):
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._store(key, payload)
+
+    def update(self, key: str, fn: Callable[[Any], Any], default=None):
+        """Атомарное изменение значения: fn(текущее значение) -> новое"""
+        with self._lock:
+            payload = self._lookup(key)
+            value = fn(json.loads(payload) if payload is not None else default)
+            self._store(key, json.dumps(value, ensure_ascii=False))
+        return value
+
+    def _lookup(self, key: str):
+        """JSON записи или None (под self._lock)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def _store(self, key: str, payload: str):
+        size = len(payload.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, payload)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, payload = self._entries.pop(key)
+        self.bytes -= len(payload.encode('utf-8'))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'expired': self.expired,
+                'evictions': self.evictions
+            }
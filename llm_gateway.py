@@ -0,0 +1,528 @@
+# llm_gateway.py - Общий шлюз к LLM: пул соединений, лимиты параллельности, сроки ответа
+
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from circuit_breaker import CircuitBreaker
+
+class LLMBusyError(Exception):
+    """Нет свободного слота для запроса к LLM за отведенное время"""
+
+class LLMUnavailableError(Exception):
+    """Цепь разомкнута или LLM не ответила в срок - нужен резервный ответ"""
+
+class _PurposeStats:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0  # Не дождались слота
+        self.coalesced = 0  # Получили ответ чужого идентичного запроса
+        self.short_circuited = 0  # Отказ сразу: цепь разомкнута
+        self.deadline_exceeded = 0
+        self.hedged = 0  # Запущен второй, страхующий запрос
+        self.hedge_wins = 0  # Страхующий запрос ответил первым
+        self.total_latency = 0.0
+        self.total_wait = 0.0
+
+    def to_dict(self) -> Dict:
+        done = self.calls or 1
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'calls': self.calls,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'coalesced': self.coalesced,
+            'short_circuited': self.short_circuited,
+            'deadline_exceeded': self.deadline_exceeded,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'avg_latency_sec': round(self.total_latency / done, 3),
+            'avg_wait_sec': round(self.total_wait / done, 3)
+        }
+
+class _SlotWait:
+    """Ожидание слота в потоке для асинхронного вызова; слот, полученный после отмены, возвращается"""
+
+    def __init__(self, semaphore: threading.BoundedSemaphore, deadline: float):
+        self.semaphore = semaphore
+        self.deadline = deadline
+        self.acquired = False
+        self.abandoned = False
+        self._lock = threading.Lock()
+
+    def run(self) -> bool:
+        # Поток мог ждать в очереди пула: срок считается от начала ожидания вызова
+        remaining = self.deadline - time.monotonic()
+        acquired = remaining > 0 and self.semaphore.acquire(timeout=remaining)
+        with self._lock:
+            if acquired and self.abandoned:
+                self.semaphore.release()
+                return False
+            self.acquired = acquired
+        return acquired
+
+    def abandon(self):
+        with self._lock:
+            self.abandoned = True
+            if self.acquired:
+                self.semaphore.release()
+
+class _LoopState:
+    """Асинхронное состояние шлюза, привязанное к одному event loop"""
+
+    def __init__(self, client: AsyncOpenAI):
+        self.client = client
+        self.flights = {}  # ключ запроса -> asyncio.Task
+
+class LLMGateway:
+    """Единая точка доступа к LLM для всего приложения.
+
+    Один HTTP клиент с пулом keep-alive соединений на процесс (для
+    асинхронного API - свой на каждый event loop, вместе с single-flight).
+    У каждого назначения запроса (question, evaluation, task_generation,
+    summary, ...) свой лимит одновременных запросов - общий для
+    синхронного и асинхронного API - и свой срок ответа (timeouts): генерация задач
+    не может занять все соединения, пока кандидат ждет оценку ответа. Срок
+    покрывает весь вызов - ожидание слота, запрос и страхующий запрос;
+    по его истечении вызов завершается с LLMUnavailableError. Если слот не
+    освободился за queue_timeout секунд, запрос отклоняется с LLMBusyError -
+    вызывающий код уже умеет переходить на резервный ответ.
+
+    breakers - размыкатели цепи по назначению: пока цепь разомкнута, вызов
+    сразу завершается с LLMUnavailableError и вызывающий код без ожидания
+    отдает резервный ответ. hedge_after - через сколько секунд без ответа
+    отправить второй такой же запрос (берется ответ, пришедший первым;
+    в асинхронном API проигравший запрос отменяется). Потоковые запросы
+    не страхуются.
+
+    Одинаковые запросы (модель, сообщения и параметры генерации), пришедшие,
+    пока такой же запрос еще выполняется, не отправляются повторно: все они
+    получают ответ первого (single-flight). Потоковые запросы не объединяются.
+    """
+
+    def __init__(self, base_url: str, api_key: str, model: str,
+                 concurrency: Dict[str, int], timeouts: Dict[str, float],
+                 max_connections: int = 32, queue_timeout: float = 30.0,
+                 max_retries: int = 1, default_params: Optional[Dict] = None,
+                 coalesce: bool = True, breakers: Optional[Dict[str, CircuitBreaker]] = None,
+                 hedge_after: Optional[Dict[str, float]] = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.concurrency = concurrency
+        self.timeouts = timeouts
+        self.max_connections = max_connections
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.default_params = default_params or {}
+        self.coalesce = coalesce
+        self.breakers = breakers or {}
+        self.hedge_after = hedge_after or {}
+
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections
+        )
+        self.client = OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            http_client=httpx.Client(limits=self._limits)
+        )
+        self._loops = {}  # event loop -> _LoopState
+
+        self._semaphores = {purpose: threading.BoundedSemaphore(limit) for purpose, limit in concurrency.items()}
+        self._stats = {purpose: _PurposeStats(limit) for purpose, limit in concurrency.items()}
+        self._stats_lock = threading.Lock()
+        self._flights = {}  # ключ запроса -> Future выполняющегося запроса
+        self._flights_lock = threading.Lock()
+        # Попытки выполняются в отдельных потоках: вызывающий ждет не дольше срока
+        self._executor = ThreadPoolExecutor(max_workers=2 * sum(concurrency.values()), thread_name_prefix='llm')
+        # Асинхронные вызовы ждут слот в потоках (по лимиту назначения) в общей очереди с синхронными
+        self._slot_waiters = {
+            purpose: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f'llm-slot-{purpose}')
+            for purpose, limit in concurrency.items()
+        }
+
+    def _purpose(self, purpose: str) -> str:
+        if purpose not in self.concurrency:
+            raise ValueError(f"Неизвестное назначение запроса к LLM: {purpose}")
+        return purpose
+
+    def _params(self, purpose: str, params: Dict) -> Dict:
+        merged = {'model': self.model, **self.default_params, **params}
+        merged.setdefault('timeout', self.timeouts.get(purpose, 60))
+        return merged
+
+    def _flight_key(self, messages: List[Dict], params: Dict) -> str:
+        payload = json.dumps([messages, params], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _record(self, purpose: str, field: str, amount=1):
+        with self._stats_lock:
+            stats = self._stats[purpose]
+            setattr(stats, field, getattr(stats, field) + amount)
+
+    # ----- Синхронный API (Flask, фоновые потоки) -----
+
+    def chat(self, purpose: str, messages: List[Dict], **params):
+        """Запрос chat.completions; params переопределяют параметры по умолчанию"""
+        purpose = self._purpose(purpose)
+        params = self._params(purpose, params)
+        if not self.coalesce:
+            return self._execute(purpose, messages, params)
+
+        key = self._flight_key(messages, params)
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if not leader:
+            self._record(purpose, 'coalesced')
+            return flight.result()
+
+        try:
+            response = self._execute(purpose, messages, params)
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(response)
+            return response
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+
+    def _check_circuit(self, purpose: str):
+        breaker = self.breakers.get(purpose)
+        if breaker and not breaker.allow():
+            self._record(purpose, 'short_circuited')
+            raise LLMUnavailableError(f"LLM недоступна: цепь '{purpose}' разомкнута")
+
+    def _execute(self, purpose: str, messages: List[Dict], params: Dict):
+        """Вызов со сроком ответа и, если настроено, страхующим запросом"""
+        self._check_circuit(purpose)
+        deadline = time.monotonic() + params['timeout']
+        hedge_after = self.hedge_after.get(purpose)
+        breaker = self.breakers.get(purpose)
+
+        attempts = [self._executor.submit(self._call, purpose, messages, params, deadline)]
+        pending = set(attempts)
+        error = None
+        while pending:
+            timeout = deadline - time.monotonic()
+            if hedge_after and len(attempts) == 1:
+                timeout = min(timeout, hedge_after)
+            done, pending = wait(pending, timeout=max(0.0, timeout), return_when=FIRST_COMPLETED)
+
+            for attempt in done:
+                try:
+                    response = attempt.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if attempt is not attempts[0]:
+                    self._record(purpose, 'hedge_wins')
+                return response
+
+            if time.monotonic() >= deadline:
+                break
+            # Страхуем только при замкнутой цепи: пробный вызов не дублируется
+            if (not done and hedge_after and len(attempts) == 1
+                    and (breaker is None or breaker.state == 'closed')):
+                self._record(purpose, 'hedged')
+                attempts.append(self._executor.submit(self._call, purpose, messages, params, deadline))
+                pending.add(attempts[-1])
+
+        if not pending and error is not None:
+            raise error
+        self._record(purpose, 'deadline_exceeded')
+        raise LLMUnavailableError(f"LLM не ответила за {params['timeout']}с ('{purpose}')")
+
+    def _call(self, purpose: str, messages: List[Dict], params: Dict, deadline: float):
+        breaker = self.breakers.get(purpose)
+        try:
+            self._acquire(purpose, deadline)
+        except LLMBusyError:
+            if breaker:
+                breaker.cancel()
+            raise
+        started = time.monotonic()
+        ok = False
+        try:
+            response = self.client.chat.completions.create(
+                messages=messages, **{**params, 'timeout': max(0.1, deadline - started)}
+            )
+            ok = True
+            return response
+        except Exception:
+            self._record(purpose, 'errors')
+            raise
+        finally:
+            latency = time.monotonic() - started
+            self._release(purpose, latency)
+            if breaker:
+                breaker.record(latency, ok)
+
+    def stream(self, purpose: str, messages: List[Dict], **params) -> Iterator[str]:
+        """Потоковый ответ: генератор фрагментов текста"""
+        purpose = self._purpose(purpose)
+        self._check_circuit(purpose)
+        breaker = self.breakers.get(purpose)
+        try:
+            self._acquire(purpose)
+        except LLMBusyError:
+            if breaker:
+                breaker.cancel()
+            raise
+        started = time.monotonic()
+        first_token = None  # Для размыкателя важна задержка до первого фрагмента
+        try:
+            chunks = self.client.chat.completions.create(
+                messages=messages, stream=True, **self._params(purpose, params)
+            )
+            for chunk in chunks:
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                    if breaker:
+                        breaker.record(first_token, True)
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+        except BaseException as e:
+            # Закрытие генератора до первого фрагмента тоже завершает пробу размыкателя
+            if isinstance(e, Exception):
+                self._record(purpose, 'errors')
+            if breaker and first_token is None:
+                breaker.record(time.monotonic() - started, False)
+            raise
+        finally:
+            self._release(purpose, time.monotonic() - started)
+
+    def _acquire(self, purpose: str, deadline: Optional[float] = None):
+        started = time.monotonic()
+        timeout = self.queue_timeout if deadline is None else min(self.queue_timeout, max(0.0, deadline - started))
+        if not self._semaphores[purpose].acquire(timeout=timeout):
+            self._record(purpose, 'rejected')
+            raise LLMBusyError(f"LLM занята: нет свободного слота для '{purpose}'")
+        self._entered(purpose, time.monotonic() - started)
+
+    def _release(self, purpose: str, latency: float):
+        self._finished(purpose, latency)
+        self._semaphores[purpose].release()
+
+    def _entered(self, purpose: str, waited: float):
+        with self._stats_lock:
+            stats = self._stats[purpose]
+            stats.in_flight += 1
+            stats.total_wait += waited
+
+    def _finished(self, purpose: str, latency: float):
+        with self._stats_lock:
+            stats = self._stats[purpose]
+            stats.in_flight -= 1
+            stats.calls += 1
+            stats.total_latency += latency
+
+    # ----- Асинхронный API (asyncio) -----
+
+    def _new_async_client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=self.max_retries,
+            http_client=httpx.AsyncClient(limits=self._limits)
+        )
+
+    def _loop_state(self) -> _LoopState:
+        """Состояние текущего event loop: клиент и задачи не переходят между loop"""
+        loop = asyncio.get_running_loop()
+        with self._flights_lock:
+            state = self._loops.get(loop)
+            if state is None:
+                # Состояние закрытых loop (asyncio.run в потоках, тесты) больше не нужно
+                for closed in [known for known in self._loops if known.is_closed()]:
+                    del self._loops[closed]
+                state = self._loops[loop] = _LoopState(self._new_async_client())
+        return state
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Асинхронный клиент текущего event loop, создается при первом использовании"""
+        return self._loop_state().client
+
+    async def achat(self, purpose: str, messages: List[Dict], **params):
+        """Асинхронный аналог chat()"""
+        purpose = self._purpose(purpose)
+        params = self._params(purpose, params)
+        if not self.coalesce:
+            return await self._acall(purpose, messages, params)
+
+        key = self._flight_key(messages, params)
+        flights = self._loop_state().flights
+        flight = flights.get(key)
+        if flight is not None:
+            self._record(purpose, 'coalesced')
+        else:
+            flight = flights[key] = asyncio.ensure_future(self._acall(purpose, messages, params))
+            flight.add_done_callback(lambda _: flights.pop(key, None))
+        # shield: отмена одного ожидающего не отменяет запрос для остальных
+        return await asyncio.shield(flight)
+
+    async def _aacquire(self, purpose: str, timeout: float):
+        """Асинхронное ожидание слота; при отказе или отмене освобождает пробу размыкателя.
+
+        Слоты те же, что у синхронного API (threading.BoundedSemaphore).
+        Если свободного нет, слот ждет поток llm-slot-<назначение>: он
+        стоит в той же очереди семафора, что и синхронные вызовы, и loop
+        свободен. Слот, полученный после отмены ожидания, возвращается.
+        """
+        semaphore = self._semaphores[purpose]
+        started = time.monotonic()
+        deadline = started + min(self.queue_timeout, timeout)
+        try:
+            if not semaphore.acquire(blocking=False):
+                wait = _SlotWait(semaphore, deadline)
+                try:
+                    acquired = await asyncio.get_running_loop().run_in_executor(self._slot_waiters[purpose], wait.run)
+                except asyncio.CancelledError:
+                    wait.abandon()
+                    raise
+                if not acquired:
+                    self._record(purpose, 'rejected')
+                    raise LLMBusyError(f"LLM занята: нет свободного слота для '{purpose}'")
+        except BaseException:
+            # Запрос не отправлен: пробный вызов достается следующему
+            if purpose in self.breakers:
+                self.breakers[purpose].cancel()
+            raise
+        self._entered(purpose, time.monotonic() - started)
+
+    async def _acall(self, purpose: str, messages: List[Dict], params: Dict):
+        """Асинхронный аналог _execute: срок ответа и страхующий запрос.
+
+        Попытка, проигравшая страхующему запросу, отменяется.
+        """
+        self._check_circuit(purpose)
+        deadline = time.monotonic() + params['timeout']
+        hedge_after = self.hedge_after.get(purpose)
+        breaker = self.breakers.get(purpose)
+        race = {'settled': False}  # Ответ получен: отмена остальных попыток - не ошибка LLM
+
+        attempts = [asyncio.ensure_future(self._aattempt(purpose, messages, params, deadline, race))]
+        pending = set(attempts)
+        error = None
+        try:
+            while pending:
+                timeout = deadline - time.monotonic()
+                if hedge_after and len(attempts) == 1:
+                    timeout = min(timeout, hedge_after)
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, timeout), return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for attempt in done:
+                    if attempt.exception() is not None:
+                        error = attempt.exception()
+                        continue
+                    race['settled'] = True
+                    if attempt is not attempts[0]:
+                        self._record(purpose, 'hedge_wins')
+                    return attempt.result()
+
+                if time.monotonic() >= deadline:
+                    break
+                if (not done and hedge_after and len(attempts) == 1
+                        and (breaker is None or breaker.state == 'closed')):
+                    self._record(purpose, 'hedged')
+                    attempts.append(asyncio.ensure_future(
+                        self._aattempt(purpose, messages, params, deadline, race)
+                    ))
+                    pending.add(attempts[-1])
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+        if not pending and error is not None:
+            raise error
+        self._record(purpose, 'deadline_exceeded')
+        raise LLMUnavailableError(f"LLM не ответила за {params['timeout']}с ('{purpose}')")
+
+    async def _aattempt(self, purpose: str, messages: List[Dict], params: Dict, deadline: float, race: Dict):
+        """Одна попытка асинхронного вызова (аналог _call)"""
+        breaker = self.breakers.get(purpose)
+        await self._aacquire(purpose, deadline - time.monotonic())
+        started = time.monotonic()
+        ok = False
+        try:
+            response = await self.async_client.chat.completions.create(
+                messages=messages, **{**params, 'timeout': max(0.1, deadline - started)}
+            )
+            ok = True
+            return response
+        except asyncio.CancelledError:
+            # Проигравшая попытка не считается ошибкой; отмена по сроку или вызывающим - считается
+            if race['settled'] and breaker:
+                breaker.cancel()
+                breaker = None
+            raise
+        except Exception:
+            self._record(purpose, 'errors')
+            raise
+        finally:
+            latency = time.monotonic() - started
+            self._release(purpose, latency)
+            if breaker:
+                breaker.record(latency, ok)
+
+    async def astream(self, purpose: str, messages: List[Dict], **params) -> AsyncIterator[str]:
+        """Асинхронный аналог stream()"""
+        purpose = self._purpose(purpose)
+        self._check_circuit(purpose)
+        breaker = self.breakers.get(purpose)
+        params = self._params(purpose, params)
+        await self._aacquire(purpose, params['timeout'])
+        started = time.monotonic()
+        first_token = None
+        try:
+            chunks = await self.async_client.chat.completions.create(messages=messages, stream=True, **params)
+            async for chunk in chunks:
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                    if breaker:
+                        breaker.record(first_token, True)
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+        except BaseException as e:
+            # Отмена (клиент отключился) до первого фрагмента тоже завершает пробу размыкателя
+            if isinstance(e, Exception):
+                self._record(purpose, 'errors')
+            if breaker and first_token is None:
+                breaker.record(time.monotonic() - started, False)
+            raise
+        finally:
+            self._release(purpose, time.monotonic() - started)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                'max_connections': self.max_connections,
+                'purposes': {
+                    purpose: {
+                        **stats.to_dict(),
+                        'circuit': self.breakers[purpose].stats() if purpose in self.breakers else None
+                    }
+                    for purpose, stats in self._stats.items()
+                }
+            }
@@ -0,0 +1,385 @@
+# mock_llm_server.py - Локальная OpenAI-совместимая заглушка LLM для нагрузочных и регрессионных тестов
+#
+# Запуск:  python mock_llm_server.py --port 8001 --latency lognormal:0.8:0.5
+# В приложении: LLM_BASE_URL=http://127.0.0.1:8001/v1 python app.py
+
+import re
+import json
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from typing import Dict, List, Tuple
+
+from flask import Flask, Response, jsonify, request
+
+class LatencyModel:
+    """Распределение задержки из строки вида 'тип:параметры'.
+
+    fixed:0.2            - всегда 0.2с
+    uniform:0.1:0.5      - равномерно от 0.1 до 0.5с
+    normal:0.8:0.2       - нормальное (среднее, отклонение), не меньше 0
+    lognormal:0.8:0.5    - логнормальное (медиана, sigma): длинный хвост, как у LLM
+    """
+
+    def __init__(self, spec: str = 'fixed:0'):
+        kind, *params = spec.split(':')
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == 'fixed':
+            return self.params[0]
+        if self.kind == 'uniform':
+            return rng.uniform(*self.params)
+        if self.kind == 'normal':
+            return max(0.0, rng.gauss(*self.params))
+        median, sigma = self.params
+        return rng.lognormvariate(0, sigma) * median
+
+# ========== Заготовленные ответы для семейств промптов ==========
+
+# Продолжения после префикса "Что такое" из generate_interview_question
+QUESTION_ENDINGS = [
+    "замыкание и где оно применяется на практике?",
+    "идемпотентность HTTP методов и зачем она нужна?",
+    "индекс в базе данных и когда он замедляет запись?",
+    "race condition и как его предотвратить?",
+    "REST и чем он отличается от RPC?",
+    "транзакция и какие уровни изоляции вы знаете?",
+    "декоратор в Python и как он устроен?",
+    "event loop и как он обрабатывает асинхронный код?",
+    "кеширование и как выбрать стратегию инвалидации?",
+    "нормализация базы данных и когда от нее отказываются?",
+    "Big O нотация и как оценить сложность алгоритма?",
+    "dependency injection и какие проблемы он решает?",
+]
+
+STRENGTHS = ["понимание основ", "четкая формулировка", "примеры из практики",
+             "внимание к краевым случаям", "знание инструментов", "структурированный ответ"]
+IMPROVEMENTS = ["углубить теорию", "привести пример кода", "учесть производительность",
+                "рассмотреть ошибки", "упомянуть альтернативы", "оценить сложность"]
+VERDICTS = ["Рекомендуем к найму", "Рассмотреть кандидата", "Не рекомендовать"]
+
+def _sum_multiples(numbers, k):
+    return sum(n for n in numbers if n % k == 0)
+
+def _find_duplicates(arr):
+    seen, result = set(), []
+    for x in arr:
+        if x in seen and x not in result:
+            result.append(x)
+        seen.add(x)
+    return result
+
+def _count_words(text):
+    counts = {}
+    for word in text.lower().split():
+        counts[word] = counts.get(word, 0) + 1
+    return counts
+
+def _merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def _longest_unique(s):
+    best, start, last = 0, 0, {}
+    for i, ch in enumerate(s):
+        if last.get(ch, -1) >= start:
+            start = last[ch] + 1
+        last[ch] = i
+        best = max(best, i - start + 1)
+    return best
+
+def _words(rng, n):
+    return ' '.join(rng.choice(['api', 'db', 'cache', 'user', 'id', 'log']) for _ in range(n))
+
+def _intervals(rng, n):
+    result = []
+    for _ in range(n):
+        start = rng.randint(0, 20)
+        result.append([start, start + rng.randint(0, 5)])
+    return result
+
+# Шаблоны задач: эталон (функция и ее исходный код на каждом языке) и генератор аргументов.
+# Ожидаемые ответы вычисляются эталоном, поэтому задачи проходят TaskValidator.
+TASK_TEMPLATES = [
+    {
+        'difficulty': 'easy',
+        'title': "Сумма кратных",
+        'description': "Напишите функцию sum_multiples(numbers, k), возвращающую сумму чисел списка, кратных k.\n\n"
+                       "Пример: sum_multiples([1, 2, 3, 4], 2) -> 6",
+        'function': _sum_multiples,
+        'args': lambda rng: [[rng.randint(-20, 40) for _ in range(rng.randint(0, 8))], rng.randint(1, 5)],
+        'python': "def sum_multiples(numbers, k):\n    return sum(n for n in numbers if n % k == 0)\n",
+        'javascript': "function sum_multiples(numbers, k) {\n    return numbers.filter(n => n % k === 0).reduce((a, b) => a + b, 0);\n}\n",
+    },
+    {
+        'difficulty': 'easy',
+        'title': "Частота слов",
+        'description': "Напишите функцию count_words(text), возвращающую словарь: слово в нижнем регистре -> число вхождений.\n\n"
+                       "Пример: count_words(\"API db api\") -> {\"api\": 2, \"db\": 1}",
+        'function': _count_words,
+        'args': lambda rng: [_words(rng, rng.randint(0, 8))],
+        'python': "def count_words(text):\n    counts = {}\n    for word in text.lower().split():\n"
+                  "        counts[word] = counts.get(word, 0) + 1\n    return counts\n",
+        'javascript': "function count_words(text) {\n    const counts = {};\n"
+                      "    text.toLowerCase().split(/\\s+/).filter(Boolean).forEach(w => counts[w] = (counts[w] || 0) + 1);\n"
+                      "    return counts;\n}\n",
+    },
+    {
+        'difficulty': 'medium',
+        'title': "Поиск дубликатов",
+        'description': "Напишите функцию find_duplicates(arr), возвращающую уникальные дубликаты в порядке их первого повторения.\n\n"
+                       "Пример: find_duplicates([1, 2, 1, 3, 2]) -> [1, 2]",
+        'function': _find_duplicates,
+        'args': lambda rng: [[rng.randint(0, 6) for _ in range(rng.randint(0, 10))]],
+        'python': "def find_duplicates(arr):\n    seen, result = set(), []\n    for x in arr:\n"
+                  "        if x in seen and x not in result:\n            result.append(x)\n"
+                  "        seen.add(x)\n    return result\n",
+        'javascript': "function find_duplicates(arr) {\n    const seen = new Set(), result = [];\n"
+                      "    for (const x of arr) {\n        if (seen.has(x) && !result.includes(x)) result.push(x);\n"
+                      "        seen.add(x);\n    }\n    return result;\n}\n",
+    },
+    {
+        'difficulty': 'medium',
+        'title': "Слияние интервалов",
+        'description': "Напишите функцию merge_intervals(intervals), объединяющую пересекающиеся интервалы [start, end].\n\n"
+                       "Пример: merge_intervals([[1, 3], [2, 6], [8, 10]]) -> [[1, 6], [8, 10]]",
+        'function': _merge_intervals,
+        'args': lambda rng: [_intervals(rng, rng.randint(0, 6))],
+        'python': "def merge_intervals(intervals):\n    merged = []\n    for start, end in sorted(intervals):\n"
+                  "        if merged and start <= merged[-1][1]:\n            merged[-1][1] = max(merged[-1][1], end)\n"
+                  "        else:\n            merged.append([start, end])\n    return merged\n",
+        'javascript': "function merge_intervals(intervals) {\n    const merged = [];\n"
+                      "    for (const [s, e] of [...intervals].sort((a, b) => a[0] - b[0] || a[1] - b[1])) {\n"
+                      "        if (merged.length && s <= merged[merged.length - 1][1]) merged[merged.length - 1][1] = Math.max(merged[merged.length - 1][1], e);\n"
+                      "        else merged.push([s, e]);\n    }\n    return merged;\n}\n",
+    },
+    {
+        'difficulty': 'hard',
+        'title': "Самая длинная подстрока без повторов",
+        'description': "Напишите функцию longest_unique(s), возвращающую длину самой длинной подстроки без повторяющихся символов.\n\n"
+                       "Пример: longest_unique(\"abcabcbb\") -> 3",
+        'function': _longest_unique,
+        'args': lambda rng: [''.join(rng.choice('abcde') for _ in range(rng.randint(0, 12)))],
+        'python': "def longest_unique(s):\n    best, start, last = 0, 0, {}\n    for i, ch in enumerate(s):\n"
+                  "        if last.get(ch, -1) >= start:\n            start = last[ch] + 1\n"
+                  "        last[ch] = i\n        best = max(best, i - start + 1)\n    return best\n",
+        'javascript': "function longest_unique(s) {\n    let best = 0, start = 0;\n    const last = {};\n"
+                      "    [...s].forEach((ch, i) => {\n        if ((last[ch] ?? -1) >= start) start = last[ch] + 1;\n"
+                      "        last[ch] = i;\n        best = Math.max(best, i - start + 1);\n    });\n    return best;\n}\n",
+    },
+]
+
+def _prompt_field(prompt: str, name: str, default: str) -> str:
+    match = re.search(rf'^{name}: (.+)$', prompt, re.MULTILINE)
+    return match.group(1).strip() if match else default
+
+def task_response(prompt: str, rng: random.Random) -> str:
+    """JSON задачи в формате промпта CodingTaskGenerator.generate_task"""
+    language = _prompt_field(prompt, 'Язык', 'python')
+    topic = _prompt_field(prompt, 'Тематика', 'алгоритмы')
+    match = re.search(r'"difficulty": "(\w+)"', prompt)
+    difficulty = match.group(1) if match else 'medium'
+
+    candidates = [t for t in TASK_TEMPLATES if t['difficulty'] == difficulty] or TASK_TEMPLATES
+    template = rng.choice(candidates)
+    test_cases = []
+    for i in range(5):
+        args = template['args'](rng)
+        test_cases.append({
+            'input': args,
+            'expected': template['function'](*json.loads(json.dumps(args))),
+            'description': f"тест {i + 1}",
+            'is_hidden': i >= 3
+        })
+
+    code_language = 'javascript' if language.lower() in ('javascript', 'typescript') else 'python'
+    reference = template[code_language]
+    signature = reference.split('\n', 1)[0]
+    stub = "    # Ваш код здесь\n    pass\n" if code_language == 'python' else "    // Ваш код здесь\n}\n"
+    return json.dumps({
+        'title': f"{template['title']} ({topic}, вариант {rng.randint(1, 9999)})",
+        'description': template['description'],
+        'difficulty': difficulty,
+        'test_cases': test_cases,
+        'solution_template': f"{signature}\n{stub}",
+        'reference_solution': reference,
+        'time_limit': 5,
+        'memory_limit': 128,
+        'hints': [f"подсказка по {topic}"],
+        'tags': [topic]
+    }, ensure_ascii=False)
+
+def evaluation_response(rng: random.Random) -> str:
+    """Формат, который разбирает parse_text_evaluation"""
+    return (f"ОЦЕНКА: {rng.randint(4, 9)}/10\n"
+            f"СИЛЬНЫЕ СТОРОНЫ: {', '.join(rng.sample(STRENGTHS, 2))}\n"
+            f"РЕКОМЕНДАЦИИ: {', '.join(rng.sample(IMPROVEMENTS, 2))}")
+
+def summary_response(rng: random.Random) -> str:
+    """JSON итогов, который разбирает build_summary"""
+    return json.dumps({
+        'final_score': f"{rng.randint(4, 9)}/10",
+        'summary': "Кандидат уверенно решает типовые задачи, но местами не учитывает краевые случаи.",
+        'strengths': rng.sample(STRENGTHS, 3),
+        'improvements': rng.sample(IMPROVEMENTS, 3),
+        'recommendations': rng.sample(IMPROVEMENTS, 2),
+        'verdict': rng.choice(VERDICTS)
+    }, ensure_ascii=False)
+
+def classify(messages: List[Dict]) -> str:
+    """Семейство промпта по системному сообщению (см. app.py и coding_tasks.py)"""
+    system = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+    if 'интервьюер' in system:
+        return 'question'
+    if 'Оценщик' in system:
+        return 'evaluation'
+    if 'Генератор задач' in system:
+        return 'task_generation'
+    if 'HR аналитик' in system:
+        return 'summary'
+    return 'other'
+
+def respond(family: str, messages: List[Dict], rng: random.Random) -> str:
+    prompt = messages[-1].get('content', '') if messages else ''
+    if family == 'question':
+        return rng.choice(QUESTION_ENDINGS)
+    if family == 'evaluation':
+        return evaluation_response(rng)
+    if family == 'task_generation':
+        return task_response(prompt, rng)
+    if family == 'summary':
+        return summary_response(rng)
+    return "OK"
+
+# ========== Сервер ==========
+
+def create_app(seed: int = 0, latency: str = 'fixed:0', ttft: str = 'fixed:0',
+               token_delay: float = 0.0, error_rate: float = 0.0) -> Flask:
+    """Flask приложение заглушки.
+
+    Ответ и задержка детерминированы: генератор случайных чисел каждого
+    запроса зависит от seed, текста сообщений и номера повторения этих
+    сообщений. Одинаковая последовательность запросов дает одинаковые
+    ответы, а повтор того же промпта - новый вариант (как у LLM с temperature).
+    latency - задержка обычного ответа; для потокового ответа ttft - задержка
+    первого фрагмента и token_delay - пауза между фрагментами.
+    """
+    mock = Flask(__name__)
+    latency_model = LatencyModel(latency)
+    ttft_model = LatencyModel(ttft)
+    occurrences = {}
+    counters = {'requests': 0, 'errors': 0, 'streams': 0, 'by_family': {}}
+    lock = threading.Lock()
+
+    def prepare(body: Dict) -> Tuple[str, random.Random, str]:
+        messages = body.get('messages', [])
+        digest = hashlib.sha256(json.dumps(messages, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+        family = classify(messages)
+        with lock:
+            occurrence = occurrences[digest] = occurrences.get(digest, -1) + 1
+            counters['requests'] += 1
+            counters['by_family'][family] = counters['by_family'].get(family, 0) + 1
+        rng = random.Random(f"{seed}:{digest}:{occurrence}")
+        return family, rng, respond(family, messages, rng)
+
+    @mock.route('/v1/models', methods=['GET'])
+    def models():
+        return jsonify({'object': 'list', 'data': [{'id': 'mock', 'object': 'model', 'owned_by': 'mock'}]})
+
+    @mock.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        body = request.get_json(force=True)
+        family, rng, content = prepare(body)
+        model = body.get('model', 'mock')
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if rng.random() < error_rate:
+            with lock:
+                counters['errors'] += 1
+            time.sleep(latency_model.sample(rng))
+            return jsonify({'error': {'message': 'mock upstream error', 'type': 'server_error'}}), 500
+
+        if not body.get('stream'):
+            time.sleep(latency_model.sample(rng))
+            prompt_tokens = sum(len(m.get('content', '').split()) for m in body.get('messages', []))
+            completion_tokens = len(content.split())
+            return jsonify({
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens
+                }
+            })
+
+        with lock:
+            counters['streams'] += 1
+        first_delay = ttft_model.sample(rng)
+
+        def chunk(delta: Dict, finish_reason=None) -> str:
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        def generate():
+            time.sleep(first_delay)
+            yield chunk({'role': 'assistant', 'content': ''})
+            # Фрагменты по словам с сохранением пробелов и переносов
+            for piece in re.findall(r'\S+\s*', content):
+                yield chunk({'content': piece})
+                if token_delay:
+                    time.sleep(token_delay)
+            yield chunk({}, finish_reason='stop')
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype='text/event-stream')
+
+    @mock.route('/mock/stats', methods=['GET'])
+    def stats():
+        with lock:
+            return jsonify({**counters, 'latency': latency_model.spec, 'ttft': ttft_model.spec,
+                            'token_delay': token_delay, 'error_rate': error_rate, 'seed': seed})
+
+    return mock
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OpenAI-совместимая заглушка LLM")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', default='fixed:0', help="fixed:S | uniform:A:B | normal:M:SD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--ttft', default='fixed:0', help="Задержка первого фрагмента потокового ответа")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="Пауза между фрагментами, секунд")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля ответов с HTTP 500")
+    args = parser.parse_args()
+
+    print(f"🧪 Заглушка LLM: http://{args.host}:{args.port}/v1 (latency {args.latency}, seed {args.seed})")
+    create_app(args.seed, args.latency, args.ttft, args.token_delay, args.error_rate).run(
+        host=args.host, port=args.port, threaded=True
+    )
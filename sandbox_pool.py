@@ -0,0 +1,529 @@
+# sandbox_pool.py - Пул заранее запущенных процессов-песочниц для выполнения кода
+
+import os
+import math
+import marshal
+import queue
+import signal
+import stat
+import socket
+import time
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from multiprocessing import reduction
+from multiprocessing.connection import Connection, wait
+from typing import Dict, List, Callable, Optional
+
+from code_runner import CodeRunner, TestResult, HAS_RESOURCE
+
+if HAS_RESOURCE:
+    import resource
+
+# Запас времени сверх лимита, после которого процесс убивается принудительно
+WALL_GRACE_SEC = 2
+
+def is_supported() -> bool:
+    """Пул работает только там, где доступен fork (Linux/macOS)"""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+def _current_address_space() -> int:
+    """Текущий размер адресного пространства процесса в байтах (Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[0])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+@contextmanager
+def job_limits(cpu_seconds: int, memory_limit_mb: int):
+    """Лимиты CPU и памяти на время одного задания внутри процесса-песочницы.
+
+    Оба лимита отсчитываются от текущего потребления процесса: RLIMIT_CPU
+    накопительный, а адресное пространство уже занято интерпретатором.
+    """
+    if not HAS_RESOURCE:
+        yield
+        return
+
+    saved = {}
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_used = math.ceil(usage.ru_utime + usage.ru_stime)
+    address_space = _current_address_space()
+
+    wanted = {resource.RLIMIT_CPU: cpu_used + cpu_seconds}
+    if address_space and hasattr(resource, 'RLIMIT_AS'):
+        wanted[resource.RLIMIT_AS] = address_space + memory_limit_mb * 1024 * 1024
+
+    for limit, value in wanted.items():
+        soft, hard = resource.getrlimit(limit)
+        saved[limit] = (soft, hard)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(limit, (value, hard))
+    try:
+        yield
+    finally:
+        for limit, (soft, hard) in saved.items():
+            resource.setrlimit(limit, (soft, hard))
+
+def _worker_main(conn):
+    """Цикл процесса-песочницы: получает задания, возвращает результаты тестов.
+
+    Каждый готовый тест отправляется сразу сообщением ('test', index, result),
+    задание завершается сообщением ('done', results).
+    """
+    # Обработчики сигналов унаследованы от веб-воркера (gunicorn) - сбрасываем
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Прогрев: раннер создается один раз на весь срок жизни процесса
+    runner = CodeRunner()
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        def send_progress(index, test_result):
+            conn.send(('test', index, test_result))
+
+        cpu_budget = math.ceil(job['time_limit_sec'] * max(1, len(job['test_cases']))) + 1
+        try:
+            with job_limits(cpu_budget, job['memory_limit_mb']):
+                results = runner._run_tests(
+                    marshal.loads(job['code']),
+                    job['function_name'],
+                    job['test_cases'],
+                    job['time_limit_sec'],
+                    job['memory_limit_mb'],
+                    on_result=send_progress if job['progress'] else None
+                )
+        except MemoryError:
+            results = [
+                TestResult(tc, False, error="Превышен лимит памяти").to_dict()
+                for tc in job['test_cases']
+            ]
+        conn.send(('done', results))
+
+def _close_inherited_sockets(keep: int):
+    """Закрытие сокетов, унаследованных от веб-воркера (Linux).
+
+    Слушающий сокет сервера и каналы других пулов в песочницах не нужны:
+    иначе после остановки воркера они держат порт и не дают другим
+    песочницам получить EOF.
+    """
+    try:
+        fds = [int(name) for name in os.listdir('/proc/self/fd')]
+    except OSError:
+        return
+    for fd in fds:
+        if fd == keep:
+            continue
+        try:
+            if stat.S_ISSOCK(os.fstat(fd).st_mode):
+                os.close(fd)
+        except OSError:
+            pass
+
+def _zygote_main(conn):
+    """Цикл процесса-прародителя: по запросу пула создает процессы-песочницы fork'ом.
+
+    Запросы: ('spawn', None) - новый процесс (в ответ канал к нему и pid),
+    ('kill', pid) - принудительное завершение, ('exitcode', pid) - код
+    завершения. Прародитель сам собирает завершившиеся процессы, поэтому
+    pid не может достаться постороннему процессу, пока пул его убивает.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _close_inherited_sockets(keep=conn.fileno())
+    live = set()
+    exitcodes = {}  # pid -> код завершения, пока пул его не запросил
+
+    def reap():
+        while live:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            live.discard(pid)
+            exitcodes[pid] = os.waitstatus_to_exitcode(status)
+            if len(exitcodes) > 1024:
+                exitcodes.pop(next(iter(exitcodes)))
+
+    while True:
+        try:
+            if not conn.poll(0.1):
+                reap()
+                continue
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+
+        kind, pid = request
+        if kind == 'spawn':
+            parent_end, child_end = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    conn.close()
+                    parent_end.close()
+                    _worker_main(Connection(child_end.detach()))
+                    code = 0
+                finally:
+                    os._exit(code)
+            child_end.close()
+            live.add(pid)
+            reduction.send_handle(conn, parent_end.fileno(), pid)
+            parent_end.close()
+            conn.send(pid)
+        elif kind == 'kill':
+            reap()
+            if pid in live:
+                os.kill(pid, signal.SIGKILL)
+        elif kind == 'exitcode':
+            deadline = time.monotonic() + 1
+            reap()
+            while pid in live and time.monotonic() < deadline:
+                time.sleep(0.01)
+                reap()
+            conn.send(exitcodes.pop(pid, None))
+
+class SandboxZygote:
+    """Однопоточный процесс-прародитель процессов-песочниц.
+
+    fork многопоточного веб-воркера небезопасен: потомок получает
+    блокировки (malloc, logging, импорт), занятые в момент fork другими
+    потоками - судейскими, LLM, пула задач, журнала. Прародитель
+    создается fork'ом при создании пула, пока потоков еще нет, и остается
+    однопоточным; все процессы-песочницы, в том числе замены, создаются
+    fork'ом из него. forkserver не подходит: его потомки заново
+    импортируют __main__ (при запуске python app.py - все приложение).
+    """
+
+    def __init__(self, ctx):
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_zygote_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self._lock = threading.Lock()
+
+    def _request(self, kind: str, pid: Optional[int] = None, reply: bool = True):
+        with self._lock:
+            try:
+                self.conn.send((kind, pid))
+                if kind == 'spawn':
+                    fd = reduction.recv_handle(self.conn)
+                    return self.conn.recv(), Connection(fd)
+                return self.conn.recv() if reply else None
+            except (EOFError, OSError) as e:
+                raise OSError(f"Процесс-прародитель песочниц недоступен: {e}")
+
+    def spawn(self):
+        """(pid, канал) нового процесса-песочницы"""
+        return self._request('spawn')
+
+    def kill(self, pid: int):
+        try:
+            self._request('kill', pid, reply=False)
+        except OSError:
+            pass  # Прародителя нет - песочница завершится, потеряв канал к пулу
+
+    def exitcode(self, pid: int) -> Optional[int]:
+        """Код завершения процесса (ждет до 1с); -N - завершен сигналом N"""
+        try:
+            return self._request('exitcode', pid)
+        except OSError:
+            return None
+
+    def stop(self):
+        try:
+            with self._lock:
+                self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=1)
+        self.conn.close()
+
+class SandboxWorker:
+    """Процесс-песочница и канал связи с ним"""
+
+    def __init__(self, zygote: SandboxZygote):
+        self.zygote = zygote
+        self.pid, self.conn = zygote.spawn()
+        self.jobs_done = 0
+
+    def is_alive(self) -> bool:
+        # Свободная песочница ничего не присылает: готовность к чтению - это EOF
+        try:
+            return not self.conn.poll()
+        except (OSError, ValueError):
+            return False
+
+    def exitcode(self) -> Optional[int]:
+        return self.zygote.exitcode(self.pid)
+
+    def stop(self):
+        """Штатная остановка процесса"""
+        try:
+            self.conn.send(None)
+            stopped = self.conn.poll(1)  # EOF - процесс завершился
+        except (OSError, ValueError):
+            stopped = False
+        if not stopped:
+            self.zygote.kill(self.pid)
+        self.conn.close()
+
+    def kill(self):
+        """Принудительное завершение процесса"""
+        self.zygote.kill(self.pid)
+        self.conn.close()
+
+class SandboxPool:
+    """Пул процессов-песочниц.
+
+    Каждое задание выполняется в отдельном процессе со своими лимитами
+    CPU/памяти. Зависший процесс убивается по таймауту, процесс
+    перезапускается после max_jobs_per_worker заданий.
+
+    Процессы создает однопоточный прародитель (SandboxZygote), а не сам
+    многопоточный веб-воркер. Замена процессов (после таймаута, сбоя или
+    max_jobs_per_worker заданий) запрашивается в отдельном потоке, а не в
+    потоке запроса: создание процесса не задерживает ответ.
+
+    Размер пула - бюджет ядер на веб-воркер. Тесты одного решения можно
+    разбить на части (до max_shards_per_job) и выполнить параллельно, но
+    дополнительные процессы берутся только свободные: одно решение не
+    может занять весь пул, пока остальные ждут.
+    """
+
+    def __init__(self, size: int = 2, max_jobs_per_worker: int = 50,
+                 max_shards_per_job: int = 1):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_shards_per_job = max(1, min(max_shards_per_job, size))
+        self._ctx = multiprocessing.get_context('fork')
+        self._idle = queue.Queue()
+        self._respawns = queue.Queue()  # (процесс, штатная остановка) на замену
+        self._respawner = None
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'jobs': 0,
+            'shards': 0,
+            'recycled': 0,
+            'killed': 0,
+            'crashed': 0
+        }
+
+        # Прародитель - до того, как приложение запустит потоки
+        self._zygote = SandboxZygote(self._ctx)
+        for _ in range(size):
+            self._idle.put(SandboxWorker(self._zygote))
+
+        print(f"🧱 Пул песочниц запущен: {size} процессов")
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _acquire(self, block: bool = True):
+        while True:
+            try:
+                worker = self._idle.get(block=block)
+            except queue.Empty:
+                return None
+            if worker.is_alive():
+                return worker
+            self._replace(worker, graceful=False)
+
+    def _acquire_many(self, wanted: int) -> List[SandboxWorker]:
+        """Первый процесс ждем, остальные берем только если они свободны"""
+        workers = [self._acquire()]
+        while len(workers) < wanted:
+            worker = self._acquire(block=False)
+            if worker is None:
+                break
+            workers.append(worker)
+        return workers
+
+    def _release(self, worker: SandboxWorker, healthy: bool):
+        """Возврат процесса в пул (или замена на свежий)"""
+        if not healthy:
+            worker.kill()  # Зависшее решение не должно жечь CPU до замены
+            self._replace(worker, graceful=False)
+        elif worker.jobs_done >= self.max_jobs_per_worker:
+            self._count('recycled')
+            self._replace(worker, graceful=True)
+        else:
+            self._idle.put(worker)
+
+    def _replace(self, worker: SandboxWorker, graceful: bool):
+        """Остановка процесса и запуск замены в потоке пересоздания"""
+        with self._stats_lock:
+            if self._respawner is None:
+                self._respawner = threading.Thread(target=self._respawn_loop, name='sandbox-respawn', daemon=True)
+                self._respawner.start()
+        self._respawns.put((worker, graceful))
+
+    def _respawn_loop(self):
+        while True:
+            item = self._respawns.get()
+            if item is None:
+                break
+            worker, graceful = item
+            if graceful:
+                worker.stop()
+            else:
+                worker.kill()
+            # Место в пуле не теряется: при ошибке fork - повтор после паузы
+            while not self._closed:
+                try:
+                    self._idle.put(SandboxWorker(self._zygote))
+                    break
+                except OSError as e:
+                    print(f"⚠️ Не удалось запустить процесс-песочницу: {e}")
+                    time.sleep(1)
+
+    def run_tests(self, code_obj, function_name: str, test_cases: List[Dict],
+                  time_limit_sec: float, memory_limit_mb: int,
+                  on_result: Optional[Callable[[int, Dict], None]] = None) -> List[Dict]:
+        """Выполнение всех тестов решения в процессах-песочницах.
+
+        Решение передается уже скомпилированным (code object через marshal),
+        процесс-песочница не разбирает исходник повторно. Результаты
+        возвращаются в исходном порядке тестов; on_result(index, result)
+        вызывается по мере готовности каждого теста.
+        """
+        if not test_cases:
+            return []
+
+        self._count('jobs')
+        code_bytes = marshal.dumps(code_obj)
+        workers = self._acquire_many(min(self.max_shards_per_job, len(test_cases)))
+        self._count('shards', len(workers))
+        held = list(workers)  # Процессы задания, еще не возвращенные в пул
+
+        def release(worker, healthy):
+            held.remove(worker)
+            self._release(worker, healthy)
+
+        try:
+            return self._dispatch(workers, code_bytes, function_name, test_cases,
+                                  time_limit_sec, memory_limit_mb, on_result, release)
+        finally:
+            # Исключение (в on_result, при отправке задания) не должно уносить
+            # процессы из пула: незавершенные задания прерываются перезапуском
+            for worker in list(held):
+                release(worker, healthy=False)
+
+    def _dispatch(self, workers: List[SandboxWorker], code_bytes: bytes, function_name: str,
+                  test_cases: List[Dict], time_limit_sec: float, memory_limit_mb: int,
+                  on_result: Optional[Callable[[int, Dict], None]], release: Callable) -> List[Dict]:
+        # Тесты раскладываются по процессам через один, чтобы тяжелые
+        # скрытые тесты в конце списка не попали в одну часть
+        results = [None] * len(test_cases)
+        pending = {}
+        for shard, worker in enumerate(workers):
+            indices = list(range(shard, len(test_cases), len(workers)))
+            job = {
+                'code': code_bytes,
+                'function_name': function_name,
+                'test_cases': [test_cases[i] for i in indices],
+                'time_limit_sec': time_limit_sec,
+                'memory_limit_mb': memory_limit_mb,
+                'progress': on_result is not None
+            }
+            deadline = time.monotonic() + time_limit_sec * len(indices) + WALL_GRACE_SEC
+            try:
+                worker.conn.send(job)
+            except OSError:
+                self._finish_crashed(worker, indices, test_cases, results, on_result, release)
+                continue
+            pending[worker.conn] = (worker, indices, deadline)
+
+        while pending:
+            timeout = max(0, min(deadline for _, _, deadline in pending.values()) - time.monotonic())
+            for conn in wait(list(pending), timeout=timeout):
+                worker, indices, _ = pending[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    del pending[conn]
+                    self._finish_crashed(worker, indices, test_cases, results, on_result, release)
+                    continue
+
+                if message[0] == 'test':
+                    _, local_index, test_result = message
+                    results[indices[local_index]] = test_result
+                    on_result(indices[local_index], test_result)
+                    continue
+
+                del pending[conn]
+                worker.jobs_done += 1
+                for index, test_result in zip(indices, message[1]):
+                    results[index] = test_result
+                release(worker, healthy=True)
+
+            now = time.monotonic()
+            for conn in [c for c, (_, _, deadline) in pending.items() if deadline <= now]:
+                worker, indices, _ = pending.pop(conn)
+                print(f"⏱️ Песочница не уложилась в лимит, процесс будет перезапущен")
+                self._count('killed')
+                self._fill(indices, test_cases, results,
+                           f"Превышено время выполнения ({round(time_limit_sec, 2):g}с)", on_result)
+                release(worker, healthy=False)
+
+        return results
+
+    def _finish_crashed(self, worker: SandboxWorker, indices: List[int],
+                        test_cases: List[Dict], results: List, on_result, release: Callable):
+        """Процесс-песочница умер во время задания"""
+        self._count('crashed')
+        exitcode = worker.exitcode()
+        if hasattr(signal, 'SIGXCPU') and exitcode == -signal.SIGXCPU:
+            error = "Превышен лимит процессорного времени"
+        elif exitcode == -signal.SIGKILL:
+            error = "Превышен лимит памяти"
+        else:
+            error = f"Процесс-песочница аварийно завершился (код {exitcode})"
+        print(f"💥 {error}")
+        release(worker, healthy=False)
+        self._fill(indices, test_cases, results, error, on_result)
+
+    def _fill(self, indices: List[int], test_cases: List[Dict], results: List,
+              error: str, on_result=None):
+        """Провал еще не завершенных тестов части с общей ошибкой"""
+        for index in indices:
+            if results[index] is not None:
+                continue
+            results[index] = TestResult(test_cases[index], False, error=error).to_dict()
+            if on_result:
+                on_result(index, results[index])
+
+    def shutdown(self):
+        """Остановка всех процессов пула"""
+        self._closed = True
+        if self._respawner is not None:
+            self._respawns.put(None)
+            self._respawner.join(timeout=5)
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+        self._zygote.stop()
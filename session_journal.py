@@ -0,0 +1,266 @@
+# session_journal.py - Журнал изменений сессий со снимками для восстановления после падения воркера
+
+import os
+import re
+import time
+import zlib
+import struct
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+# fcntl (блокировка каталога журнала) доступен только на Unix
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+# Запись: длина тела (4 байта), crc32 тела (4 байта), тело.
+# Тело: тип события (1 байт), длина id сессии (1 байт), id, состояние (zlib JSON).
+HEADER = struct.Struct('<II')
+EVENT_CODES = {'started': 1, 'answer_recorded': 2, 'code_judged': 3, 'task_issued': 4, 'saved': 5, 'evicted': 6}
+EVENT_NAMES = {code: name for name, code in EVENT_CODES.items()}
+
+SEGMENT_NAME = re.compile(r'^journal-(\d{8})\.log$')
+SNAPSHOT_NAME = re.compile(r'^snapshot-(\d{8})\.snap$')
+
+def _encode(event: str, session_id: str, state: bytes) -> bytes:
+    sid = session_id.encode('utf-8')
+    body = bytes((EVENT_CODES[event], len(sid))) + sid + state
+    return HEADER.pack(len(body), zlib.crc32(body)) + body
+
+def _read_records(path: str) -> Tuple[Iterator[Tuple[str, str, bytes]], list]:
+    """Записи файла по порядку; valid_end[0] - конец последней целой записи"""
+    valid_end = [0]
+
+    def records():
+        with open(path, 'rb') as f:
+            data = f.read()
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            length, crc = HEADER.unpack_from(data, offset)
+            body = data[offset + HEADER.size:offset + HEADER.size + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                break  # Оборванная запись: воркер упал во время записи
+            offset += HEADER.size + length
+            valid_end[0] = offset
+            sid_len = body[1]
+            yield EVENT_NAMES[body[0]], body[2:2 + sid_len].decode('utf-8'), body[2 + sid_len:]
+
+    return records(), valid_end
+
+class SessionJournal:
+    """Журнал изменений сессий на локальном диске (только дозапись).
+
+    Каждое изменение сессии - запись с ее состоянием после изменения
+    (сжатый JSON), поэтому восстановление детерминировано и не требует
+    повторных вызовов LLM: побеждает последняя запись сессии. Запись
+    выполняется сразу в файл (после падения процесса данные уже в ОС),
+    fsync - пачками раз в fsync_interval секунд в фоновом потоке.
+    Журнал делится на сегменты по segment_bytes; закрытые сегменты вместе
+    с прежним снимком сжимаются в новый снимок (по записи на живую
+    сессию), после чего удаляются. Снимок snapshot-N покрывает все
+    сегменты с номером меньше N.
+
+    Журнал принадлежит одному процессу (файловая блокировка каталога):
+    при нескольких воркерах (uvicorn --workers 4) журнал ведет только
+    первый, остальные работают без журнала. Сессии в памяти все равно не
+    общие для воркеров - для нескольких воркеров нужно хранилище в SQLite,
+    которому журнал не нужен. Без fcntl (Windows) журнал недоступен.
+    """
+
+    def __init__(self, directory: str, fsync_interval: float = 0.05,
+                 segment_bytes: int = 16 * 1024 * 1024):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        if not HAS_FCNTL:
+            raise RuntimeError("Журнал сессий требует fcntl (Unix)")
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, 'LOCK'), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError(f"Журнал {directory} уже используется другим процессом")
+        self._lock = threading.Lock()
+        self._fd = None
+        self._segment = 0
+        self._segment_size = 0
+        self._dirty = False
+        self._closed = False
+        self._compact_due = threading.Event()
+        self._thread = None
+        self.events = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.fsynced_events = 0
+        self._pending_events = 0
+        self.snapshots = 0
+        self.recovered = 0
+        self.recovery_sec = 0.0
+
+    def _numbers(self, pattern) -> list:
+        return sorted(int(m.group(1)) for m in map(pattern.match, os.listdir(self.directory)) if m)
+
+    def _path(self, kind: str, number: int) -> str:
+        ext = 'log' if kind == 'journal' else 'snap'
+        return os.path.join(self.directory, f"{kind}-{number:08d}.{ext}")
+
+    def recover(self) -> Dict[str, Tuple[str, bytes]]:
+        """Последнее состояние каждой сессии: session_id -> (событие, zlib JSON).
+
+        Читает последний снимок и все сегменты после него, обрезает
+        оборванную запись в конце журнала и открывает новый сегмент.
+        """
+        started = time.monotonic()
+        snapshots = self._numbers(SNAPSHOT_NAME)
+        base = snapshots[-1] if snapshots else 0
+        latest = self._replay(base)
+        for number in self._numbers(SEGMENT_NAME):
+            if number < base:
+                os.remove(self._path('journal', number))  # Уже в снимке (удаление прервалось)
+        with self._lock:
+            self._open_segment(max(self._numbers(SEGMENT_NAME) + [base - 1]) + 1)
+        if self._segment > base:
+            self._compact_due.set()  # Прочитанные сегменты сожмутся в снимок после запуска потока
+        self.recovered = len(latest)
+        self.recovery_sec = time.monotonic() - started
+        if latest:
+            print(f"📼 Восстановлено сессий из журнала: {len(latest)} за {self.recovery_sec:.2f}с")
+        return latest
+
+    def _replay(self, base: int, until: Optional[int] = None) -> Dict[str, Tuple[str, bytes]]:
+        latest = {}
+        sources = [self._path('snapshot', base)] if base else []
+        sources += [
+            self._path('journal', n) for n in self._numbers(SEGMENT_NAME)
+            if n >= base and (until is None or n < until)
+        ]
+        for path in sources:
+            records, valid_end = _read_records(path)
+            for event, session_id, state in records:
+                if event == 'evicted':
+                    latest.pop(session_id, None)
+                else:
+                    latest[session_id] = (event, state)
+            if valid_end[0] < os.path.getsize(path):
+                print(f"⚠️ Оборванная запись в {os.path.basename(path)}, отброшено "
+                      f"{os.path.getsize(path) - valid_end[0]} байт")
+                if until is None and path.endswith('.log'):
+                    with open(path, 'r+b') as f:
+                        f.truncate(valid_end[0])
+        return latest
+
+    def _open_segment(self, number: int):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+        self._segment = number
+        self._fd = os.open(self._path('journal', number), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segment_size = os.fstat(self._fd).st_size
+
+    def append(self, event: str, session_id: str, state: bytes):
+        """Запись изменения сессии; state - сжатое состояние (пустое для evicted)"""
+        record = _encode(event, session_id, state)
+        with self._lock:
+            if self._closed or self._fd is None:
+                return
+            os.write(self._fd, record)
+            self._segment_size += len(record)
+            self._dirty = True
+            self.events += 1
+            self._pending_events += 1
+            self.bytes_written += len(record)
+            if self._segment_size >= self.segment_bytes:
+                self._open_segment(self._segment + 1)
+                self._compact_due.set()
+            if self._thread is None:
+                # Поток запускается при первой записи - уже после запуска пула песочниц
+                self._thread = threading.Thread(target=self._flusher, name='session-journal', daemon=True)
+                self._thread.start()
+
+    def remove(self, session_id: str):
+        self.append('evicted', session_id, b'')
+
+    def _flusher(self):
+        while not self._closed:
+            if self._compact_due.wait(self.fsync_interval) and not self._closed:
+                self._compact_due.clear()
+                try:
+                    self.compact()
+                except OSError as e:
+                    print(f"⚠️ Ошибка снимка журнала сессий: {e}")
+            self.flush()
+
+    def flush(self):
+        """fsync всех записанных событий одной операцией"""
+        with self._lock:
+            if not self._dirty or self._fd is None:
+                return
+            fd, pending = self._fd, self._pending_events
+            self._dirty = False
+            self._pending_events = 0
+        try:
+            os.fsync(fd)
+        except OSError:
+            return  # Сегмент уже закрыт ротацией (она сама делает fsync)
+        self.fsyncs += 1
+        self.fsynced_events += pending
+
+    def compact(self):
+        """Снимок: прежний снимок + закрытые сегменты -> по записи на живую сессию"""
+        with self._lock:
+            current = self._segment
+        snapshots = self._numbers(SNAPSHOT_NAME)
+        base = snapshots[-1] if snapshots else 0
+        if base >= current:
+            return
+        latest = self._replay(base, until=current)
+        path = self._path('snapshot', current)
+        with open(f"{path}.tmp", 'wb') as f:
+            for session_id, (event, state) in latest.items():
+                f.write(_encode(event, session_id, state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        for number in snapshots:
+            os.remove(self._path('snapshot', number))
+        for number in self._numbers(SEGMENT_NAME):
+            if number < current:
+                os.remove(self._path('journal', number))
+        self.snapshots += 1
+        print(f"📸 Снимок журнала сессий: {len(latest)} сессий")
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        # Дожидаемся потока: снимок не должен дописываться после передачи каталога
+        self._compact_due.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        with self._lock:
+            if self._fd is not None:
+                os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
+        self._lock_file.close()
+
+    def stats(self) -> Dict:
+        return {
+            'segment': self._segment,
+            'events': self.events,
+            'bytes_written': self.bytes_written,
+            'fsyncs': self.fsyncs,
+            'events_per_fsync': round(self.fsynced_events / self.fsyncs, 2) if self.fsyncs else 0,
+            'snapshots': self.snapshots,
+            'recovered_sessions': self.recovered,
+            'recovery_sec': round(self.recovery_sec, 3)
+        }
@@ -0,0 +1,573 @@
+# session_store.py - Хранилище сессий собеседований (в памяти или общее для процессов)
+
+import os
+import re
+import json
+import gzip
+import time
+import uuid
+import zlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    state BLOB NOT NULL,
+    updated_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    finished INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_retention ON sessions (finished, updated_at);
+"""
+
+# Колонки, добавленные после первой версии схемы
+MIGRATIONS = {
+    'finished': "ALTER TABLE sessions ADD COLUMN finished INTEGER NOT NULL DEFAULT 0",
+    'size': "ALTER TABLE sessions ADD COLUMN size INTEGER NOT NULL DEFAULT 0",
+}
+
+SAFE_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{1,128}$')
+
+class SessionBusyError(Exception):
+    """Сессию слишком долго изменяет другой запрос"""
+
+class _StripedLocks:
+    """Блокировки сессий внутри процесса: фиксированный набор, выбор по хешу id"""
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def get(self, session_id: str) -> threading.RLock:
+        return self._locks[hash(session_id) % len(self._locks)]
+
+def _is_finished(session) -> bool:
+    return not getattr(session, 'is_active', True)
+
+class SessionArchive:
+    """Архив вытесненных сессий на диске: по файлу <session_id>.json.gz на сессию"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.bytes = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json.gz'):
+                    self.count += 1
+                    self.bytes += entry.stat().st_size
+
+    def _path(self, session_id: str) -> Optional[str]:
+        # session_id приходит из запроса - в путь попадают только безопасные имена
+        if not session_id or not SAFE_SESSION_ID.match(session_id):
+            return None
+        return os.path.join(self.directory, f"{session_id}.json.gz")
+
+    def save(self, session_id: str, state: Dict):
+        path = self._path(session_id)
+        if path is None:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+        size = os.path.getsize(tmp_path)
+        old_size = os.path.getsize(path) if os.path.exists(path) else None
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.bytes += size - (old_size or 0)
+            self.count += 0 if old_size is not None else 1
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        path = self._path(session_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def stats(self) -> Dict:
+        return {'archived': self.count, 'archived_bytes': self.bytes}
+
+class SessionRetention:
+    """Правила вытеснения сессий из хранилища.
+
+    Незавершенная сессия вытесняется после idle_ttl секунд без изменений,
+    завершенная - после finished_ttl. Если сессии занимают больше max_bytes,
+    сразу вытесняются завершенные, начиная с давно не использованных;
+    незавершенные ради лимита не трогаются. Перед вытеснением сессия
+    сохраняется в archive (если задан), on_evict(session_id) вызывается
+    после удаления. Проверка сроков выполняется не чаще sweep_interval
+    секунд по ходу обычных запросов, без отдельного потока.
+    """
+
+    def __init__(self, idle_ttl: float = 2 * 3600, finished_ttl: float = 3600,
+                 max_bytes: int = 64 * 1024 * 1024, sweep_interval: float = 60,
+                 archive: Optional[SessionArchive] = None,
+                 on_evict: Optional[Callable[[str], None]] = None):
+        self.idle_ttl = idle_ttl
+        self.finished_ttl = finished_ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.archive = archive
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.evicted = {'idle': 0, 'finished': 0, 'memory': 0}
+
+    def sweep_due(self) -> bool:
+        """True не чаще раза в sweep_interval (один поток получает право на проверку)"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_sweep < self.sweep_interval:
+                return False
+            self._last_sweep = now
+            return True
+
+    def evicted_one(self, session_id: str, reason: str):
+        with self._lock:
+            self.evicted[reason] += 1
+        if self.on_evict:
+            try:
+                self.on_evict(session_id)
+            except Exception as e:
+                print(f"⚠️ Ошибка обработчика вытеснения сессии {session_id}: {e}")
+
+    def stats(self) -> Dict:
+        stats = {'evicted': dict(self.evicted)}
+        stats.update(self.archive.stats() if self.archive else {'archived': 0, 'archived_bytes': 0})
+        return stats
+
+class MemorySessionStore:
+    """Сессии в памяти процесса (один воркер, разработка).
+
+    session() выполняет чтение-изменение-запись под блокировкой сессии:
+    два запроса одной сессии не меняют ее одновременно. Размер сессии
+    оценивается по длине ее JSON-состояния после каждого изменения.
+    С load get() возвращает копию последнего сохраненного состояния
+    (сжатый JSON хранится рядом с сессией): чтение не видит незавершенных
+    изменений и не зависит от запроса, который держит сессию.
+    С journal (SessionJournal) каждое изменение записывается в журнал
+    с именем события, а recover() поднимает сессии после перезапуска.
+    """
+
+    def __init__(self, lock_timeout: float = 130.0, load: Optional[Callable[[Dict], object]] = None,
+                 retention: Optional[SessionRetention] = None, journal=None):
+        self.lock_timeout = lock_timeout
+        self.load = load
+        self.retention = retention or SessionRetention()
+        self.journal = journal
+        self._sessions = OrderedDict()  # session_id -> сессия, от давно использованных к недавним
+        self._sizes = {}
+        self._states = {}  # session_id -> сжатое JSON-состояние после последнего изменения
+        self._finished = OrderedDict()  # завершенные сессии в том же порядке (кандидаты по памяти)
+        self._touched = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._locks = _StripedLocks()
+
+    def add(self, session, event: str = 'started'):
+        self._store(session, event)
+        self._enforce_retention()
+
+    def recover(self) -> int:
+        """Загрузка сессий из журнала (при запуске, до первых запросов)"""
+        if not self.journal:
+            return 0
+        for state in self.journal.recover().values():
+            payload = zlib.decompress(state[1])
+            session = self.load(json.loads(payload.decode('utf-8')))
+            self._register(session, len(payload), state[1])
+        return len(self._sessions)
+
+    def get(self, session_id: str):
+        """Сессия только для чтения (None, если ее нет); вытесненная - из архива"""
+        if not session_id:
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            state = self._states.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                if session_id in self._finished:
+                    self._finished.move_to_end(session_id)
+        if session is None:
+            return self._from_archive(session_id)
+        if self.load is None:
+            return session
+        return self.load(json.loads(zlib.decompress(state).decode('utf-8')))
+
+    @contextmanager
+    def session(self, session_id: str, event: str = 'saved'):
+        """Сессия для изменения (None, если ее нет); event - имя изменения для журнала"""
+        lock = self._locks.get(session_id or '')
+        if not lock.acquire(timeout=self.lock_timeout):
+            raise SessionBusyError(f"Сессия {session_id} занята другим запросом")
+        try:
+            with self._lock:
+                session = self._sessions.get(session_id) if session_id else None
+            yield session
+            if session is not None:
+                self._store(session, event)
+        finally:
+            lock.release()
+        self._enforce_retention()
+
+    def _store(self, session, event: str):
+        payload = json.dumps(session.to_state(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        state = zlib.compress(payload, 1)
+        if self.journal:
+            self.journal.append(event, session.session_id, state)
+        self._register(session, len(payload), state)
+
+    def _register(self, session, size: int, state: bytes):
+        session_id = session.session_id
+        with self._lock:
+            self._bytes += size - self._sizes.get(session_id, 0)
+            self._sizes[session_id] = size
+            self._states[session_id] = state
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            self._touched[session_id] = time.time()
+            if _is_finished(session):
+                self._finished[session_id] = True
+                self._finished.move_to_end(session_id)
+
+    def _from_archive(self, session_id: str):
+        archive = self.retention.archive
+        state = archive.load(session_id) if archive and self.load else None
+        return self.load(state) if state else None
+
+    def _enforce_retention(self):
+        if self.retention.sweep_due():
+            self.sweep()
+        # Лимит памяти проверяется при каждом изменении: вытеснение завершенных - O(1) на сессию
+        while self._bytes > self.retention.max_bytes:
+            with self._lock:
+                if not self._finished:
+                    break
+                session_id = next(iter(self._finished))
+            if not self._evict(session_id, 'memory'):
+                break
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Вытеснение сессий с истекшим сроком; возвращает число вытесненных"""
+        now = now or time.time()
+        retention = self.retention
+        with self._lock:
+            expired = [
+                (session_id, 'finished' if session_id in self._finished else 'idle')
+                for session_id, touched in self._touched.items()
+                if touched < now - (retention.finished_ttl if session_id in self._finished else retention.idle_ttl)
+            ]
+        return sum(1 for session_id, reason in expired if self._evict(session_id, reason))
+
+    def _evict(self, session_id: str, reason: str) -> bool:
+        lock = self._locks.get(session_id)
+        if not lock.acquire(blocking=False):
+            return False  # Сессию сейчас изменяет запрос
+        try:
+            with self._lock:
+                session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            if self.retention.archive:
+                self.retention.archive.save(session_id, session.to_state())
+            if self.journal:
+                self.journal.remove(session_id)
+            with self._lock:
+                self._sessions.pop(session_id, None)
+                self._states.pop(session_id, None)
+                self._finished.pop(session_id, None)
+                self._touched.pop(session_id, None)
+                self._bytes -= self._sizes.pop(session_id, 0)
+        finally:
+            lock.release()
+        self.retention.evicted_one(session_id, reason)
+        return True
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {
+                'backend': 'memory',
+                'sessions': len(self._sessions),
+                'finished': len(self._finished),
+                'bytes': self._bytes,
+                'max_bytes': self.retention.max_bytes
+            }
+        stats.update(self.retention.stats())
+        if self.journal:
+            stats['journal'] = self.journal.stats()
+        return stats
+
+class SQLiteSessionStore:
+    """Сессии в SQLite (WAL), общие для всех воркеров gunicorn и переживающие перезапуск.
+
+    Сессия хранится сжатым JSON (to_state/from_state). Чтение-изменение-запись
+    атомарно между процессами за счет аренды: запрос записывает себя в
+    lease_owner строки сессии, и пока аренда не истекла, другие запросы
+    этой сессии ждут. Транзакция SQLite на время обработки не держится,
+    поэтому долгий запрос (проверка кода, LLM) не блокирует другие сессии.
+    Аренда с ограниченным сроком освобождает сессию, если воркер упал;
+    пока блок session() выполняется, поток продления аренды каждые
+    lease_sec / 3 секунд отодвигает ее срок. Если аренду все же перехватил
+    другой запрос, изменения не записываются и поднимается SessionBusyError.
+    Сроки и лимит размера (по сжатому состоянию) проверяются при
+    периодической проверке retention каждого воркера.
+    """
+
+    def __init__(self, path: str, load: Callable[[Dict], object],
+                 lease_sec: float = 150.0, lock_timeout: float = 130.0,
+                 retention: Optional[SessionRetention] = None):
+        self.path = path
+        self.load = load
+        self.lease_sec = lease_sec
+        self.lock_timeout = lock_timeout
+        self.retention = retention or SessionRetention()
+        self._local = threading.local()
+        self._locks = _StripedLocks()
+        self._stats_lock = threading.Lock()
+        self.writes = 0
+        self.lease_waits = 0
+        self.lease_conflicts = 0
+        self.bytes_written = 0
+        self._held = {}  # владелец аренды -> session_id, аренды продлеваются в фоне
+        self._renewer = None
+        conn = self._conn()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        if columns:
+            for column, statement in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(statement)
+        conn.executescript(SCHEMA)
+        print(f"🗄️ Хранилище сессий: {path} ({len(self)} сессий)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Отдельное соединение на поток, без неявных транзакций"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            setattr(self, key, getattr(self, key) + amount)
+
+    def _encode(self, session) -> bytes:
+        payload = json.dumps(session.to_state(), ensure_ascii=False, separators=(',', ':'))
+        return zlib.compress(payload.encode('utf-8'), 6)
+
+    def _decode_state(self, state: bytes) -> Dict:
+        return json.loads(zlib.decompress(state).decode('utf-8'))
+
+    def add(self, session, event: str = 'started'):
+        state = self._encode(session)
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (session_id, state, updated_at, finished, size) VALUES (?, ?, ?, ?, ?)",
+            (session.session_id, state, time.time(), int(_is_finished(session)), len(state))
+        )
+        self._count('writes')
+        self._count('bytes_written', len(state))
+        self._maybe_sweep()
+
+    def get(self, session_id: str):
+        """Сессия только для чтения (None, если ее нет); вытесненная - из архива"""
+        if not session_id:
+            return None
+        row = self._conn().execute(
+            "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row:
+            return self.load(self._decode_state(row[0]))
+        archive = self.retention.archive
+        state = archive.load(session_id) if archive else None
+        return self.load(state) if state else None
+
+    @contextmanager
+    def session(self, session_id: str, event: str = 'saved'):
+        """Сессия для изменения (None, если ее нет).
+
+        Изменения сохраняются при нормальном выходе из блока; при исключении
+        отбрасываются. event не используется: запись в SQLite уже надежна.
+        """
+        lock = self._locks.get(session_id or '')
+        if not lock.acquire(timeout=self.lock_timeout):
+            raise SessionBusyError(f"Сессия {session_id} занята другим запросом")
+        try:
+            owner = self._acquire_lease(session_id)
+            if owner is None:
+                yield None
+                return
+            self._hold(session_id, owner)
+            try:
+                row = self._conn().execute(
+                    "SELECT state FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                session = self.load(self._decode_state(row[0]))
+                yield session
+                state = self._encode(session)
+                cursor = self._conn().execute(
+                    "UPDATE sessions SET state = ?, updated_at = ?, finished = ?, size = ?, "
+                    "lease_owner = NULL, lease_until = 0 WHERE session_id = ? AND lease_owner = ?",
+                    (state, time.time(), int(_is_finished(session)), len(state), session_id, owner)
+                )
+                if cursor.rowcount == 0:
+                    self._count('lease_conflicts')
+                    print(f"⚠️ Аренда сессии {session_id} перехвачена другим запросом, изменения отброшены")
+                    raise SessionBusyError(f"Сессия {session_id} изменена другим запросом")
+                self._count('writes')
+                self._count('bytes_written', len(state))
+            finally:
+                self._unhold(owner)
+                self._release_lease(session_id, owner)
+        finally:
+            lock.release()
+        self._maybe_sweep()
+
+    def _try_lease(self, session_id: str, owner: str) -> bool:
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE sessions SET lease_owner = ?, lease_until = ? "
+            "WHERE session_id = ? AND (lease_owner IS NULL OR lease_until < ?)",
+            (owner, now + self.lease_sec, session_id, now)
+        )
+        return cursor.rowcount > 0
+
+    def _release_lease(self, session_id: str, owner: str):
+        self._conn().execute(
+            "UPDATE sessions SET lease_owner = NULL, lease_until = 0 "
+            "WHERE session_id = ? AND lease_owner = ?",
+            (session_id, owner)
+        )
+
+    def _hold(self, session_id: str, owner: str):
+        with self._stats_lock:
+            self._held[owner] = session_id
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_loop, name='session-lease-renew', daemon=True)
+                self._renewer.start()
+
+    def _unhold(self, owner: str):
+        with self._stats_lock:
+            self._held.pop(owner, None)
+
+    def _renew_loop(self):
+        """Продление аренд, которые держат блоки session() этого процесса"""
+        while True:
+            time.sleep(self.lease_sec / 3)
+            with self._stats_lock:
+                held = list(self._held.items())
+            for owner, session_id in held:
+                try:
+                    self._conn().execute(
+                        "UPDATE sessions SET lease_until = ? WHERE session_id = ? AND lease_owner = ?",
+                        (time.time() + self.lease_sec, session_id, owner)
+                    )
+                except sqlite3.Error as e:
+                    print(f"⚠️ Ошибка продления аренды сессии {session_id}: {e}")
+
+    def _acquire_lease(self, session_id: str) -> Optional[str]:
+        """Аренда сессии; None, если сессии нет"""
+        if not session_id:
+            return None
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.01
+        conn = self._conn()
+        while True:
+            if self._try_lease(session_id, owner):
+                return owner
+            if conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is None:
+                return None
+            if time.monotonic() >= deadline:
+                raise SessionBusyError(f"Сессия {session_id} занята другим запросом")
+            self._count('lease_waits')
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def _maybe_sweep(self):
+        if self.retention.sweep_due():
+            try:
+                self.sweep()
+            except sqlite3.Error as e:
+                print(f"⚠️ Ошибка вытеснения сессий: {e}")
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Вытеснение сессий с истекшим сроком и сверх лимита; возвращает число вытесненных"""
+        now = now or time.time()
+        retention = self.retention
+        conn = self._conn()
+        expired = conn.execute(
+            "SELECT session_id, finished FROM sessions "
+            "WHERE (finished = 0 AND updated_at < ?) OR (finished = 1 AND updated_at < ?)",
+            (now - retention.idle_ttl, now - retention.finished_ttl)
+        ).fetchall()
+        evicted = sum(
+            1 for session_id, finished in expired
+            if self._evict(session_id, 'finished' if finished else 'idle')
+        )
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM sessions").fetchone()[0]
+        if total > retention.max_bytes:
+            for session_id, size in conn.execute(
+                "SELECT session_id, size FROM sessions WHERE finished = 1 ORDER BY updated_at"
+            ).fetchall():
+                if total <= retention.max_bytes:
+                    break
+                if self._evict(session_id, 'memory'):
+                    total -= size
+                    evicted += 1
+        return evicted
+
+    def _evict(self, session_id: str, reason: str) -> bool:
+        # Арендованная сессия (ее изменяет запрос любого воркера) пропускается
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        if not self._try_lease(session_id, owner):
+            return False
+        try:
+            row = self._conn().execute(
+                "SELECT state FROM sessions WHERE session_id = ? AND lease_owner = ?", (session_id, owner)
+            ).fetchone()
+            if row is None:
+                return False
+            if self.retention.archive:
+                self.retention.archive.save(session_id, self._decode_state(row[0]))
+            self._conn().execute(
+                "DELETE FROM sessions WHERE session_id = ? AND lease_owner = ?", (session_id, owner)
+            )
+        except Exception:
+            self._release_lease(session_id, owner)
+            raise
+        self.retention.evicted_one(session_id, reason)
+        return True
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> Dict:
+        sessions, finished, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(finished), 0), COALESCE(SUM(size), 0) FROM sessions"
+        ).fetchone()
+        stats = {
+            'backend': 'sqlite',
+            'sessions': sessions,
+            'finished': finished,
+            'bytes': size,
+            'max_bytes': self.retention.max_bytes,
+            'writes': self.writes,
+            'lease_waits': self.lease_waits,
+            'lease_conflicts': self.lease_conflicts,
+            'avg_state_bytes': round(self.bytes_written / self.writes) if self.writes else 0
+        }
+        stats.update(self.retention.stats())
+        return stats
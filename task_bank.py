@@ -0,0 +1,200 @@
+# task_bank.py - Постоянный банк сгенерированных задач (SQLite)
+
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from coding_tasks import CodingTask, TestCase
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL UNIQUE,
+    position TEXT NOT NULL,
+    level TEXT NOT NULL,
+    language TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    rnd REAL NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_bucket
+    ON tasks (position, level, language, difficulty, topic, rnd);
+CREATE INDEX IF NOT EXISTS idx_tasks_difficulty
+    ON tasks (position, level, language, difficulty, rnd);
+CREATE TABLE IF NOT EXISTS task_tags (
+    tag TEXT NOT NULL,
+    task_id INTEGER NOT NULL REFERENCES tasks (id),
+    PRIMARY KEY (tag, task_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS claims (
+    name TEXT PRIMARY KEY,
+    until REAL NOT NULL
+);
+"""
+
+BANK_ID_PREFIX = 'bank_'
+
+class TaskBank:
+    """Банк задач: каждая задача, полученная от LLM, сохраняется вместе с тестами.
+
+    Случайный выбор без ORDER BY RANDOM(): у каждой задачи есть случайный
+    ключ rnd в составном индексе, берется первая задача с rnd >= случайного
+    числа (с переходом через начало). Поэтому поиск - один проход по индексу
+    независимо от размера банка. Уже виденные сессией задачи исключаются.
+    """
+
+    def __init__(self, path: str = 'task_bank.db'):
+        self.path = path
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self._conn().executescript(SCHEMA)
+        print(f"🏦 Банк задач: {path} ({self.size()} задач)")
+
+    def _conn(self) -> sqlite3.Connection:
+        """Отдельное соединение на поток"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            setattr(self, key, getattr(self, key) + amount)
+
+    def add(self, task: CodingTask, position: str, level: str, topic: str) -> str:
+        """Сохранение задачи; возвращает ее постоянный task_id"""
+        return self.add_many([(task, position, level, topic)])[0]
+
+    def add_many(self, entries: Iterable[Tuple[CodingTask, str, str, str]]) -> List[str]:
+        """Сохранение задач одной транзакцией.
+
+        Задаче присваивается task_id вида bank_<id>; одинаковые задачи
+        (тот же текст и тесты) не дублируются.
+        """
+        conn = self._conn()
+        task_ids = []
+        with conn:
+            for task, position, level, topic in entries:
+                content_hash = self._content_hash(task)
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO tasks (content_hash, position, level, language, "
+                    "difficulty, topic, rnd, payload, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (content_hash, position, level, task.language, task.difficulty, topic,
+                     random.random(), json.dumps(asdict(task), ensure_ascii=False), time.time())
+                )
+                if cursor.rowcount:
+                    row_id = cursor.lastrowid
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO task_tags (tag, task_id) VALUES (?, ?)",
+                        [(tag, row_id) for tag in set(task.tags)]
+                    )
+                    self._count('stored')
+                else:
+                    row_id = conn.execute("SELECT id FROM tasks WHERE content_hash = ?",
+                                          (content_hash,)).fetchone()[0]
+                task.task_id = f"{BANK_ID_PREFIX}{row_id}"
+                task_ids.append(task.task_id)
+        return task_ids
+
+    def count(self, position: str, level: str, language: str, difficulty: str,
+              topic: Optional[str] = None, limit: Optional[int] = None) -> int:
+        """Число задач корзины; с limit - не больше limit (обход останавливается на limit строках)"""
+        where, params = self._bucket_filter(position, level, language, difficulty, topic)
+        if limit is None:
+            return self._conn().execute(f"SELECT COUNT(*) FROM tasks WHERE {where}", params).fetchone()[0]
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM tasks WHERE {where} LIMIT ?)", params + [limit]
+        ).fetchone()[0]
+
+    def pick(self, position: str, level: str, language: str, difficulty: str,
+             topic: Optional[str] = None, tags: Iterable[str] = (),
+             exclude_ids: Iterable[str] = ()) -> Optional[CodingTask]:
+        """Случайная задача корзины, которую сессия еще не видела"""
+        where, params = self._bucket_filter(position, level, language, difficulty, topic)
+
+        excluded = [int(task_id[len(BANK_ID_PREFIX):]) for task_id in exclude_ids
+                    if task_id.startswith(BANK_ID_PREFIX) and task_id[len(BANK_ID_PREFIX):].isdigit()]
+        if excluded:
+            where += f" AND id NOT IN ({', '.join('?' * len(excluded))})"
+            params += excluded
+        tags = list(tags)
+        if tags:
+            # Коррелированный подзапрос: обход идет по индексу корзины, теги проверяются точечно
+            where += (" AND EXISTS (SELECT 1 FROM task_tags WHERE task_tags.task_id = tasks.id"
+                      f" AND tag IN ({', '.join('?' * len(tags))}))")
+            params += tags
+
+        conn = self._conn()
+        start = random.random()
+        row = conn.execute(
+            f"SELECT id, payload FROM tasks WHERE {where} AND rnd >= ? ORDER BY rnd LIMIT 1",
+            params + [start]
+        ).fetchone()
+        if row is None:
+            row = conn.execute(
+                f"SELECT id, payload FROM tasks WHERE {where} AND rnd < ? ORDER BY rnd LIMIT 1",
+                params + [start]
+            ).fetchone()
+
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return self._load(*row)
+
+    def claim(self, name: str, ttl: float) -> bool:
+        """Разовая работа на все воркеры с этим банком: True только у первого (снова - через ttl)"""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO claims (name, until) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET until = excluded.until WHERE claims.until < ?",
+                (name, now + ttl, now)
+            )
+        return cursor.rowcount > 0
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def stats(self) -> Dict:
+        return {
+            'tasks': self.size(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stored': self.stored
+        }
+
+    def _bucket_filter(self, position, level, language, difficulty, topic):
+        where = "position = ? AND level = ? AND language = ? AND difficulty = ?"
+        params = [position, level, language, difficulty]
+        if topic is not None:
+            where += " AND topic = ?"
+            params.append(topic)
+        return where, params
+
+    def _content_hash(self, task: CodingTask) -> str:
+        content = json.dumps(
+            [task.language, task.title, task.description, [asdict(tc) for tc in task.test_cases]],
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def _load(self, row_id: int, payload: str) -> CodingTask:
+        data = json.loads(payload)
+        data['task_id'] = f"{BANK_ID_PREFIX}{row_id}"
+        data['test_cases'] = [TestCase(**tc) for tc in data['test_cases']]
+        return CodingTask(**data)
@@ -0,0 +1,242 @@
+# task_pool.py - Фоновый пул заранее сгенерированных задач
+
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from coding_tasks import CodingTask, CodingTaskGenerator
+
+class TaskPool:
+    """Пул готовых задач по корзинам (должность, уровень, сложность, тема, язык).
+
+    Сложность и тема определяются так же, как в CodingTaskGenerator.generate_task
+    (get_difficulty_for_task_number / get_topic_for_task), поэтому задача из
+    корзины взаимозаменяема с задачей, сгенерированной "вживую". Фоновые потоки
+    держат в каждой запрошенной корзине target_depth задач; запрос только
+    забирает готовую задачу, а при пустой корзине генерирует ее сам.
+    """
+
+    def __init__(self, generator: CodingTaskGenerator, target_depth: int = 2, workers: int = 2):
+        self.generator = generator
+        self.target_depth = target_depth
+        self._buckets = {}  # ключ -> deque готовых задач
+        self._specs = {}  # ключ -> аргументы generate_task для пополнения
+        self._in_flight = {}  # ключ -> задач в генерации
+        self._refill = queue.Queue()
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'generated': 0,
+            'failed': 0
+        }
+
+        for i in range(workers if target_depth > 0 else 0):
+            threading.Thread(target=self._worker, name=f'task-pool-{i}', daemon=True).start()
+
+    def bucket_key(self, position: str, level: str, language: str,
+                   task_number: int, total_tasks: int):
+        difficulty = self.generator.get_difficulty_for_task_number(task_number, total_tasks, level)
+        topic = self.generator.get_topic_for_task(position, task_number)
+        language = self.generator.resolve_language(position, language)
+        return (position, level, difficulty, topic, language)
+
+    def get_task(self, position: str, level: str, language: str = "python",
+                 task_number: int = 1, total_tasks: int = 10, exclude_ids=()) -> CodingTask:
+        """Готовая задача из корзины или, если она пуста, генерация на месте.
+
+        Задачи из exclude_ids (уже виденные сессией) остаются в корзине.
+        """
+        spec = (position, level, language, task_number, total_tasks)
+        key = self.bucket_key(*spec)
+
+        with self._lock:
+            bucket = self._buckets.get(key) or ()
+            task = next((t for t in bucket if t.task_id not in exclude_ids), None)
+            if task:
+                bucket.remove(task)
+            self._counters['hits' if task else 'misses'] += 1
+            self._specs.setdefault(key, spec)
+            self._schedule(key)
+
+        if task:
+            print(f"⚡ Задача из пула: {task.title}")
+            return task
+
+        return self.generator.generate_task(*spec, exclude_ids=exclude_ids)
+
+    def warm(self, position: str, level: str, language: str = "python",
+             total_tasks: int = 10, task_numbers=None):
+        """Заказ задач заранее (по умолчанию - на все собеседование)"""
+        with self._lock:
+            for task_number in task_numbers or range(1, total_tasks + 1):
+                spec = (position, level, language, task_number, total_tasks)
+                key = self.bucket_key(*spec)
+                self._specs.setdefault(key, spec)
+                self._schedule(key)
+
+    def _schedule(self, key):
+        """Поставить корзину на пополнение до target_depth (под self._lock)"""
+        ready = len(self._buckets.get(key, ()))
+        missing = self.target_depth - ready - self._in_flight.get(key, 0)
+        for _ in range(max(0, missing)):
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            self._refill.put(key)
+
+    def _worker(self):
+        while True:
+            key = self._refill.get()
+            task = None
+            try:
+                task = self.generator.generate_task(*self._specs[key])
+            except Exception as e:
+                print(f"❌ Ошибка фоновой генерации задачи: {e}")
+
+            with self._lock:
+                self._in_flight[key] -= 1
+                # Резервная задача означает недоступность LLM - в пул ее не кладем,
+                # корзина будет заказана снова при следующем запросе
+                if task is None or task.task_id.startswith('fallback_'):
+                    self._counters['failed'] += 1
+                    continue
+                self._buckets.setdefault(key, deque()).append(task)
+                self._counters['generated'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_rate': round(self._counters['hits'] / lookups, 3) if lookups else 0.0,
+                'buckets': len(self._specs),
+                'ready': sum(len(bucket) for bucket in self._buckets.values()),
+                'in_flight': sum(self._in_flight.values()),
+                'target_depth': self.target_depth
+            }
+
+class Prefetch:
+    """Упреждающая генерация одной задачи"""
+
+    def __init__(self, spec, key, exclude_ids=()):
+        self.spec = spec
+        self.key = key
+        self.exclude_ids = exclude_ids
+        self.future = Future()  # Создается сразу: генерация может ждать очереди
+        self.elapsed = 0.0
+        self.cancelled = False
+
+class TaskPrefetcher:
+    """Генерация следующей задачи сессии, пока кандидат решает текущую.
+
+    start() запускает генерацию (через TaskPool, так что готовая задача
+    из корзины забирается сразу), take() забирает результат при отправке
+    решения, cancel() отменяет ненужную генерацию. Время генерации
+    отмененных и невостребованных задач учитывается как потраченное впустую.
+    start_many() запускает сразу несколько задач (например, все задачи
+    собеседования) с ограничением на число одновременных генераций.
+    """
+
+    def __init__(self, pool: TaskPool, workers: int = 4):
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._counters = {
+            'started': 0,
+            'hits': 0,  # Задача была готова к моменту отправки решения
+            'waited': 0,  # Генерация еще шла - дождались ее
+            'misses': 0,  # Упреждения не было или оно не подошло
+            'cancelled': 0
+        }
+        self._wasted_sec = 0.0
+
+    def _count(self, key: str):
+        with self._lock:
+            self._counters[key] += 1
+
+    def start(self, position: str, level: str, language: str,
+              task_number: int, total_tasks: int, exclude_ids=()) -> Prefetch:
+        spec = (position, level, language, task_number, total_tasks)
+        return self.start_many([spec], concurrency=1, exclude_ids=exclude_ids)[0]
+
+    def start_many(self, specs: List[Tuple], concurrency: int, exclude_ids=()) -> List[Prefetch]:
+        """Генерация нескольких задач, не больше concurrency одновременно.
+
+        specs - аргументы generate_task (должность, уровень, язык, номер, всего).
+        Генерации запускаются по порядку: следующая стартует, когда
+        завершается одна из идущих, поэтому потоки не простаивают в ожидании.
+        """
+        prefetches = [Prefetch(spec, self.pool.bucket_key(*spec), exclude_ids) for spec in specs]
+        waiting = deque(prefetches)
+        waiting_lock = threading.Lock()
+
+        def launch_next(_=None):
+            with waiting_lock:
+                if not waiting:
+                    return
+                prefetch = waiting.popleft()
+            prefetch.future.add_done_callback(launch_next)
+            self._executor.submit(self._generate, prefetch)
+
+        with self._lock:
+            self._counters['started'] += len(prefetches)
+        for _ in range(min(max(1, concurrency), len(prefetches))):
+            launch_next()
+        return prefetches
+
+    def _generate(self, prefetch: Prefetch):
+        # Отмененная до старта генерация не запускается
+        if not prefetch.future.set_running_or_notify_cancel():
+            return
+        started = time.monotonic()
+        try:
+            task = self.pool.get_task(*prefetch.spec, exclude_ids=prefetch.exclude_ids)
+        except Exception as e:
+            prefetch.elapsed = time.monotonic() - started
+            prefetch.future.set_exception(e)
+            return
+        prefetch.elapsed = time.monotonic() - started
+        prefetch.future.set_result(task)
+
+    def take(self, prefetch: Optional[Prefetch], position: str, level: str, language: str,
+             task_number: int, total_tasks: int) -> Optional[CodingTask]:
+        """Задача из упреждения, если оно было для той же корзины"""
+        key = self.pool.bucket_key(position, level, language, task_number, total_tasks)
+        if prefetch is None or prefetch.cancelled or prefetch.key != key:
+            if prefetch is not None:
+                self.cancel(prefetch)
+            self._count('misses')
+            return None
+
+        self._count('hits' if prefetch.future.done() else 'waited')
+        try:
+            return prefetch.future.result()
+        except Exception as e:
+            print(f"❌ Ошибка упреждающей генерации задачи: {e}")
+            return None
+
+    def cancel(self, prefetch: Optional[Prefetch]):
+        """Отмена упреждения: сессия завершена или задача не понадобилась"""
+        if prefetch is None or prefetch.cancelled:
+            return
+        prefetch.cancelled = True
+        self._count('cancelled')
+        if not prefetch.future.cancel():
+            # Генерация уже идет или закончилась - ее время потрачено зря
+            prefetch.future.add_done_callback(lambda _: self._waste(prefetch))
+
+    def _waste(self, prefetch: Prefetch):
+        with self._lock:
+            self._wasted_sec += prefetch.elapsed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            used = self._counters['hits'] + self._counters['waited']
+            lookups = used + self._counters['misses']
+            return {
+                **self._counters,
+                'hit_rate': round(used / lookups, 3) if lookups else 0.0,
+                'wasted_sec': round(self._wasted_sec, 3)
+            }
@@ -0,0 +1,98 @@
+# task_validator.py - Проверка сгенерированных задач эталонным решением в песочнице
+
+import threading
+from typing import Dict, Tuple
+
+from coding_tasks import CodingTask
+
+# Заготовки из промпта генератора: такие тесты LLM не заполнила
+PLACEHOLDER_VALUES = {'test1', 'test2', 'test3', 'result1', 'result2', 'result3'}
+
+class TaskValidator:
+    """Допуск сгенерированных задач к выдаче.
+
+    Эталонное решение задачи запускается через CodeRunner на всех тестах
+    (включая скрытые); задача допускается, только если оно проходит все.
+    Проверка идет в потоке, который сгенерировал задачу (пул задач,
+    упреждение), и задача публикуется только после нее. Параллельность
+    проверок ограничивает раннер: в приложении у него свой SandboxPool,
+    чтобы эталонные решения не занимали песочницы проверки решений.
+
+    Задачи на языках, которые CodeRunner не выполняет, проверить нельзя -
+    они допускаются со статусом 'unverified'.
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+        self._lock = threading.Lock()
+        self._by_position = {}  # должность -> счетчики passed/rejected/unverified
+        self._reject_reasons = {}
+
+    def validate(self, task: CodingTask, position: str) -> Tuple[bool, str]:
+        """Проверка задачи; возвращает (допущена, причина отказа)"""
+        status, reason, detail = self._check(task)
+        self._record(position, status, reason)
+        if detail:
+            reason = f"{reason}: {detail}"
+
+        if status == 'rejected':
+            print(f"🚫 Задача отклонена ({position}): {task.title} - {reason}")
+        else:
+            print(f"✅ Задача допущена ({status}): {task.title}")
+        return status != 'rejected', reason
+
+    def _check(self, task: CodingTask) -> Tuple[str, str, str]:
+        """(статус, причина отказа, подробности)"""
+        if not task.test_cases:
+            return 'rejected', "Нет тестов", ''
+        for test_case in task.test_cases:
+            if self._is_placeholder(test_case.input_data) or self._is_placeholder(test_case.expected_output):
+                return 'rejected', "Тесты не заполнены", test_case.description
+
+        if task.language.lower() != 'python':
+            return 'unverified', '', ''
+        if not task.reference_solution.strip():
+            return 'rejected', "Нет эталонного решения", ''
+
+        result = self.runner.run_python_code(
+            task.reference_solution,
+            task.get_all_tests(),
+            task.time_limit,
+            task.memory_limit
+        )
+        if result.error:
+            return 'rejected', "Эталонное решение не запускается", result.error
+        if not result.success:
+            failed = next(tr for tr in result.test_results if not tr['passed'])
+            return 'rejected', "Эталонное решение не проходит тесты", (
+                f"{failed.get('description')}, пройдено {result.passed_tests}/{result.total_tests}"
+            )
+        return 'passed', '', ''
+
+    def _is_placeholder(self, value) -> bool:
+        if isinstance(value, str):
+            return value in PLACEHOLDER_VALUES
+        if isinstance(value, list) and len(value) == 1:
+            return self._is_placeholder(value[0])
+        return False
+
+    def _record(self, position: str, status: str, reason: str):
+        with self._lock:
+            counters = self._by_position.setdefault(
+                position, {'passed': 0, 'rejected': 0, 'unverified': 0}
+            )
+            counters[status] += 1
+            if status == 'rejected':
+                self._reject_reasons[reason] = self._reject_reasons.get(reason, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_position = {position: dict(counters) for position, counters in self._by_position.items()}
+            reasons = dict(self._reject_reasons)
+        checked = sum(c['passed'] + c['rejected'] for c in by_position.values())
+        rejected = sum(c['rejected'] for c in by_position.values())
+        return {
+            'by_position': by_position,
+            'reject_reasons': reasons,
+            'reject_rate': round(rejected / checked, 3) if checked else 0.0
+        }
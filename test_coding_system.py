@@ -2,8 +2,21 @@
 
 import sys
 import json
+import time
 from coding_tasks import CodingTaskGenerator, CodingTask, TestCase
-from code_runner import CodeRunner, CodeAnalyzer
+from code_runner import CodeRunner, CodeAnalyzer, ResultCache
+import sandbox_pool
+from complexity_estimator import ComplexityEstimator
+from task_pool import TaskPool, TaskPrefetcher
+from task_bank import TaskBank
+from task_validator import TaskValidator
+from llm_gateway import LLMGateway, LLMBusyError, LLMUnavailableError
+from circuit_breaker import CircuitBreaker
+import mock_llm_server
+from llm_cache import LLMCache, normalize_text
+from content_store import ContentStore
+from session_store import MemorySessionStore, SQLiteSessionStore, SessionArchive, SessionRetention, SessionBusyError
+from session_journal import SessionJournal, HAS_FCNTL
 
 def test_code_runner():
     """Тестирование запуска кода"""
@@ -31,6 +44,8 @@ def sum_numbers(numbers):
     
     print(f"✅ Результат: {result.passed_tests}/{result.total_tests} тестов пройдено")
     print(f"⏱️  Время: {result.execution_time}с")
+    assert all('execution_time' in tr and 'cpu_time' in tr and 'memory_used' in tr
+               for tr in result.test_results)
     
     for test_result in result.test_results:
         status = "✅" if test_result['passed'] else "❌"
@@ -50,6 +65,24 @@ def evil_function():
     is_valid, message = runner.validate_code(dangerous_code, 'python')
     print(f"Опасный код {'❌ заблокирован' if not is_valid else '⚠️ пропущен'}")
     print(f"Сообщение: {message}")
+    assert not is_valid
+    
+    # Проверка идет по AST: слова в строках и комментариях не мешают
+    harmless_code = '''
+def describe_file(name):
+    # open the file? no - only format the name
+    return "file: " + name + " (os independent)"
+'''
+    is_valid, message = runner.validate_code(harmless_code, 'python')
+    print(f"Безопасный код со словами 'file'/'os' в строках {'✅ принят' if is_valid else '❌ отклонен'}")
+    assert is_valid
+    
+    for escape in ["def f(x):\n    return x.__class__\n",
+                   "def f(x):\n    return globals()\n",
+                   "from subprocess import run\ndef f(x):\n    return x\n"]:
+        is_valid, message = runner.validate_code(escape, 'python')
+        print(f"  {message}")
+        assert not is_valid
     
     # Тест 3: Сложная задача
     print("\n📊 Тест 3: Сложная задача - поиск дубликатов")
@@ -73,6 +106,1150 @@ def find_duplicates(arr):
     
     result = runner.run_python_code(code_duplicates, test_cases_duplicates, 5, 128)
     print(f"✅ Результат: {result.passed_tests}/{result.total_tests} тестов пройдено")
+    
+    # Тест 4: Замер памяти и процессорного времени
+    print("\n📏 Тест 4: Замер ресурсов по каждому тесту")
+    
+    heavy_code = """
+def build(n):
+    data = list(range(n))
+    return len(data)
+"""
+    heavy_tests = [
+        {'input': 10, 'expected': 10, 'description': 'Маленький список'},
+        {'input': 2000000, 'expected': 2000000, 'description': 'Большой список'},
+    ]
+    
+    result = runner.run_python_code(heavy_code, heavy_tests, 5, 256)
+    small, big = result.test_results
+    print(f"  Маленький: {small['execution_time']}с, {small['memory_used']} КБ")
+    print(f"  Большой: {big['execution_time']}с, CPU {big['cpu_time']}с, {big['memory_used']} КБ")
+    print(f"  Итого: {result.to_dict()['execution_time']}с, пик {result.memory_used} КБ")
+    assert big['cpu_time'] > 0
+    assert result.memory_used == max(small['memory_used'], big['memory_used'])
+    
+    # Тест 5: Изоляция тестов при однократной компиляции
+    print("\n🧊 Тест 5: Состояние решения сбрасывается между тестами")
+    
+    stateful_code = """
+calls = []
+
+def count_calls(x, seen=[]):
+    calls.append(x)
+    seen.append(x)
+    return len(calls) + len(seen)
+"""
+    
+    stateful_tests = [
+        {'input': 1, 'expected': 2, 'description': 'Первый вызов'},
+        {'input': 2, 'expected': 2, 'description': 'Второй вызов видит чистое состояние'},
+        {'input': 3, 'expected': 2, 'description': 'Третий вызов видит чистое состояние'},
+    ]
+    
+    result = runner.run_python_code(stateful_code, stateful_tests, 5, 128)
+    print(f"✅ Результат: {result.passed_tests}/{result.total_tests} тестов пройдено")
+    assert result.success
+
+def test_result_cache():
+    """Тестирование кэша результатов проверки"""
+    print("\n" + "=" * 60)
+    print("🗃️ Тестирование ResultCache")
+    print("=" * 60)
+    
+    cache = ResultCache(max_entries=2)
+    runner = CodeRunner(result_cache=cache)
+    
+    code = "def double(x):\n    return x * 2\n"
+    test_cases = [{'input': 2, 'expected': 4, 'description': 'Удвоение'}]
+    
+    first = runner.run_python_code(code, test_cases, 5, 128)
+    # Тот же код с другими переводами строк - попадание в кэш
+    second = runner.run_python_code(code.replace('\n', '\r\n') + '\r\n', test_cases, 5, 128)
+    assert first.to_dict() == second.to_dict()
+    assert cache.hits == 1 and cache.misses == 1
+    
+    # Другие лимиты - другой ключ
+    runner.run_python_code(code, test_cases, 5, 64)
+    runner.run_python_code("def triple(x):\n    return x * 3\n", test_cases, 5, 128)
+    print(f"  Статистика кэша: {cache.stats()}")
+    assert cache.stats()['entries'] == 2
+    assert cache.misses == 3
+    # Доля, как у остальных кэшей в /api/metrics
+    assert cache.stats()['hit_rate'] == 0.25
+
+def test_sandbox_pool():
+    """Тестирование пула процессов-песочниц"""
+    print("\n" + "=" * 60)
+    print("🧱 Тестирование SandboxPool")
+    print("=" * 60)
+    
+    if not sandbox_pool.is_supported():
+        print("⚠️ fork недоступен, пропускаем")
+        return
+    
+    pool = sandbox_pool.SandboxPool(size=1, max_jobs_per_worker=2)
+    runner = CodeRunner(sandbox_pool=pool)
+    
+    try:
+        code = """
+def sum_numbers(numbers):
+    return sum(numbers)
+"""
+        test_cases = [
+            {'input': [[1, 2, 3]], 'expected': 6, 'description': 'Простой случай'},
+            {'input': [[]], 'expected': 0, 'description': 'Пустой список'},
+        ]
+        
+        print("\n📝 Решение выполняется в отдельном процессе")
+        result = runner.run_python_code(code, test_cases, 2, 64)
+        print(f"✅ Результат: {result.passed_tests}/{result.total_tests} тестов пройдено")
+        assert result.success
+        
+        print("\n♾️ Бесконечный цикл стоит только одного процесса")
+        endless = """
+def endless(n):
+    while True:
+        n += 1
+"""
+        result = runner.run_python_code(endless, [{'input': 1, 'expected': 0, 'description': 'Зависание'}], 1, 64)
+        print(f"  Ошибка: {result.test_results[0].get('error')}")
+        assert not result.success
+        
+        result = runner.run_python_code(code, test_cases, 2, 64)
+        assert result.success
+        result = runner.run_python_code(code, test_cases, 2, 64)
+        assert result.success
+        print(f"  Статистика пула: {pool.stats}")
+        assert pool.stats['recycled'] >= 1
+        
+        print("\n🧯 Ошибка в колбэке прогресса не уносит процесс из пула")
+        def broken_callback(index, test_result):
+            raise RuntimeError("клиент SSE отключился")
+        try:
+            runner.run_python_code(code, test_cases, 2, 64, on_result=broken_callback)
+        except RuntimeError:
+            pass
+        # Процесс прерванного задания заменяется в фоне
+        deadline = time.time() + 5
+        while pool._idle.qsize() < pool.size and time.time() < deadline:
+            time.sleep(0.05)
+        assert pool._idle.qsize() == pool.size
+        assert runner.run_python_code(code, test_cases, 2, 64).success
+    finally:
+        pool.shutdown()
+    
+    print("\n🔀 Тесты одного решения выполняются параллельно")
+    pool = sandbox_pool.SandboxPool(size=3, max_jobs_per_worker=50, max_shards_per_job=3)
+    runner = CodeRunner(sandbox_pool=pool)
+    
+    try:
+        slow_code = """
+def slow_echo(n):
+    total = 0
+    while total < 3000000:
+        total += 1
+    return n
+"""
+        slow_tests = [{'input': i, 'expected': i, 'description': f'Тест {i}'} for i in range(6)]
+        slow_tests[4]['expected'] = -1
+        
+        progress = []
+        result = runner.run_python_code(slow_code, slow_tests, 5, 64,
+                                        on_result=lambda index, tr: progress.append(index))
+        print(f"✅ Результат: {result.passed_tests}/{result.total_tests} тестов пройдено")
+        print(f"  Порядок готовности тестов: {progress}")
+        assert sorted(progress) == list(range(len(slow_tests)))
+        print(f"  Статистика пула: {pool.stats}")
+        assert [tr['description'] for tr in result.test_results] == [tc['description'] for tc in slow_tests]
+        assert [tr['passed'] for tr in result.test_results] == [True, True, True, True, False, True]
+        assert pool.stats['shards'] == 3
+    finally:
+        pool.shutdown()
+
+def test_complexity_estimator():
+    """Тестирование оценки асимптотической сложности"""
+    print("\n" + "=" * 60)
+    print("📐 Тестирование ComplexityEstimator")
+    print("=" * 60)
+    
+    runner = CodeRunner()
+    estimator = ComplexityEstimator(runner, time_budget=3.0)
+    analyzer = CodeAnalyzer()
+    test_cases = [{'input': [[1, 2, 3, 2]], 'expected': [2], 'description': 'Один дубликат'}]
+    
+    linear = """
+def find_duplicates(arr):
+    seen, result = set(), []
+    for x in arr:
+        if x in seen:
+            result.append(x)
+        seen.add(x)
+    return result
+"""
+    quadratic = """
+def find_duplicates(arr):
+    result = []
+    for i in range(len(arr)):
+        for j in range(i):
+            if arr[i] == arr[j]:
+                result.append(arr[i])
+                break
+    return result
+"""
+    
+    estimate = estimator.estimate(runner.parse(linear), test_cases)
+    print(f"  Линейное решение: {estimate['estimated']} {list(zip(estimate['sizes'], estimate['times']))}")
+    assert estimate['estimated'] in ('O(n)', 'O(n log n)')
+    assert estimate['elapsed_sec'] <= estimator.time_budget + 1
+    
+    estimate = estimator.estimate(runner.parse(quadratic), test_cases)
+    print(f"  Квадратичное решение: {estimate['estimated']} {list(zip(estimate['sizes'], estimate['times']))}")
+    assert estimate['estimated'] == 'O(n²)' or estimate['timed_out_at']
+    
+    analysis = analyzer.analyze_code(quadratic, 'python')
+    score = analysis['quality_score']
+    analyzer.apply_complexity_estimate(analysis, estimate)
+    print(f"  Качество с учетом сложности: {score} -> {analysis['quality_score']}")
+    assert analysis['quality_score'] < score
+    
+    # Зависающее решение: бюджет делится между повторами, а не выдается каждому
+    endless = """
+def find_duplicates(arr):
+    while True:
+        pass
+"""
+    pool = sandbox_pool.SandboxPool(size=1) if sandbox_pool.is_supported() else None
+    try:
+        for label, slow_runner in (('в процессе', runner), ('в песочнице', CodeRunner(sandbox_pool=pool))):
+            if label == 'в песочнице' and pool is None:
+                continue
+            budget_estimator = ComplexityEstimator(slow_runner, time_budget=1.0)
+            started = time.time()
+            estimate = budget_estimator.estimate(slow_runner.parse(endless), test_cases)
+            elapsed = time.time() - started
+            print(f"  Зависающее решение {label}: {elapsed:.2f}с при бюджете 1.0с, timed_out_at={estimate['timed_out_at']}")
+            assert estimate['timed_out_at'] == 100 and estimate['estimated'] is None
+            assert elapsed < 1.5
+    finally:
+        if pool:
+            pool.shutdown()
+
+def test_task_pool():
+    """Тестирование пула заранее сгенерированных задач (без LLM)"""
+    print("\n" + "=" * 60)
+    print("🗂️ Тестирование TaskPool")
+    print("=" * 60)
+    
+    class SlowGenerator(CodingTaskGenerator):
+        """Генератор, имитирующий медленный ответ LLM"""
+        def __init__(self):
+            super().__init__(llm=None)
+            self.calls = 0
+        
+        def generate_task(self, position, level, language="python", task_number=1, total_tasks=10,
+                          exclude_ids=()):
+            self.calls += 1
+            time.sleep(0.2)
+            task = self._get_fallback_task(position, level, language)
+            task.task_id = f"task_{position}_{level}_{task_number}_{self.calls}"
+            return task
+    
+    generator = SlowGenerator()
+    pool = TaskPool(generator, target_depth=2, workers=2)
+    
+    # Пустая корзина - генерация на месте
+    task = pool.get_task('Backend разработчик', 'Middle', 'python', task_number=1, total_tasks=10)
+    assert task.task_id.startswith('task_')
+    assert pool.stats()['misses'] == 1
+    
+    pool.warm('Backend разработчик', 'Middle', 'python', total_tasks=3)
+    deadline = time.time() + 5
+    while pool.stats()['in_flight'] and time.time() < deadline:
+        time.sleep(0.05)
+    print(f"  Статистика пула: {pool.stats()}")
+    
+    started = time.perf_counter()
+    task = pool.get_task('Backend разработчик', 'Middle', 'python', task_number=2, total_tasks=3)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"  Задача из пула за {elapsed_ms:.2f} мс")
+    assert pool.stats()['hits'] == 1
+    assert elapsed_ms < 50
+    
+    # Тот же ключ (сложность и тема) - та же корзина
+    assert pool.bucket_key('QA Engineer', 'Junior', 'javascript', 1, 10) == \
+        pool.bucket_key('QA Engineer', 'Junior', 'python', 1, 10)
+    
+    print("\n🔮 Упреждающая генерация следующей задачи")
+    prefetcher = TaskPrefetcher(TaskPool(SlowGenerator(), target_depth=0), workers=4)
+    
+    prefetch = prefetcher.start('Data Scientist', 'Senior', 'python', 4, 10)
+    time.sleep(0.4)
+    task = prefetcher.take(prefetch, 'Data Scientist', 'Senior', 'python', 4, 10)
+    assert task is not None and prefetcher.stats()['hits'] == 1
+    
+    # Другая задача (другая тема) - упреждение не подходит и отменяется
+    prefetch = prefetcher.start('Data Scientist', 'Senior', 'python', 5, 10)
+    assert prefetcher.take(prefetch, 'Data Scientist', 'Senior', 'python', 6, 10) is None
+    
+    # Сессия завершилась во время генерации - время учитывается как потраченное зря
+    prefetch = prefetcher.start('Data Scientist', 'Senior', 'python', 7, 10)
+    time.sleep(0.05)
+    prefetcher.cancel(prefetch)
+    prefetch.future.result()
+    time.sleep(0.05)  # Колбэк future выполняется после пробуждения ожидающих
+    stats = prefetcher.stats()
+    print(f"  Статистика упреждения: {stats}")
+    assert stats['misses'] == 1 and stats['cancelled'] == 2
+    assert stats['wasted_sec'] > 0
+    
+    print("\n🌐 Параллельная генерация всех задач собеседования")
+    specs = [('Data Scientist', 'Senior', 'python', n, 10) for n in range(1, 7)]
+    started = time.perf_counter()
+    prefetches = prefetcher.start_many(specs, concurrency=3)
+    first = prefetches[0].future.result()
+    first_ready = time.perf_counter() - started
+    tasks = [prefetch.future.result() for prefetch in prefetches]
+    elapsed = time.perf_counter() - started
+    print(f"  Первая задача через {first_ready:.2f}с, все {len(tasks)} через {elapsed:.2f}с")
+    # 6 задач по 0.2с при 3 одновременных генерациях - две волны
+    assert first is not None and first_ready < 0.35
+    assert 0.35 < elapsed < 0.55
+
+def test_task_bank():
+    """Тестирование постоянного банка задач (LLM заменена заглушкой)"""
+    print("\n" + "=" * 60)
+    print("🏦 Тестирование TaskBank")
+    print("=" * 60)
+    
+    import tempfile
+    from types import SimpleNamespace
+    
+    calls = []
+    
+    def chat(purpose, messages, **params):
+        calls.append(purpose)
+        content = json.dumps({
+            'title': f"Задача {len(calls)}",
+            'description': "Верните сумму списка",
+            'test_cases': [
+                {'input': [[1, 2]], 'expected': 3, 'description': 'Видимый', 'is_hidden': False},
+                {'input': [[5]], 'expected': 5, 'description': 'Скрытый', 'is_hidden': True}
+            ],
+            'tags': ['массивы']
+        }, ensure_ascii=False)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+    
+    llm = SimpleNamespace(chat=chat)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = f"{tmp}/bank.db"
+        generator = CodingTaskGenerator(llm, task_bank=TaskBank(path), bank_min_variety=2)
+        args = ('Backend разработчик', 'Middle', 'python', 3, 10)
+        
+        # Пока в корзине мало задач, банк пополняется через LLM
+        first = generator.generate_task(*args)
+        second = generator.generate_task(*args)
+        assert len(calls) == 2 and first.task_id != second.task_id
+        
+        # Дальше задачи берутся из банка, виденные сессией исключаются
+        third = generator.generate_task(*args, exclude_ids=[first.task_id])
+        assert len(calls) == 2 and third.task_id == second.task_id
+        generator.generate_task(*args, exclude_ids=[first.task_id, second.task_id])
+        assert len(calls) == 3
+        
+        # Банк переживает перезапуск вместе со скрытыми тестами
+        bank = TaskBank(path)
+        assert bank.size() == 3
+        task = bank.pick('Backend разработчик', 'Middle', 'python', first.difficulty,
+                         generator.get_topic_for_task('Backend разработчик', 3), tags=['массивы'])
+        assert sum(tc.is_hidden for tc in task.test_cases) == 1
+        
+        started = time.perf_counter()
+        for _ in range(100):
+            bank.pick('Backend разработчик', 'Middle', 'python', first.difficulty)
+        print(f"  Выбор из банка: {(time.perf_counter() - started) * 10:.3f} мс")
+        print(f"  Статистика банка: {bank.stats()}")
+        
+        # Корзина покрыта банком; разовую работу захватывает только первый
+        assert generator.bank_covers('Backend разработчик', 'Middle', 'python', 3, 10)
+        assert not generator.bank_covers('Backend разработчик', 'Senior', 'python', 3, 10)
+        assert bank.claim('prewarm', 60) and not TaskBank(path).claim('prewarm', 60)
+        assert bank.claim('expired', -1) and bank.claim('expired', 60)
+        
+        # Подсчет корзины ограничен; при обновлении задача генерируется и в заполненной корзине
+        assert bank.count('Backend разработчик', 'Middle', 'python', first.difficulty, limit=2) == 2
+        generator.bank_refresh_probability = 1.0
+        generator.generate_task(*args)
+        assert len(calls) == 4
+
+def test_task_validator():
+    """Тестирование проверки сгенерированных задач эталонным решением"""
+    print("\n" + "=" * 60)
+    print("🧪 Тестирование TaskValidator")
+    print("=" * 60)
+    
+    validator = TaskValidator(CodeRunner())
+    
+    def make_task(tests, reference, language='python'):
+        return CodingTask(
+            task_id="generated", title="Сумма списка", description="Верните сумму списка",
+            difficulty="easy", language=language, test_cases=tests,
+            solution_template="def total(numbers):\n    pass", time_limit=2, memory_limit=64,
+            hints=[], tags=[], reference_solution=reference
+        )
+    
+    reference = "def total(numbers):\n    return sum(numbers)\n"
+    good = make_task([TestCase([[1, 2]], 3, "Видимый"), TestCase([[4]], 4, "Скрытый", True)], reference)
+    wrong = make_task([TestCase([[1, 2]], 3, "Видимый"), TestCase([[4]], 5, "Неверный ожидаемый", True)], reference)
+    placeholder = make_task([TestCase("test1", "result1", "тест 1")], reference)
+    
+    assert validator.validate(good, 'Backend разработчик')[0]
+    assert not validator.validate(wrong, 'Backend разработчик')[0]
+    assert not validator.validate(placeholder, 'Data Scientist')[0]
+    assert not validator.validate(make_task(good.test_cases, ''), 'Data Scientist')[0]
+    assert validator.validate(make_task(good.test_cases, '', 'javascript'), 'Frontend разработчик')[0]
+    
+    # Эталонное решение не уходит кандидату
+    assert 'reference_solution' not in good.to_dict()
+    
+    stats = validator.stats()
+    print(f"  Статистика проверки: {stats}")
+    assert stats['by_position']['Backend разработчик'] == {'passed': 1, 'rejected': 1, 'unverified': 0}
+    assert stats['by_position']['Data Scientist']['rejected'] == 2
+    assert stats['by_position']['Frontend разработчик']['unverified'] == 1
+
+def test_llm_gateway():
+    """Тестирование лимитов параллельности шлюза к LLM (без сети)"""
+    print("\n" + "=" * 60)
+    print("🚪 Тестирование LLMGateway")
+    print("=" * 60)
+    
+    import threading
+    from types import SimpleNamespace
+    
+    gateway = LLMGateway(
+        base_url="http://127.0.0.1:9/v1", api_key="test", model="test-model",
+        concurrency={'evaluation': 2, 'task_generation': 1},
+        timeouts={'evaluation': 5, 'task_generation': 5},
+        queue_timeout=0.3
+    )
+    
+    active, peak, requests = [0], [0], []
+    lock = threading.Lock()
+    
+    def create(**params):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            requests.append(params)
+        time.sleep(0.6 if 'max_tokens' in params else 0.15)
+        with lock:
+            active[0] -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+    
+    gateway.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    
+    threads = [
+        threading.Thread(target=gateway.chat, args=('evaluation', [{'role': 'user', 'content': f'x{i}'}]))
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    print(f"  Одновременных запросов на оценку: {peak[0]} (лимит 2)")
+    assert peak[0] == 2
+    # Таймаут запроса - остаток срока ответа на вызов
+    assert requests[0]['model'] == 'test-model' and 0 < requests[0]['timeout'] <= 5
+    
+    # Слот генерации занят (0.6с) дольше queue_timeout - второй запрос отклоняется
+    busy = threading.Thread(target=gateway.chat, args=('task_generation', []), kwargs={'max_tokens': 10})
+    busy.start()
+    time.sleep(0.02)
+    try:
+        gateway.chat('task_generation', [])
+        assert False, "Ожидалась LLMBusyError"
+    except LLMBusyError as e:
+        print(f"  ✅ {e}")
+    busy.join()
+    
+    # Одинаковые одновременные запросы объединяются в один вызов
+    requests.clear()
+    responses = []
+    threads = [
+        threading.Thread(target=lambda: responses.append(
+            gateway.chat('evaluation', [{'role': 'user', 'content': 'same'}])
+        ))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"  Запросов к LLM на 5 одинаковых вызовов: {len(requests)}")
+    assert len(requests) == 1 and len(responses) == 5
+    assert all(response is responses[0] for response in responses)
+    
+    stats = gateway.stats()['purposes']
+    print(f"  Статистика: {stats}")
+    assert stats['evaluation']['calls'] == 5 and stats['evaluation']['coalesced'] == 4
+    assert stats['task_generation']['rejected'] == 1
+    
+    # Асинхронный API делит слоты с синхронным; клиент - свой на каждый event loop
+    import asyncio
+    
+    async def acreate(**params):
+        await asyncio.sleep(0.05)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+    
+    clients = []
+    
+    def new_async_client():
+        clients.append(SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=acreate))))
+        return clients[-1]
+    
+    gateway._new_async_client = new_async_client
+    busy = threading.Thread(target=gateway.chat, args=('task_generation', []), kwargs={'max_tokens': 10})
+    busy.start()
+    time.sleep(0.02)
+    try:
+        asyncio.run(gateway.achat('task_generation', []))
+        assert False, "Ожидалась LLMBusyError: слот занят синхронным запросом"
+    except LLMBusyError:
+        pass
+    busy.join()
+    for _ in range(2):
+        assert asyncio.run(gateway.achat('task_generation', [])).choices[0].message.content == "ok"
+    assert len(clients) == 3 and len(gateway._loops) == 1
+    
+    # Асинхронный вызов стоит в общей очереди слотов: синхронные вызовы его не вытесняют
+    async def waiting_achat():
+        return await gateway.achat('task_generation', [{'role': 'user', 'content': 'wait'}])
+    
+    gateway.queue_timeout = 2.0
+    holders = [threading.Thread(target=gateway.chat, args=('task_generation', []), kwargs={'max_tokens': i})
+               for i in range(3)]
+    holders[0].start()
+    time.sleep(0.05)
+    async def mixed():
+        waiter = asyncio.ensure_future(waiting_achat())
+        await asyncio.sleep(0.05)
+        for holder in holders[1:]:
+            holder.start()
+        return await waiter
+    started = time.perf_counter()
+    assert asyncio.run(mixed()).choices[0].message.content == "ok"
+    waited = time.perf_counter() - started
+    for holder in holders:
+        holder.join()
+    print(f"  Асинхронный вызов за синхронными: {waited:.2f}с")
+    assert waited < 1.0  # Слот после первого держателя, раньше двух синхронных
+    
+    # Отмененное ожидание не уносит слот
+    async def cancelled_wait():
+        gateway._semaphores['task_generation'].acquire()
+        task = asyncio.ensure_future(gateway._aacquire('task_generation', 5))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.sleep(0.01)
+        gateway._semaphores['task_generation'].release()
+        await asyncio.sleep(0.1)
+    asyncio.run(cancelled_wait())
+    assert gateway._semaphores['task_generation'].acquire(timeout=1)
+    gateway._semaphores['task_generation'].release()
+
+def test_circuit_breaker():
+    """Тестирование размыкателя цепи, срока ответа и страхующих запросов"""
+    print("\n" + "=" * 60)
+    print("🔌 Тестирование CircuitBreaker")
+    print("=" * 60)
+    
+    from types import SimpleNamespace
+    
+    breaker = CircuitBreaker(latency_slo=0.05, window=10, min_calls=4, open_sec=0.2)
+    for _ in range(4):
+        assert breaker.allow()
+        breaker.record(0.1, True)  # Медленно, но без ошибок: p95 выше SLO
+    print(f"  После медленных вызовов: {breaker.stats()}")
+    assert breaker.state == 'open' and not breaker.allow()
+    
+    time.sleep(0.25)
+    assert breaker.allow() and not breaker.allow()  # Только один пробный вызов
+    breaker.record(0.01, True)
+    assert breaker.state == 'closed'
+    
+    # Шлюз: медленный первый запрос страхуется вторым
+    delays = [0.5, 0.01]
+    calls = []
+    
+    def create(**params):
+        delay = delays[min(len(calls), len(delays) - 1)]
+        calls.append(params)
+        time.sleep(delay)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"за {delay}с"))])
+    
+    gateway = LLMGateway(
+        base_url="http://127.0.0.1:9/v1", api_key="test", model="test-model",
+        concurrency={'question': 2, 'evaluation': 1, 'summary': 1},
+        timeouts={'question': 2, 'evaluation': 2, 'summary': 0.3},
+        breakers={'evaluation': CircuitBreaker(latency_slo=1.0, min_calls=2, open_sec=60)},
+        hedge_after={'question': 0.1}
+    )
+    gateway.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    
+    started = time.time()
+    response = gateway.chat('question', [{'role': 'user', 'content': 'q'}])
+    elapsed = time.time() - started
+    print(f"  Ответ '{response.choices[0].message.content}' за {elapsed:.2f}с, запросов: {len(calls)}")
+    assert len(calls) == 2 and elapsed < 0.4
+    
+    # Срок ответа: вызов не ждет дольше timeouts[назначение]
+    delays[:] = [1.0]
+    started = time.time()
+    try:
+        gateway.chat('summary', [{'role': 'user', 'content': 's'}])
+        assert False, "Ожидалась LLMUnavailableError"
+    except LLMUnavailableError as e:
+        print(f"  ✅ {e} ({time.time() - started:.2f}с)")
+    assert time.time() - started < 0.6
+    
+    # Ошибки размыкают цепь, дальше отказ без обращения к LLM
+    def failing(**params):
+        calls.append(params)
+        raise ConnectionError("upstream down")
+    
+    gateway.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=failing)))
+    for i in range(2):
+        try:
+            gateway.chat('evaluation', [{'role': 'user', 'content': f'e{i}'}])
+        except ConnectionError:
+            pass
+    calls.clear()
+    started = time.time()
+    try:
+        gateway.chat('evaluation', [{'role': 'user', 'content': 'fast'}])
+        assert False, "Ожидалась LLMUnavailableError"
+    except LLMUnavailableError as e:
+        print(f"  ✅ {e} ({(time.time() - started) * 1000:.1f}мс)")
+    assert not calls
+    
+    stats = gateway.stats()['purposes']
+    print(f"  Статистика: {stats['evaluation']}")
+    assert stats['question']['hedged'] == 1 and stats['question']['hedge_wins'] == 1
+    assert stats['evaluation']['short_circuited'] == 1 and stats['summary']['deadline_exceeded'] == 1
+    assert stats['evaluation']['circuit']['state'] == 'open'
+    
+    # Асинхронный вызов тоже страхуется; проигравший запрос отменяется
+    import asyncio
+    
+    delays[:] = [0.5, 0.01]
+    calls.clear()
+    cancelled = []
+    
+    async def acreate(**params):
+        delay = delays[min(len(calls), len(delays) - 1)]
+        calls.append(params)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"за {delay}с"))])
+    
+    async def hedged_call():
+        response = await gateway.achat('question', [{'role': 'user', 'content': 'async q'}])
+        await asyncio.sleep(0.01)  # Отмена проигравшего доходит до запроса
+        return response
+    
+    gateway._new_async_client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=acreate)))
+    started = time.time()
+    response = asyncio.run(hedged_call())
+    print(f"  Асинхронно: '{response.choices[0].message.content}' за {time.time() - started:.2f}с")
+    assert len(calls) == 2 and cancelled == [0.5] and time.time() - started < 0.4
+    assert gateway.stats()['purposes']['question']['hedge_wins'] == 2
+    
+    # Отмененный пробный вызов (клиент отключился) не оставляет цепь в half_open
+    async def hanging(**params):
+        await asyncio.sleep(10)
+    
+    async def consume(purpose):
+        async for _ in gateway.astream(purpose, [{'role': 'user', 'content': 'p'}]):
+            pass
+    
+    async def cancel_probe(purpose):
+        task = asyncio.ensure_future(consume(purpose))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    
+    gateway._new_async_client = lambda: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=hanging)))
+    probe_breaker = gateway.breakers['evaluation']
+    for hold_slot in (False, True):
+        probe_breaker._opened_at -= probe_breaker.open_sec  # Срок размыкания истек
+        if hold_slot:
+            gateway._semaphores['evaluation'].acquire()  # Проба отменяется, пока ждет слот
+        asyncio.run(cancel_probe('evaluation'))
+        if hold_slot:
+            gateway._semaphores['evaluation'].release()
+        assert probe_breaker.state != 'half_open' or probe_breaker.allow()
+        probe_breaker.record(5.0, False)
+        assert probe_breaker.state == 'open'
+
+def test_llm_cache():
+    """Тестирование TTL + LRU кэша ответов LLM"""
+    print("\n" + "=" * 60)
+    print("💾 Тестирование LLMCache")
+    print("=" * 60)
+    
+    # Текстовые ответы: регистр и пробелы не важны, хвост за пределом промпта отбрасывается
+    first = normalize_text("  Список   ИЗМЕНЯЕМЫЙ,\nкортеж - нет ", 300)
+    second = normalize_text("список изменяемый, кортеж - нет" + " " * 300 + "лишнее", 300)
+    print(f"  Нормализованный ответ: '{first}'")
+    assert first == second
+    # В коде регистр значим
+    assert normalize_text("def F(): pass", 500, fold_case=False) != normalize_text("def f(): pass", 500, fold_case=False)
+    
+    cache = LLMCache(max_bytes=200, ttl=0.2)
+    key = LLMCache.make_key('evaluation', 'text', first)
+    cache.put(key, {'score': 7, 'strengths': ['точно']})
+    evaluation = cache.get(key)
+    evaluation['score'] = 0  # Копия: кэш не портится
+    assert cache.get(key)['score'] == 7
+    assert cache.get(LLMCache.make_key('evaluation', 'text', 'другой ответ')) is None
+    
+    # Граница по байтам: старые записи вытесняются по LRU
+    for i in range(5):
+        cache.put(f"k{i}", "x" * 40)
+    stats = cache.stats()
+    print(f"  После переполнения: {stats}")
+    assert stats['bytes'] <= 200 and stats['evictions'] > 0
+    assert cache.get(key) is None and cache.get("k4") == "x" * 40
+    
+    # Атомарное пополнение корзины вопросов
+    cache.update("bucket", lambda bucket: bucket + ["Что такое GIL?"], default=[])
+    assert cache.get("bucket") == ["Что такое GIL?"]
+    
+    time.sleep(0.25)
+    assert cache.get("k4") is None
+    stats = cache.stats()
+    print(f"  После TTL: {stats}")
+    assert stats['expired'] >= 1 and 0 < stats['hit_rate'] < 1
+
+def test_content_store():
+    """Тестирование хранилища данных по хешу содержимого"""
+    print("\n" + "=" * 60)
+    print("📦 Тестирование ContentStore")
+    print("=" * 60)
+    
+    store = ContentStore()
+    code = "def solve(numbers):\n    return sum(numbers)\n" * 20
+    tests = [{'description': f'Тест {i}', 'passed': True, 'input': str([i] * 50), 'actual': str(i)} for i in range(20)]
+    
+    refs = [store.put(code), store.put(tests), store.put(code)]
+    assert refs[0] == refs[2] and len(store) == 2
+    assert store.get(refs[0]) == code and store.get(refs[1]) == tests
+    raw = len(code.encode('utf-8')) + len(json.dumps(tests, ensure_ascii=False).encode('utf-8'))
+    print(f"  Исходно: {raw} байт, сжато: {store.nbytes()} байт")
+    assert store.nbytes() < raw / 3
+    
+    restored = ContentStore.from_state(json.loads(json.dumps(store.to_state())))
+    assert restored.get(refs[1]) == tests and refs[0] in restored
+
+def test_session_store():
+    """Тестирование хранилища сессий: атомарное чтение-изменение-запись между воркерами"""
+    print("\n" + "=" * 60)
+    print("🗄️ Тестирование session_store")
+    print("=" * 60)
+    
+    import os
+    import tempfile
+    import threading
+    
+    class Session:
+        def __init__(self, session_id, answers=None):
+            self.session_id = session_id
+            self.answers = answers or []
+        
+        def to_state(self):
+            return {'session_id': self.session_id, 'answers': self.answers}
+        
+        @classmethod
+        def from_state(cls, state):
+            return cls(state['session_id'], state['answers'])
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sessions.db')
+        # Два хранилища над одной базой - как два воркера gunicorn
+        stores = [SQLiteSessionStore(path, load=Session.from_state, lock_timeout=10) for _ in range(2)]
+        stores[0].add(Session('s1'))
+        assert stores[1].get('s1').answers == [] and stores[1].get('missing') is None
+        with stores[1].session('missing') as missing:
+            assert missing is None
+        
+        def answer(store, n):
+            for i in range(n):
+                with store.session('s1') as session:
+                    answers = list(session.answers)
+                    time.sleep(0.001)  # Окно для гонки, если бы блокировки не было
+                    session.answers = answers + [i]
+        
+        threads = [threading.Thread(target=answer, args=(stores[k % 2], 10)) for k in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        answers = stores[0].get('s1').answers
+        print(f"  Ответов после 4 потоков x 10: {len(answers)}, ожиданий аренды: "
+              f"{stores[0].stats()['lease_waits'] + stores[1].stats()['lease_waits']}")
+        assert len(answers) == 40
+        
+        # Ошибка внутри блока не сохраняет изменения и освобождает аренду
+        try:
+            with stores[0].session('s1') as session:
+                session.answers = []
+                raise ValueError
+        except ValueError:
+            pass
+        assert len(stores[1].get('s1').answers) == 40
+        
+        # Занятая сессия: второй воркер ждет не дольше lock_timeout
+        impatient = SQLiteSessionStore(path, load=Session.from_state, lock_timeout=0.1)
+        with stores[0].session('s1'):
+            try:
+                with impatient.session('s1'):
+                    assert False, "Аренда выдана дважды"
+            except SessionBusyError:
+                print("  ✅ Занятая сессия: SessionBusyError")
+        
+        # Долгий блок продлевает аренду: после lease_sec сессию не перехватывают
+        short = SQLiteSessionStore(path, load=Session.from_state, lease_sec=0.3, lock_timeout=0.1)
+        with short.session('s1'):
+            time.sleep(0.6)
+            try:
+                with impatient.session('s1'):
+                    assert False, "Продленная аренда перехвачена"
+            except SessionBusyError:
+                pass
+        
+        # Аренду перехватили - изменения не записываются молча
+        try:
+            with short.session('s1') as session:
+                session.answers = []
+                stores[1]._conn().execute("UPDATE sessions SET lease_owner = 'other' WHERE session_id = 's1'")
+            assert False, "Изменения записаны без аренды"
+        except SessionBusyError:
+            assert short.stats()['lease_conflicts'] == 1
+        stores[1]._conn().execute("UPDATE sessions SET lease_owner = NULL, lease_until = 0")
+        assert len(stores[1].get('s1').answers) == 40
+    
+    memory = MemorySessionStore()
+    memory.add(Session('m1'))
+    with memory.session('m1') as session:
+        session.answers.append(1)
+    assert memory.get('m1').answers == [1] and memory.stats()['sessions'] == 1
+    
+    # С load чтение - копия последнего сохраненного состояния
+    memory = MemorySessionStore(load=Session.from_state)
+    memory.add(Session('m1'))
+    with memory.session('m1') as session:
+        session.answers.append(1)
+        assert memory.get('m1').answers == []
+    assert memory.get('m1').answers == [1] and memory.get('m1') is not memory.get('m1')
+
+def test_session_retention():
+    """Тестирование вытеснения сессий по срокам и лимиту памяти с архивацией"""
+    print("\n" + "=" * 60)
+    print("🧹 Тестирование вытеснения сессий")
+    print("=" * 60)
+    
+    import os
+    import tempfile
+    
+    class Session:
+        def __init__(self, session_id, is_active=True, payload=''):
+            self.session_id = session_id
+            self.is_active = is_active
+            self.payload = payload
+        
+        def to_state(self):
+            return {'session_id': self.session_id, 'is_active': self.is_active, 'payload': self.payload}
+        
+        @classmethod
+        def from_state(cls, state):
+            return cls(state['session_id'], state['is_active'], state['payload'])
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ('memory', 'sqlite'):
+            evicted = []
+            retention = SessionRetention(
+                idle_ttl=100, finished_ttl=10, max_bytes=10_000, sweep_interval=3600,
+                archive=SessionArchive(os.path.join(tmp, f'archive_{backend}')), on_evict=evicted.append
+            )
+            if backend == 'memory':
+                store = MemorySessionStore(load=Session.from_state, retention=retention)
+            else:
+                store = SQLiteSessionStore(os.path.join(tmp, 'sessions.db'), load=Session.from_state,
+                                           retention=retention)
+            
+            store.add(Session('active'))
+            store.add(Session('done', is_active=False))
+            
+            # Сроки: через 50с истек только срок завершенной, через 200с - и незавершенной
+            assert store.sweep(now=time.time() + 50) == 1 and evicted == ['done']
+            assert store.sweep(now=time.time() + 200) == 1 and evicted == ['done', 'active']
+            assert len(store) == 0
+            
+            # Вытесненная сессия доступна из архива для просмотра, но не для изменения
+            assert store.get('done').is_active is False
+            with store.session('done') as session:
+                assert session is None
+            assert store.get('../etc/passwd') is None
+            
+            # Лимит памяти: вытесняются завершенные, начиная с давно не использованных
+            payload = 'x' * 3000 if backend == 'memory' else os.urandom(3000).hex()
+            store.add(Session('big_active', payload=payload))
+            for i in range(2):
+                store.add(Session(f'old{i}', is_active=False, payload=payload))
+            store.get('old0')
+            store.add(Session('old2', is_active=False, payload=payload))
+            if backend == 'sqlite':
+                store.sweep()
+            stats = store.stats()
+            print(f"  {backend}: живых {stats['sessions']} ({stats['bytes']} байт), "
+                  f"в архиве {stats['archived']}, вытеснено {stats['evicted']}")
+            assert stats['bytes'] <= 10_000 and store.get('big_active').is_active
+            assert stats['evicted']['memory'] >= 1 and stats['archived'] >= 3
+            if backend == 'memory':
+                assert 'old1' in evicted and 'old0' not in evicted  # old0 недавно читали
+
+def test_session_journal():
+    """Тестирование журнала сессий: восстановление после падения и снимки"""
+    print("\n" + "=" * 60)
+    print("📼 Тестирование SessionJournal")
+    print("=" * 60)
+    
+    if not HAS_FCNTL:
+        print("⚠️ fcntl недоступен, пропускаем")
+        return
+    
+    import os
+    import glob
+    import tempfile
+    
+    class Session:
+        def __init__(self, session_id, answers=None, is_active=True):
+            self.session_id = session_id
+            self.answers = answers or []
+            self.is_active = is_active
+        
+        def to_state(self):
+            return {'session_id': self.session_id, 'answers': self.answers, 'is_active': self.is_active}
+        
+        @classmethod
+        def from_state(cls, state):
+            return cls(state['session_id'], state['answers'], state['is_active'])
+    
+    def open_store(directory, segment_bytes=16 * 1024 * 1024):
+        journal = SessionJournal(directory, fsync_interval=0.01, segment_bytes=segment_bytes)
+        store = MemorySessionStore(load=Session.from_state, journal=journal)
+        store.recover()
+        return store, journal
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        store, journal = open_store(tmp)
+        for i in range(3):
+            store.add(Session(f's{i}'))
+        with store.session('s1', event='answer_recorded') as session:
+            session.answers.append('ответ')
+        store._evict('s2', 'idle')
+        time.sleep(0.05)
+        assert journal.stats()['fsyncs'] >= 1
+        journal.close()
+        
+        # Воркер убит посреди записи: в конце журнала оборванная запись
+        segment = sorted(glob.glob(os.path.join(tmp, 'journal-*.log')))[-1]
+        with open(segment, 'ab') as f:
+            f.write(b'\x40\x00\x00\x00garbage')
+        
+        store, journal = open_store(tmp)
+        assert sorted(store._sessions) == ['s0', 's1'] and store.get('s1').answers == ['ответ']
+        print(f"  ✅ После падения восстановлено сессий: {len(store)}")
+        
+        # Снимки: при ротации сегментов старые сегменты сжимаются в снимок
+        journal.segment_bytes = 2000
+        for i in range(200):
+            with store.session(f's{i % 2}', event='answer_recorded') as session:
+                session.answers.append(i)
+        deadline = time.time() + 5
+        while journal.stats()['snapshots'] == 0 and time.time() < deadline:
+            time.sleep(0.05)
+        journal.close()
+        segments = glob.glob(os.path.join(tmp, 'journal-*.log'))
+        print(f"  Снимков: {journal.stats()['snapshots']}, сегментов осталось: {len(segments)}")
+        assert journal.stats()['snapshots'] >= 1 and glob.glob(os.path.join(tmp, 'snapshot-*.snap'))
+        
+        store, journal = open_store(tmp)
+        assert len(store.get('s0').answers) == 100 and len(store.get('s1').answers) == 101
+        journal.close()
+
+def test_judge_job_events():
+    """Тестирование асинхронного ожидания событий проверки (ASGI маршруты)"""
+    print("\n" + "=" * 60)
+    print("🧪 Тестирование JudgeJob.await_events")
+    print("=" * 60)
+    
+    import asyncio
+    import threading
+    from judge_queue import JudgeJob
+    
+    job = JudgeJob('job', 'session', total_tests=3)
+    
+    def judge():
+        job.set_status('running')
+        for i in range(3):
+            time.sleep(0.05)
+            job.add_test_result(i, {'passed': True})
+        job.finish({'success': True, 'passed_tests': 3})
+    
+    async def follow(cursor=0):
+        events, finished = [], False
+        while not finished:
+            new, finished = await job.await_events(cursor, timeout=5)
+            cursor += len(new)
+            events += [event for event, _ in new]
+        return events
+    
+    async def main():
+        # Пустое ожидание завершается по таймауту, не блокируя цикл событий
+        started = time.time()
+        empty, finished = await job.await_events(0, timeout=0.1)
+        assert empty == [] and not finished and time.time() - started < 1
+        
+        # Несколько ожидающих в одном цикле событий, проверка в отдельном потоке
+        threading.Thread(target=judge).start()
+        return await asyncio.gather(follow(), follow())
+    
+    for events in asyncio.run(main()):
+        print(f"  События: {events}")
+        assert events == ['status', 'test', 'test', 'test', 'done']
+    assert job._listeners == []
+    
+    # Завершенное задание отвечает сразу
+    events, finished = asyncio.run(job.await_events(4, timeout=5))
+    assert finished and [event for event, _ in events] == ['done']
+    print("  ✅ Ожидающие разбужены, слушатели сняты")
+
+def test_judge_job_log():
+    """Тестирование общего журнала заданий проверки (несколько воркеров)"""
+    print("\n" + "=" * 60)
+    print("🧪 Тестирование SQLiteJobLog")
+    print("=" * 60)
+    
+    import os
+    import asyncio
+    import threading
+    import tempfile
+    from judge_queue import JudgeBusyError, JudgeQueue, SQLiteJobLog
+    
+    release = threading.Event()
+    
+    def handler(session_id, on_test_result=None, on_event=None):
+        for i in range(2):
+            on_test_result(i, {'passed': True, 'description': f'Тест {i}'})
+        release.wait(5)
+        return {'success': True, 'passed_tests': 2}, 200
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sessions.db')
+        # Две очереди с общей базой - как два воркера uvicorn
+        owner = JudgeQueue(handler, workers=1, log=SQLiteJobLog(path))
+        other = JudgeQueue(handler, workers=1, log=SQLiteJobLog(path))
+        
+        job = owner.submit('session_1', 2, 'session_1')
+        assert owner._next_cleanup > time.time()  # Очистка журнала - не чаще раза в job_ttl / 10
+        shared = other.get(job.job_id)
+        assert shared is not None and shared.job_id == job.job_id
+        
+        # Повторная отправка в другой воркер не запускает вторую проверку,
+        # другое решение во время проверки отклоняется
+        assert other.submit('session_1', 2, 'session_1').job_id == job.job_id
+        for queue in (owner, other):
+            try:
+                queue.submit('session_1', 2, 'другой код')
+                assert False, "Ожидалась JudgeBusyError"
+            except JudgeBusyError:
+                pass
+        
+        events, finished = shared.wait_events(0, timeout=5)
+        while len(events) < 3:
+            events, finished = shared.wait_events(0, timeout=5)
+        assert not finished and shared.to_dict()['completed_tests'] == 2
+        print(f"  Прогресс в другом воркере: {[event for event, _ in events]}")
+        
+        release.set()
+        events, finished = asyncio.run(shared.await_events(len(events), timeout=5))
+        while not finished:
+            events, finished = asyncio.run(shared.await_events(len(shared.events), timeout=5))
+        state = other.get(job.job_id).to_dict()
+        print(f"  Итог в другом воркере: {state['status']}, {state['result']}")
+        assert state['status'] == 'done' and state['result'] == job.result
+        assert state['status_code'] == 200
+        assert other.get('missing') is None
+    print("  ✅ Статус и события проверки доступны из любого воркера")
+
+def test_mock_llm_server():
+    """Тестирование локальной заглушки LLM через настоящий OpenAI клиент"""
+    print("\n" + "=" * 60)
+    print("🧪 Тестирование mock_llm_server")
+    print("=" * 60)
+    
+    import threading
+    from werkzeug.serving import make_server
+    
+    def serve(seed):
+        server = make_server('127.0.0.1', 0, mock_llm_server.create_app(seed=seed, latency='uniform:0:0.02'), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        gateway = LLMGateway(
+            base_url=f"http://127.0.0.1:{server.server_port}/v1", api_key="mock", model="mock",
+            concurrency={'evaluation': 4, 'task_generation': 2}, timeouts={'evaluation': 10, 'task_generation': 10},
+            max_retries=0
+        )
+        return server, gateway
+    
+    server, gateway = serve(seed=1)
+    try:
+        messages = [
+            {"role": "system", "content": "Оценщик. Формат: ОЦЕНКА, СИЛЬНЫЕ СТОРОНЫ, РЕКОМЕНДАЦИИ."},
+            {"role": "user", "content": "Вопрос: что такое GIL?"}
+        ]
+        evaluation = gateway.chat('evaluation', messages).choices[0].message.content
+        print(f"  Оценка: {evaluation.splitlines()[0]}")
+        assert evaluation.startswith("ОЦЕНКА: ") and "РЕКОМЕНДАЦИИ:" in evaluation
+        assert ''.join(gateway.stream('evaluation', messages)).startswith("ОЦЕНКА: ")
+        
+        # Задача из заглушки проходит проверку эталонным решением
+        generator = CodingTaskGenerator(gateway, validator=TaskValidator(CodeRunner()))
+        task = generator.generate_task("Backend разработчик", "Middle", "python", task_number=4)
+        print(f"  Задача: {task.title} ({task.task_id}), тестов: {len(task.test_cases)}")
+        assert not task.task_id.startswith('fallback_') and task.reference_solution
+        
+        # Детерминизм: тот же seed и та же последовательность запросов - те же ответы
+        other_server, other_gateway = serve(seed=1)
+        try:
+            # На первом сервере этот промпт уже был отправлен дважды (chat и stream)
+            replies = [other_gateway.chat('evaluation', messages).choices[0].message.content for _ in range(3)]
+            assert replies[0] == evaluation
+            assert replies[2] == gateway.chat('evaluation', messages).choices[0].message.content
+            print(f"  ✅ Ответы воспроизводимы")
+        finally:
+            other_server.shutdown()
+    finally:
+        server.shutdown()
 
 def test_code_analyzer():
     """Тестирование анализатора кода"""
@@ -249,6 +1426,22 @@ if __name__ == '__main__':
     
     try:
         test_code_runner()
+        test_result_cache()
+        test_sandbox_pool()
+        test_complexity_estimator()
+        test_task_pool()
+        test_task_bank()
+        test_task_validator()
+        test_llm_gateway()
+        test_circuit_breaker()
+        test_llm_cache()
+        test_content_store()
+        test_session_store()
+        test_session_retention()
+        test_session_journal()
+        test_judge_job_events()
+        test_judge_job_log()
+        test_mock_llm_server()
         test_code_analyzer()
         test_task_generation()
         result, analysis = test_full_workflow()